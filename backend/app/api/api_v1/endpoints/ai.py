@@ -1,35 +1,110 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import Dict, Any
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import Dict, Any, List, Optional, Awaitable, Tuple, TypeVar
+import asyncio
+import json
+import time
 import logging
 from app.core.ai_client import ai_client
-from app.schemas.ai import AIPlanRequest, AIPlanResponse, TravelRequirementsParseRequest, TravelRequirementsParseResponse
+from app.core.auth import get_optional_current_user
+from app.core.llm_gateway import LLMGatewayError, LLMRateLimitError
+from app.core.plan_cache import plan_cache
+from app.core.map_client import map_client
+from app.core.itinerary_optimizer import optimize_day
+from app.core.config import settings
+from app.schemas.ai import (
+    AIPlanRequest, AIPlanResponse, TravelRequirementsParseRequest, TravelRequirementsParseResponse,
+    OptimizePlanRequest, OptimizePlanResponse, OptimizedDay
+)
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# 修复路由路径：移除重复的/ai前缀
-@router.post("/plan", response_model=AIPlanResponse)
-async def generate_travel_plan(request: AIPlanRequest) -> AIPlanResponse:
-    """
-    生成AI旅行计划 - 使用真实的阿里云百炼API
-    """
+T = TypeVar("T")
+
+# 检查客户端是否断开连接的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 1.0
+
+def get_rate_limit_key(request: Request, current_user: Optional[dict]) -> str:
+    """AI并发限制的用户标识：已登录用户按用户ID，匿名请求按客户端IP"""
+    if current_user:
+        return f"user:{current_user['id']}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable[T]) -> T:
+    """执行AI调用，客户端断开连接时取消调用，释放用户并发名额"""
+    task = asyncio.ensure_future(awaitable)
     try:
-        # 构建用户输入
-        user_input = f"""
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=DISCONNECT_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"客户端已断开，取消AI请求: {request.url.path}")
+                raise HTTPException(status_code=499, detail="客户端已断开连接")
+    finally:
+        if not task.done():
+            task.cancel()
+
+def gateway_error_to_http(e: LLMGatewayError) -> HTTPException:
+    """将大模型网关异常转换为HTTP错误：并发超限429，超时504"""
+    if isinstance(e, LLMRateLimitError):
+        return HTTPException(status_code=429, detail=str(e))
+    return HTTPException(status_code=504, detail=str(e))
+
+def build_plan_input(request: AIPlanRequest) -> str:
+    """将规划请求拼接为发给大模型的用户输入"""
+    return f"""
 目的地：{request.destination}
 旅行天数：{request.duration}天
 预算：{request.budget}元
 同行人数：{request.travelers}人
 旅行偏好：{request.preferences}
 特殊需求：{request.special_requirements or '无'}
-        """.strip()
+    """.strip()
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """格式化一条Server-Sent Events消息"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+# 修复路由路径：移除重复的/ai前缀
+@router.post("/plan", response_model=AIPlanResponse)
+async def generate_travel_plan(
+    request: AIPlanRequest,
+    http_request: Request,
+    response: Response,
+    current_user: Optional[dict] = Depends(get_optional_current_user)
+) -> AIPlanResponse:
+    """
+    生成AI旅行计划 - 使用真实的阿里云百炼API
+    规范化后相同的请求直接返回缓存的计划，响应头X-Plan-Cache标明是否命中
+    """
+    try:
+        start_time = time.monotonic()
+        plan_result = await plan_cache.get(request) if plan_cache is not None else None
         
-        # 调用AI客户端生成旅行计划
-        plan_result = await ai_client.generate_travel_plan(user_input)
+        if plan_result is not None:
+            response.headers["X-Plan-Cache"] = "HIT"
+            logger.info(f"旅行计划缓存命中: {request.destination}, 耗时{(time.monotonic() - start_time) * 1000:.1f}ms")
+        else:
+            response.headers["X-Plan-Cache"] = "MISS"
+            
+            # 构建用户输入
+            user_input = build_plan_input(request)
+            
+            # 调用AI客户端生成旅行计划
+            plan_result = await run_until_disconnected(
+                http_request,
+                ai_client.generate_travel_plan(user_input, get_rate_limit_key(http_request, current_user))
+            )
+            
+            if plan_cache is not None:
+                await plan_cache.set(request, plan_result)
         
         return AIPlanResponse(
             itinerary=plan_result["itinerary"],
+            itinerary_days=plan_result.get("itinerary_days", []),
             budget_usage=plan_result["budget_usage"],
             recommendations=plan_result["recommendations"],
             weather_info=plan_result["weather_info"],
@@ -37,18 +112,74 @@ async def generate_travel_plan(request: AIPlanRequest) -> AIPlanResponse:
             error=plan_result.get("error")
         )
         
+    except HTTPException:
+        raise
+    except LLMGatewayError as e:
+        raise gateway_error_to_http(e)
     except Exception as e:
         logger.error(f"生成旅行计划失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"生成旅行计划失败: {str(e)}")
 
+@router.get("/plan/cache-stats")
+async def get_plan_cache_stats() -> Dict[str, Any]:
+    """
+    旅行计划缓存命中率统计（当前进程）
+    """
+    if plan_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **plan_cache.stats()}
+
+@router.post("/plan/stream")
+async def stream_travel_plan(
+    request: AIPlanRequest,
+    http_request: Request,
+    current_user: Optional[dict] = Depends(get_optional_current_user)
+) -> StreamingResponse:
+    """
+    流式生成AI旅行计划（Server-Sent Events）
+    - delta事件：模型实时生成的JSON片段
+    - day事件：某一天的完整行程（渲染文本及结构化数据）
+    - done事件：生成结束，附带完整的结构化行程（itinerary_days等）及首字延迟等指标
+    - error事件：生成失败
+    客户端断开连接时停止生成
+    """
+    user_input = build_plan_input(request)
+    user_key = get_rate_limit_key(http_request, current_user)
+    
+    async def event_source():
+        try:
+            async for event in ai_client.stream_travel_plan(user_input, user_key):
+                yield format_sse(event.pop("event"), event)
+        except LLMGatewayError as e:
+            http_error = gateway_error_to_http(e)
+            yield format_sse("error", {"status_code": http_error.status_code, "error": http_error.detail})
+        except Exception as e:
+            logger.error(f"流式生成旅行计划失败: {str(e)}")
+            yield format_sse("error", {"status_code": 500, "error": f"生成旅行计划失败: {str(e)}"})
+    
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        # 禁止代理缓冲，保证事件实时到达浏览器
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/recommendations")
-async def get_recommendations(destination: str, preferences: str = "") -> Dict[str, Any]:
+async def get_recommendations(
+    http_request: Request,
+    destination: str,
+    preferences: str = "",
+    current_user: Optional[dict] = Depends(get_optional_current_user)
+) -> Dict[str, Any]:
     """
     获取景点推荐
     """
     try:
         pref_list = [p.strip() for p in preferences.split(",")] if preferences else []
-        recommendations = await ai_client.get_poi_recommendations(destination, pref_list)
+        recommendations = await run_until_disconnected(
+            http_request,
+            ai_client.get_poi_recommendations(destination, pref_list, get_rate_limit_key(http_request, current_user))
+        )
         
         return {
             "destination": destination,
@@ -56,19 +187,68 @@ async def get_recommendations(destination: str, preferences: str = "") -> Dict[s
             "count": len(recommendations)
         }
         
+    except HTTPException:
+        raise
+    except LLMGatewayError as e:
+        raise gateway_error_to_http(e)
     except Exception as e:
         logger.error(f"获取推荐失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取推荐失败: {str(e)}")
 
-@router.post("/optimize")
-async def optimize_plan(plan_data: Dict[str, Any]) -> Dict[str, Any]:
+def optimize_days(
+    request: OptimizePlanRequest,
+    resolved: List[Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]]
+) -> List[OptimizedDay]:
+    """对已解析坐标的各天站点排序（CPU密集，在线程中执行），resolved为每天的(可排序站点, 无法解析的站点)"""
+    results = []
+    for day, (stops, unresolved) in zip(request.days, resolved):
+        if stops:
+            optimized = optimize_day(
+                stops,
+                start_location=day.start_location,
+                start_time=day.start_time,
+                speed_kmh=request.speed_kmh,
+                return_to_start=request.return_to_start
+            )
+        else:
+            optimized = {"stops": [], "total_distance_km": 0.0, "original_distance_km": 0.0, "late_count": 0}
+        results.append(OptimizedDay(day=day.day, unresolved=unresolved, **optimized))
+    return results
+
+@router.post("/optimize", response_model=OptimizePlanResponse)
+async def optimize_plan(request: OptimizePlanRequest) -> OptimizePlanResponse:
     """
-    优化旅行计划（待实现）
+    优化旅行计划 - 按天重排游览顺序
+    - 站点可以是坐标或地址，地址会并发解析为坐标
+    - 最近邻构造 + 2-opt/Or-opt改进，缩短当天总路程
+    - 尽量满足各站点的开门/关门时间，并给出每站的到达和离开时间
     """
-    return {
-        "message": "优化功能待实现",
-        "optimized_plan": plan_data
-    }
+    try:
+        semaphore = asyncio.Semaphore(settings.MAP_MATRIX_CONCURRENCY)
+        day_locations = await asyncio.gather(*[
+            map_client.resolve_locations([stop.model_dump() for stop in day.stops], semaphore)
+            for day in request.days
+        ])
+        
+        resolved = []
+        for day, locations in zip(request.days, day_locations):
+            stops, unresolved = [], []
+            for stop, location in zip(day.stops, locations):
+                if location:
+                    stops.append({**stop.model_dump(), "location": location})
+                else:
+                    unresolved.append(stop.model_dump())
+            resolved.append((stops, unresolved))
+        
+        start_time = time.perf_counter()
+        optimized_days = await asyncio.to_thread(optimize_days, request, resolved)
+        elapsed_ms = (time.perf_counter() - start_time) * 1000
+        
+        return OptimizePlanResponse(days=optimized_days, elapsed_ms=round(elapsed_ms, 2), status="success")
+        
+    except Exception as e:
+        logger.error(f"优化旅行计划失败: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"优化旅行计划失败: {str(e)}")
 
 @router.get("/weather/{location}")
 async def get_weather(location: str) -> Dict[str, Any]:
@@ -84,13 +264,20 @@ async def get_weather(location: str) -> Dict[str, Any]:
     }
 
 @router.post("/parse-requirements", response_model=TravelRequirementsParseResponse)
-async def parse_travel_requirements(request: TravelRequirementsParseRequest) -> TravelRequirementsParseResponse:
+async def parse_travel_requirements(
+    request: TravelRequirementsParseRequest,
+    http_request: Request,
+    current_user: Optional[dict] = Depends(get_optional_current_user)
+) -> TravelRequirementsParseResponse:
     """
     解析用户输入的旅行需求，提取目的地、天数、预算、同行人数
     """
     try:
         # 调用AI客户端解析旅行需求
-        parse_result = await ai_client.parse_travel_requirements(request.travel_requirements)
+        parse_result = await run_until_disconnected(
+            http_request,
+            ai_client.parse_travel_requirements(request.travel_requirements, get_rate_limit_key(http_request, current_user))
+        )
         
         if parse_result["status"] == "success":
             return TravelRequirementsParseResponse(
@@ -103,6 +290,10 @@ async def parse_travel_requirements(request: TravelRequirementsParseRequest) ->
         else:
             raise HTTPException(status_code=400, detail=parse_result.get("error", "解析旅行需求失败"))
             
+    except HTTPException:
+        raise
+    except LLMGatewayError as e:
+        raise gateway_error_to_http(e)
     except Exception as e:
         logger.error(f"解析旅行需求失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"解析旅行需求失败: {str(e)}")
\ No newline at end of file
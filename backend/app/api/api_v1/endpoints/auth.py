@@ -1,38 +1,52 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from datetime import timedelta
-from app.core.supabase_client import get_supabase_client
+import time
+import logging
+from typing import Any, Dict
+from app.core.supabase_client import get_supabase_client, AsyncSupabaseClient
+from app.core.identity_cache import identity_cache
 from app.core.auth import (
     create_access_token,
     get_current_user, ACCESS_TOKEN_EXPIRE_MINUTES,
-    verify_password, get_password_hash
+    verify_and_update_password, get_password_hash
 )
+from app.core.metrics import metrics
 from app.schemas.auth import UserCreate, UserLogin, UserResponse, Token
-from supabase import Client
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 登录各阶段耗时：db（查询用户）、password（密码校验，含线程池排队）、jwt，
+# 以及按结果区分的总耗时total_success/total_wrong_password/total_unknown_user/total_error
+login_phase_seconds = metrics.histogram(
+    "login_phase_seconds",
+    "登录各阶段耗时（秒）",
+    labelnames=("phase",)
+)
+
 @router.post("/register", response_model=Token)
-async def register(user_data: UserCreate, supabase: Client = Depends(get_supabase_client)):
+async def register(user_data: UserCreate, supabase: AsyncSupabaseClient = Depends(get_supabase_client)):
     try:
         # 检查用户名是否已存在
-        existing_user = supabase.table("users").select("*").eq("username", user_data.username).execute()
-        if existing_user.data:
+        existing_user = await supabase.users.get_by_username(user_data.username, "id")
+        if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already taken"
             )
         
         # 创建新用户（直接插入users表）
-        hashed_password = get_password_hash(user_data.password)
+        hashed_password = await get_password_hash(user_data.password)
         new_user = {
             "username": user_data.username,
             "password_hash": hashed_password,
             "is_active": True
         }
         
-        result = supabase.table("users").insert(new_user).execute()
+        created_user = await supabase.users.insert(new_user)
         
-        if not result.data:
+        if not created_user:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Failed to create user"
@@ -46,10 +60,10 @@ async def register(user_data: UserCreate, supabase: Client = Depends(get_supabas
         
         # 构建UserResponse
         user_response = UserResponse(
-            id=result.data[0]["id"],
-            username=result.data[0]["username"],
-            created_at=result.data[0].get("created_at"),
-            is_active=result.data[0].get("is_active", True)
+            id=created_user["id"],
+            username=created_user["username"],
+            created_at=created_user.get("created_at"),
+            is_active=created_user.get("is_active", True)
         )
         
         return {
@@ -64,41 +78,42 @@ async def register(user_data: UserCreate, supabase: Client = Depends(get_supabas
             detail=f"Registration failed: {error_msg}"
         )
 
-import time
-
 @router.post("/login", response_model=Token)
-async def login(user_data: UserLogin, supabase: Client = Depends(get_supabase_client)):
-    start_time = time.time()
+async def login(user_data: UserLogin, supabase: AsyncSupabaseClient = Depends(get_supabase_client)):
+    start_time = time.perf_counter()
+    outcome = "error"
     try:
-        # 记录数据库查询时间
-        db_start = time.time()
-        result = supabase.table("users").select("id,username,password_hash,created_at,is_active").eq("username", user_data.username).execute()
-        db_time = time.time() - db_start
+        with login_phase_seconds.time(phase="db"):
+            db_user = await supabase.users.get_by_username(user_data.username, "id,username,password_hash,created_at,is_active")
         
-        if not result.data:
+        if not db_user:
+            outcome = "unknown_user"
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="用户名不存在"
             )
         
-        db_user = result.data[0]
-        
-        # 密码验证时间
-        pwd_start = time.time()
-        if not verify_password(user_data.password, db_user["password_hash"]):
+        with login_phase_seconds.time(phase="password"):
+            valid, new_hash = await verify_and_update_password(user_data.password, db_user["password_hash"])
+        if not valid:
+            outcome = "wrong_password"
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="密码错误"
             )
-        pwd_time = time.time() - pwd_start
         
-        # JWT创建时间
-        jwt_start = time.time()
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user_data.username}, expires_delta=access_token_expires
-        )
-        jwt_time = time.time() - jwt_start
+        # 哈希参数已调整（或仍是bcrypt哈希），用新参数重新哈希并写回
+        if new_hash:
+            try:
+                await supabase.users.update(db_user["id"], {"password_hash": new_hash})
+            except Exception as e:
+                logger.warning(f"更新用户密码哈希失败: {str(e)}")
+        
+        with login_phase_seconds.time(phase="jwt"):
+            access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+            access_token = create_access_token(
+                data={"sub": user_data.username}, expires_delta=access_token_expires
+            )
         
         user_response = UserResponse(
             id=db_user["id"],
@@ -107,9 +122,7 @@ async def login(user_data: UserLogin, supabase: Client = Depends(get_supabase_cl
             is_active=db_user.get("is_active", True)
         )
         
-        total_time = time.time() - start_time
-        print(f"登录性能: 总时间={total_time:.3f}s, 数据库={db_time:.3f}s, 密码验证={pwd_time:.3f}s, JWT={jwt_time:.3f}s")
-        
+        outcome = "success"
         return {
             "access_token": access_token,
             "token_type": "bearer",
@@ -119,25 +132,28 @@ async def login(user_data: UserLogin, supabase: Client = Depends(get_supabase_cl
         # 重新抛出HTTP异常，保持原有错误信息
         raise
     except Exception as e:
-        total_time = time.time() - start_time
-        print(f"登录失败，耗时: {total_time:.3f}s")
         error_msg = str(e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"登录失败: {error_msg}"
         )
+    finally:
+        login_phase_seconds.observe(time.perf_counter() - start_time, phase=f"total_{outcome}")
 
 @router.post("/logout")
 async def logout(
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client)
 ):
     """
     用户登出接口
     """
     try:
+        # 清除身份缓存，下次请求重新校验用户
+        await identity_cache.invalidate(current_user['username'])
+        
         # 记录登出日志
-        print(f"用户 {current_user['username']} 已登出")
+        logger.info(f"用户 {current_user['username']} 已登出")
         
         return {
             "success": True,
@@ -145,14 +161,14 @@ async def logout(
         }
     except ConnectionResetError:
         # 处理连接重置错误，这是客户端问题，不影响服务端逻辑
-        print("客户端连接重置，但登出操作已完成")
+        logger.info("客户端连接重置，但登出操作已完成")
         return {
             "success": True,
             "message": "登出成功"
         }
     except Exception as e:
         # 其他异常处理
-        print(f"登出过程中发生异常: {str(e)}")
+        logger.warning(f"登出过程中发生异常: {str(e)}")
         return {
             "success": True,
             "message": "登出成功"
@@ -161,7 +177,7 @@ async def logout(
 @router.get("/me", response_model=UserResponse)
 async def get_current_user_info(
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client)
 ):
     """
     获取当前登录用户信息接口 - 优化版本
@@ -180,14 +196,12 @@ async def get_current_user_info(
             return user_response
         else:
             # 如果token中信息不完整，查询数据库获取最新信息
-            result = supabase.table("users").select("id,username,created_at,is_active").eq("username", current_user["username"]).execute()
-            if not result.data:
+            user_data = await supabase.users.get_by_username(current_user["username"], "id,username,created_at,is_active")
+            if not user_data:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail="用户不存在"
                 )
-            
-            user_data = result.data[0]
             user_response = UserResponse(
                 id=user_data["id"],
                 username=user_data["username"],
@@ -222,4 +236,11 @@ async def get_current_user_info(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"获取用户信息失败: {error_msg}"
-        )
\ No newline at end of file
+        )
+
+@router.get("/identity-cache-stats")
+async def get_identity_cache_stats() -> Dict[str, Any]:
+    """
+    身份缓存命中率统计（当前进程；使用Redis时为本进程对共享缓存的访问）
+    """
+    return identity_cache.stats()
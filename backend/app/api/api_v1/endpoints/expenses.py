@@ -1,33 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
 from typing import List, Optional
 from uuid import UUID
-from decimal import Decimal
 from datetime import date
 
-from app.core.supabase_client import get_supabase_client
-from app.core.auth import get_current_user
-from app.schemas.expense import ExpenseCreate, ExpenseUpdate, ExpenseResponse, ExpenseSummaryResponse
+from app.core.supabase_client import get_supabase_client, AsyncSupabaseClient
+from app.core.auth import get_current_user, verify_trip_owner
+from app.core.field_selection import parse_fields, select_columns, projected_response
+from app.core.conditional import (
+    rows_etag, last_modified, is_not_modified, not_modified_response, set_validators, validator_headers
+)
+from app.core.responses import adapter_response
+from app.schemas.expense import (
+    ExpenseCreate, ExpenseUpdate, ExpenseResponse, ExpenseSummaryResponse, expense_list_adapter
+)
 
 router = APIRouter()
 
-# 辅助函数：处理Decimal和UUID类型的序列化
-def serialize_fields(data_dict):
-    """将字典中的Decimal和UUID字段转换为JSON可序列化的类型"""
-    serialized = {}
-    for key, value in data_dict.items():
-        if isinstance(value, Decimal):
-            # 将Decimal转换为float
-            serialized[key] = float(value)
-        elif isinstance(value, UUID):
-            # 将UUID转换为字符串
-            serialized[key] = str(value)
-        elif isinstance(value, date):
-            # 将date转换为字符串
-            serialized[key] = value.isoformat()
-        else:
-            serialized[key] = value
-    return serialized
-
 # 辅助函数：解析日期字符串
 def parse_date(date_str: str) -> date:
     """将日期字符串解析为date对象"""
@@ -39,35 +27,36 @@ def parse_date(date_str: str) -> date:
             detail="日期格式无效，请使用YYYY-MM-DD格式"
         )
 
+# 辅助函数：将数据库聚合结果转换为统计响应
+def build_expense_summary(summary: dict) -> ExpenseSummaryResponse:
+    """数据库函数返回的金额为numeric，这里统一转换为保留2位小数的float"""
+    return ExpenseSummaryResponse(
+        total_amount=round(float(summary.get('total_amount') or 0), 2),  # 保留2位小数
+        expense_count=summary.get('expense_count') or 0,
+        min_amount=summary.get('min_amount'),
+        max_amount=summary.get('max_amount'),
+        by_day=summary.get('by_day') or [],
+        by_trip=summary.get('by_trip') or []
+    )
+
 # 1. 添加费用记录
 @router.post("/trips/{trip_id}/expenses", response_model=ExpenseResponse, status_code=status.HTTP_201_CREATED)
 async def create_expense(
     trip_id: UUID,
     expense_data: ExpenseCreate,
-    supabase = Depends(get_supabase_client),
-    current_user = Depends(get_current_user)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
+    current_user = Depends(verify_trip_owner)  # 验证旅行计划权限（只查询id并短时缓存）
 ):
     """添加费用记录"""
-    # 验证旅行计划权限
-    trip_response = supabase.table('trips').select('*').eq('id', str(trip_id)).eq('user_id', str(current_user['id'])).execute()
-    
-    if not trip_response.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="旅行计划不存在"
-        )
-    
     # 创建费用记录
-    expense_dict = expense_data.dict()
+    # mode="json"：Decimal、UUID、date转为字符串
+    expense_dict = expense_data.model_dump(mode="json")
     expense_dict['trip_id'] = str(trip_id)
     
-    # 序列化字段（处理Decimal和UUID）
-    expense_dict = serialize_fields(expense_dict)
+    created_expense = await supabase.expenses.insert(expense_dict)
     
-    response = supabase.table('expenses').insert(expense_dict).execute()
-    
-    if response.data:
-        return response.data[0]
+    if created_expense:
+        return created_expense
     else:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -78,65 +67,83 @@ async def create_expense(
 @router.get("/trips/{trip_id}/expenses", response_model=List[ExpenseResponse])
 async def get_expenses(
     trip_id: UUID,
+    request: Request,
     skip: int = 0,
     limit: int = 100,
     start_date: Optional[date] = None,
     end_date: Optional[date] = None,
-    supabase = Depends(get_supabase_client),
-    current_user = Depends(get_current_user)
+    fields: Optional[str] = Query(None, description="只返回指定字段，逗号分隔，如amount,expense_date"),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
+    current_user = Depends(verify_trip_owner)  # 验证旅行计划权限（只查询id并短时缓存）
 ):
-    """获取费用列表"""
-    # 验证旅行计划权限
-    trip_response = supabase.table('trips').select('*').eq('id', str(trip_id)).eq('user_id', str(current_user['id'])).execute()
-    
-    if not trip_response.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="旅行计划不存在"
-        )
-    
-    # 构建查询
-    query = supabase.table('expenses').select('*').eq('trip_id', str(trip_id))
-    
-    # 添加日期范围过滤
-    if start_date:
-        query = query.gte('expense_date', start_date.isoformat())
-    if end_date:
-        query = query.lte('expense_date', end_date.isoformat())
+    """获取费用列表，响应带ETag，If-None-Match与之相同时返回304"""
+    names = parse_fields(fields, ExpenseResponse.model_fields)
+    # 按日期范围过滤、分页并排序
+    expenses = await supabase.expenses.list_by_trip(
+        str(trip_id), skip, limit, start_date, end_date,
+        columns=select_columns(names, ['id', 'created_at', 'updated_at']) if names else "*"
+    )
     
-    # 添加分页和排序
-    response = query.order('expense_date', desc=True).range(skip, skip + limit - 1).execute()
+    # 删除费用记录不会改变最晚修改时间，列表只按ETag判断
+    etag = rows_etag(expenses, skip, limit, start_date, end_date, names)
+    modified = last_modified(expenses)
+    if is_not_modified(request, etag, use_modified_since=False):
+        return not_modified_response(etag, modified)
+    
+    if names:
+        projected = projected_response(expenses, names)
+        set_validators(projected, etag, modified)
+        return projected
+    return adapter_response(expense_list_adapter, expenses, headers=validator_headers(etag, modified))
+
+# 6. 获取特定旅行计划的总费用统计
+# 注意：必须在 /trips/{trip_id}/expenses/{expense_id} 之前注册，否则summary会被当作expense_id匹配
+@router.get("/trips/{trip_id}/expenses/summary", response_model=ExpenseSummaryResponse)
+async def get_trip_expense_summary(
+    trip_id: UUID,
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
+    current_user = Depends(verify_trip_owner)  # 验证旅行计划权限（只查询id并短时缓存）
+):
+    """获取特定旅行计划的总费用统计"""
+    # 在数据库端聚合（总额、笔数、最值、按天分组），一次往返获取
+    summary = await supabase.expenses.trip_summary(str(trip_id))
     
-    return response.data if response.data else []
+    return build_expense_summary(summary)
 
 # 3. 获取费用详情
 @router.get("/trips/{trip_id}/expenses/{expense_id}", response_model=ExpenseResponse)
 async def get_expense(
     trip_id: UUID,
     expense_id: UUID,
-    supabase = Depends(get_supabase_client),
-    current_user = Depends(get_current_user)
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description="只返回指定字段，逗号分隔"),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
+    current_user = Depends(verify_trip_owner)  # 验证旅行计划权限（只查询id并短时缓存）
 ):
-    """获取费用详情"""
-    # 验证旅行计划权限
-    trip_response = supabase.table('trips').select('*').eq('id', str(trip_id)).eq('user_id', str(current_user['id'])).execute()
-    
-    if not trip_response.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="旅行计划不存在"
-        )
-    
+    """获取费用详情，支持If-None-Match/If-Modified-Since条件请求"""
+    names = parse_fields(fields, ExpenseResponse.model_fields)
     # 获取费用记录
-    response = supabase.table('expenses').select('*').eq('id', str(expense_id)).eq('trip_id', str(trip_id)).execute()
+    columns = select_columns(names, ['id', 'created_at', 'updated_at']) if names else "*"
+    expense = await supabase.expenses.get(str(expense_id), str(trip_id), columns)
     
-    if not response.data:
+    if not expense:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="费用记录不存在"
         )
     
-    return response.data[0]
+    etag = rows_etag([expense], names)
+    modified = last_modified([expense])
+    if is_not_modified(request, etag, modified):
+        return not_modified_response(etag, modified)
+    
+    if names:
+        projected = projected_response(expense, names)
+        set_validators(projected, etag, modified)
+        return projected
+    set_validators(response, etag, modified)
+    return expense
 
 # 4. 更新费用记录
 @router.put("/trips/{trip_id}/expenses/{expense_id}", response_model=ExpenseResponse)
@@ -144,127 +151,49 @@ async def update_expense(
     trip_id: UUID,
     expense_id: UUID,
     expense_data: ExpenseUpdate,
-    supabase = Depends(get_supabase_client),
-    current_user = Depends(get_current_user)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
+    current_user = Depends(verify_trip_owner)  # 验证旅行计划权限（只查询id并短时缓存）
 ):
     """更新费用记录"""
-    # 验证旅行计划权限
-    trip_response = supabase.table('trips').select('*').eq('id', str(trip_id)).eq('user_id', str(current_user['id'])).execute()
+    # 更新字段（mode="json"：Decimal、UUID、date转为字符串）
+    update_data = expense_data.model_dump(mode="json", exclude_unset=True)
     
-    if not trip_response.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="旅行计划不存在"
-        )
-    
-    # 验证费用记录存在
-    expense_response = supabase.table('expenses').select('*').eq('id', str(expense_id)).eq('trip_id', str(trip_id)).execute()
+    # 更新条件中包含trip_id，费用记录不存在或不属于该旅行计划时不会更新任何行
+    updated_expense = await supabase.expenses.update(str(expense_id), str(trip_id), update_data)
     
-    if not expense_response.data:
+    if not updated_expense:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="费用记录不存在"
         )
     
-    # 更新字段
-    update_data = expense_data.dict(exclude_unset=True)
-    
-    # 序列化字段（处理Decimal和UUID）
-    update_data = serialize_fields(update_data)
-    
-    response = supabase.table('expenses').update(update_data).eq('id', str(expense_id)).execute()
-    
-    if response.data:
-        return response.data[0]
-    else:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="更新费用记录失败"
-        )
+    return updated_expense
 
 # 5. 删除费用记录
 @router.delete("/trips/{trip_id}/expenses/{expense_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_expense(
     trip_id: UUID,
     expense_id: UUID,
-    supabase = Depends(get_supabase_client),
-    current_user = Depends(get_current_user)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
+    current_user = Depends(verify_trip_owner)  # 验证旅行计划权限（只查询id并短时缓存）
 ):
     """删除费用记录"""
-    # 验证旅行计划权限
-    trip_response = supabase.table('trips').select('*').eq('id', str(trip_id)).eq('user_id', str(current_user['id'])).execute()
-    
-    if not trip_response.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="旅行计划不存在"
-        )
+    # 删除费用记录（条件中包含trip_id）
+    deleted = await supabase.expenses.delete(str(expense_id), str(trip_id))
     
-    # 验证费用记录存在
-    expense_response = supabase.table('expenses').select('*').eq('id', str(expense_id)).eq('trip_id', str(trip_id)).execute()
-    
-    if not expense_response.data:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="费用记录不存在"
         )
     
-    # 删除费用记录
-    response = supabase.table('expenses').delete().eq('id', str(expense_id)).execute()
-    
-    if not response.data:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="删除费用记录失败"
-        )
-    
     return None
 
-# 6. 获取特定旅行计划的总费用统计
-@router.get("/trips/{trip_id}/expenses/summary", response_model=ExpenseSummaryResponse)
-async def get_trip_expense_summary(
-    trip_id: UUID,
-    supabase = Depends(get_supabase_client),
-    current_user = Depends(get_current_user)
-):
-    """获取特定旅行计划的总费用统计"""
-    # 验证旅行计划权限
-    trip_response = supabase.table('trips').select('*').eq('id', str(trip_id)).eq('user_id', str(current_user['id'])).execute()
-    
-    if not trip_response.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="旅行计划不存在"
-        )
-    
-    # 获取该旅行计划的所有费用记录
-    expenses_response = supabase.table('expenses').select('amount').eq('trip_id', str(trip_id)).execute()
-    
-    # 计算总金额和记录数量
-    total_amount = 0.0
-    expense_count = 0
-    
-    if expenses_response.data:
-        expense_count = len(expenses_response.data)
-        # 安全地计算总金额，处理可能的None值
-        for expense in expenses_response.data:
-            if expense.get('amount') is not None:
-                try:
-                    total_amount += float(expense['amount'])
-                except (ValueError, TypeError):
-                    # 如果金额转换失败，跳过该记录
-                    continue
-    
-    return ExpenseSummaryResponse(
-        total_amount=round(total_amount, 2),  # 保留2位小数
-        expense_count=expense_count
-    )
-
 # 7. 获取用户所有旅行计划的总费用统计
 @router.get("/users/{user_id}/expenses/summary", response_model=ExpenseSummaryResponse)
 async def get_user_expense_summary(
     user_id: UUID,
-    supabase = Depends(get_supabase_client),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
     current_user = Depends(get_current_user)
 ):
     """获取用户所有旅行计划的总费用统计"""
@@ -275,40 +204,7 @@ async def get_user_expense_summary(
             detail="无权访问其他用户的数据"
         )
     
-    # 获取用户的所有旅行计划
-    trips_response = supabase.table('trips').select('id').eq('user_id', str(user_id)).execute()
-    
-    if not trips_response.data:
-        # 如果用户没有旅行计划，返回默认值
-        return ExpenseSummaryResponse(total_amount=0.0, expense_count=0)
+    # 在数据库端关联trips和expenses聚合，不再分批拉取费用记录
+    summary = await supabase.expenses.user_summary(str(user_id))
     
-    # 获取所有旅行计划的费用记录
-    trip_ids = [str(trip['id']) for trip in trips_response.data]
-    
-    # 由于Supabase的IN查询限制，我们分批查询
-    total_amount = 0.0
-    expense_count = 0
-    
-    # 每次处理最多10个trip_id
-    batch_size = 10
-    for i in range(0, len(trip_ids), batch_size):
-        batch_trip_ids = trip_ids[i:i + batch_size]
-        
-        # 构建IN查询
-        expenses_response = supabase.table('expenses').select('amount').in_('trip_id', batch_trip_ids).execute()
-        
-        if expenses_response.data:
-            expense_count += len(expenses_response.data)
-            # 安全地计算总金额，处理可能的None值
-            for expense in expenses_response.data:
-                if expense.get('amount') is not None:
-                    try:
-                        total_amount += float(expense['amount'])
-                    except (ValueError, TypeError):
-                        # 如果金额转换失败，跳过该记录
-                        continue
-    
-    return ExpenseSummaryResponse(
-        total_amount=round(total_amount, 2),  # 保留2位小数
-        expense_count=expense_count
-    )
\ No newline at end of file
+    return build_expense_summary(summary)
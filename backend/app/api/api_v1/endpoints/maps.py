@@ -1,6 +1,11 @@
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from typing import Optional, Dict, Any
 from app.core.map_client import map_client
+from app.core.geocode_cache import geocode_cache
+from app.core.static_map_cache import static_map_cache
+from app.core.config import settings
+from app.core.conditional import is_not_modified
+from app.schemas.map import RouteMatrixRequest, RouteMatrixResponse
 
 router = APIRouter()
 
@@ -71,6 +76,31 @@ async def route_planning(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
 
+@router.post("/route-matrix")
+async def route_matrix(request: RouteMatrixRequest) -> Dict[str, Any]:
+    """
+    路线矩阵接口
+    - 一次计算行程中多个站点两两之间的距离和时间
+    - 站点可以是坐标或地址，地址会并发解析为坐标
+    - 无法解析的站点在矩阵中对应的行列为null
+    """
+    try:
+        result = await map_client.route_matrix(
+            [stop.model_dump() for stop in request.stops],
+            request.type
+        )
+        if result.get("status") == "success":
+            return {
+                "success": True,
+                "data": RouteMatrixResponse(**result)
+            }
+        else:
+            raise HTTPException(status_code=400, detail=result.get("message", "路线矩阵计算失败"))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
+
 @router.get("/poi")
 async def search_poi(
     keywords: str = Query(..., description="搜索关键词"),
@@ -99,6 +129,7 @@ async def search_poi(
 
 @router.get("/static-map")
 async def get_static_map(
+    request: Request,
     location: str = Query(..., description="中心点坐标，格式：经度,纬度"),
     zoom: int = Query(15, description="缩放级别，1-18，默认15"),
     size: str = Query("400*300", description="图片尺寸，格式：宽*高"),
@@ -109,13 +140,66 @@ async def get_static_map(
     静态地图接口
     - 生成地图图片
     - 支持标记点和标签
-    - 注意：返回的是图片URL，适合生成地图快照
+    - 注意：返回的是图片URL，适合生成地图快照；URL在本地拼接，不请求高德
+    - 启用图片代理时额外返回proxy_url，由后端缓存并返回图片内容
     """
     try:
         result = await map_client.static_map(location, zoom, size, markers, labels)
+        if static_map_cache is not None and result.get("status") == "success":
+            params = map_client.static_map_params(location, zoom, size, markers, labels)
+            result["proxy_url"] = str(request.url_for("get_static_map_image").include_query_params(**params))
         return {
             "success": True,
             "data": result
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
+
+@router.get("/static-map/image")
+async def get_static_map_image(
+    request: Request,
+    location: str = Query(..., description="中心点坐标，格式：经度,纬度"),
+    zoom: int = Query(15, description="缩放级别，1-18，默认15"),
+    size: str = Query("400*300", description="图片尺寸，格式：宽*高"),
+    markers: str = Query(None, description="标记点，格式：经度,纬度,标记样式"),
+    labels: str = Query(None, description="标签，格式：经度,纬度,标签内容")
+) -> Response:
+    """
+    静态地图图片代理接口（需启用STATIC_MAP_PROXY_ENABLED）
+    - 返回图片内容，按内容寻址缓存在服务器磁盘上
+    - ETag为图片内容哈希，携带If-None-Match且未变化时返回304
+    """
+    if static_map_cache is None:
+        raise HTTPException(status_code=404, detail="静态地图图片代理未启用")
+    
+    try:
+        params = map_client.static_map_params(location, zoom, size, markers, labels)
+        key = static_map_cache.request_key(params)
+        
+        cached = await static_map_cache.get(key)
+        if cached is not None:
+            etag, content_type, content = cached
+        else:
+            content, content_type = await map_client.fetch_static_map_image(params)
+            etag = await static_map_cache.set(key, content, content_type)
+        
+        headers = {
+            "ETag": f'"{etag}"',
+            "Cache-Control": f"public, max-age={settings.STATIC_MAP_CACHE_TTL}"
+        }
+        if is_not_modified(request, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        return Response(content=content, media_type=content_type, headers=headers)
+    except ValueError as e:
+        raise HTTPException(status_code=502, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
+
+@router.get("/cache-stats")
+async def get_geocode_cache_stats() -> Dict[str, Any]:
+    """
+    地理编码缓存命中率统计（当前进程）
+    """
+    if geocode_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **geocode_cache.stats()}
@@ -1,75 +1,101 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, WebSocket, WebSocketDisconnect, Request
 from fastapi.responses import StreamingResponse
+from starlette.datastructures import UploadFile as StarletteUploadFile
 import json
+import uuid
 import asyncio
-from typing import AsyncGenerator
+import logging
+from typing import Any, AsyncGenerator, Dict, Literal
+from app.core.config import settings
 from app.core.speech_client import speech_client
+from app.core.speech_session import speech_sessions, AudioQueue, SpeechSessionLimitError
+from app.core.transcript import dumps
+from app.core.audio import PCMStream, AudioFormatError, pace_frames
+from app.core.logging_config import log_sampling
 from app.core.auth import get_current_user
 from app.schemas.speech import SpeechRecognitionResponse, RealTimeTranscriptionResponse
-import wave
-import io
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+# 按Content-Length预先拒绝上传时，为multipart边界和WAV头留出的余量
+UPLOAD_OVERHEAD_BYTES = 64 * 1024
+
+def _diff_message(result: Dict[str, Any]) -> Dict[str, Any]:
+    """增量消息：type为0时text是确定的句子（追加到已确定文本），为1时text替换当前句子的中间结果"""
+    if result.get("done"):
+        return {"success": True, "done": True}
+    return {
+        "success": True,
+        "seg_id": result["seg_id"],
+        "type": 0 if result["is_final"] else 1,
+        "text": result["text"]
+    }
+
 @router.websocket("/transcribe")
-async def transcribe_realtime(websocket: WebSocket):
+async def transcribe_realtime(websocket: WebSocket, mode: Literal["full", "diff"] = "full"):
     """
     实时语音转录接口 - 真实科大讯飞API调用
     - 使用WebSocket进行实时音频流传输
-    - 实时返回转录结果
+    - 实时返回转录结果：默认（mode=full）每条消息的transcript为完整文本，转写结束时is_final为true；
+      mode=diff时只推送变化的片段（见_diff_message），结束时推送{"success": true, "done": true}
+    - 会话数超过SPEECH_MAX_SESSIONS时返回错误并以1013（稍后重试）关闭连接
     """
     await websocket.accept()
+    # 会话日志：逐块日志为DEBUG级别，按会话抽样输出
+    log = log_sampling.session_logger(logger, uuid.uuid4().hex[:8])
     
     try:
-        # 使用事件来控制音频流生成
-        stream_active = True
-        
-        # 接收音频数据流 - 修复连接断开后的处理
-        async def audio_stream_generator():
-            nonlocal stream_active
-            try:
-                # 实时接收音频数据，而不是一次性接收完整音频
-                while stream_active:
-                    try:
-                        # 接收音频数据块，设置较短的超时时间
-                        message = await asyncio.wait_for(websocket.receive(), timeout=0.5)
-                        
-                        if message["type"] == "websocket.receive":
-                            if "bytes" in message:
-                                audio_chunk = message["bytes"]
-                                if len(audio_chunk) > 0:
-                                    print(f"接收到实时音频块，大小: {len(audio_chunk)} bytes")
-                                    yield audio_chunk
-                            elif "text" in message:
-                                # 处理文本消息（如结束标记）
-                                text_data = message["text"]
-                                if text_data == "end":
-                                    print("收到结束标记")
-                                    stream_active = False
-                                    break
-                    
-                    except asyncio.TimeoutError:
-                        # 超时继续等待，不中断循环
-                        continue
-                    except WebSocketDisconnect:
-                        print("客户端断开连接")
-                        stream_active = False
-                        break
-                    except Exception as e:
-                        print(f"音频流接收错误: {e}")
-                        stream_active = False
-                        break
-                        
-            except Exception as e:
-                print(f"音频流生成错误: {e}")
-                raise
-        
+        async with speech_sessions.session():
+            await _bridge_transcription(websocket, log, mode)
+        try:
+            await websocket.close()
+        except:
+            pass  # 客户端已经断开
+    except SpeechSessionLimitError as e:
+        log.warning(str(e))
+        try:
+            await websocket.send_text(dumps({"success": False, "error": str(e)}))
+            await websocket.close(code=1013)
+        except:
+            pass  # 连接可能已经断开
+
+async def _bridge_transcription(websocket: WebSocket, log, mode: str):
+    """浏览器WebSocket与科大讯飞之间的事件驱动桥接
+
+    - 接收任务：阻塞等待浏览器消息（不轮询），音频放入有界队列；队列满时暂停读取，形成背压
+    - 转写：从队列取音频，整理为固定大小的帧发送给科大讯飞，识别结果到达后立即转发给浏览器
+    """
+    audio_queue = AudioQueue(settings.SPEECH_QUEUE_MAX_CHUNKS)
+    
+    async def receive_audio():
+        try:
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    log.info("客户端断开连接")
+                    break
+                
+                audio_chunk = message.get("bytes")
+                if audio_chunk:
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("接收到实时音频块，大小: %d bytes", len(audio_chunk))
+                    await audio_queue.put(audio_chunk)
+                elif message.get("text") == "end":
+                    # 处理文本消息（结束标记）
+                    log.debug("收到结束标记")
+                    break
+            await audio_queue.close()
+        except Exception as e:
+            log.warning(f"音频流接收错误: {e}")
+            audio_queue.close_nowait()
+    
+    receive_task = asyncio.create_task(receive_audio())
+    try:
         # 调用科大讯飞实时转录（真实API）
-        transcription_generator = speech_client.transcribe_realtime(audio_stream_generator())
-        
-        # 正确处理异步生成器
-        async for result in transcription_generator:
-            print(f"收到转录结果: {result}")
+        async for result in speech_client.transcribe_realtime(audio_queue, log):
+            log.debug("收到转录结果: %s", result)
             
             if not result["success"]:
                 # 发送错误信息
@@ -78,39 +104,149 @@ async def transcribe_realtime(websocket: WebSocket):
                     "error": result["error"]
                 }
                 try:
-                    await websocket.send_text(json.dumps(error_response))
+                    await websocket.send_text(dumps(error_response))
                 except:
                     pass  # 连接可能已经断开
                 break
             
             # 发送转录结果
-            response = {
-                "success": True,
-                "transcript": result["transcript"],
-                "is_final": result.get("is_final", False),
-                "confidence": result["confidence"]
-            }
+            if mode == "diff":
+                response = _diff_message(result)
+            else:
+                response = {
+                    "success": True,
+                    "transcript": result["transcript"],
+                    "is_final": result.get("done", False),
+                    "confidence": result["confidence"]
+                }
             try:
-                await websocket.send_text(json.dumps(response))
+                await websocket.send_text(dumps(response))
             except:
-                print("发送转录结果失败，连接可能已断开")
+                log.info("发送转录结果失败，连接可能已断开")
                 break
             
-            # 如果是最终结果，结束连接
-            if result.get("is_final", False) and result.get("transcript", "").strip() != "":
-                print("收到最终结果，结束连接")
+            # 转写结束（科大讯飞返回结束响应），结束连接
+            if result.get("done"):
+                log.debug("转写结束，结束连接")
                 break
                 
     except WebSocketDisconnect:
-        print("WebSocket连接断开")
-        pass
+        log.info("WebSocket连接断开")
     except Exception as e:
-        print(f"实时转录异常: {e}")
+        log.exception(f"实时转录异常: {e}")
         error_result = {
             "success": False,
             "error": f"实时转录异常: {str(e)}"
         }
         try:
-            await websocket.send_text(json.dumps(error_result))
+            await websocket.send_text(dumps(error_result))
         except:
-            pass  # 连接可能已经断开
\ No newline at end of file
+            pass  # 连接可能已经断开
+    finally:
+        if audio_queue.blocked:
+            log.info(f"音频队列已满等待{audio_queue.blocked}次（上游发送跟不上）")
+        receive_task.cancel()
+
+async def _upload_source(request: Request) -> AsyncGenerator[bytes, None]:
+    """上传内容的字节流：multipart表单读取file字段（框架已写入临时文件），其他类型直接读取请求体（支持分块传输）"""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("multipart/form-data"):
+        form = await request.form()
+        upload = form.get("file")
+        if not isinstance(upload, StarletteUploadFile):
+            raise HTTPException(status_code=400, detail="缺少音频文件（file字段）")
+        try:
+            while True:
+                chunk = await upload.read(64 * 1024)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            await form.close()
+    else:
+        async for chunk in request.stream():
+            yield chunk
+
+@router.post("/transcribe-file", response_model=SpeechRecognitionResponse)
+async def transcribe_file(request: Request, current_user = Depends(get_current_user)):
+    """
+    上传音频文件转写（用于离线录制的语音记账等）
+    - 支持16kHz、16bit、单声道的WAV或裸PCM，可以multipart表单（file字段）或直接作为请求体上传
+    - 边接收边转写，不在内存中缓冲整个文件；按实时速度的SPEECH_FILE_SPEEDUP倍发送给科大讯飞
+    - 与实时转写共用会话上限
+    - 超过SPEECH_FILE_MAX_BYTES时返回413：声明了Content-Length的不连接科大讯飞，分块上传超限时立即中止转写
+    - multipart表单上传必须带Content-Length（否则返回411），分块上传只支持直接以请求体发送
+    """
+    too_large = HTTPException(status_code=413, detail=f"音频文件超过大小上限（{settings.SPEECH_FILE_MAX_BYTES}字节）")
+    # 声明了大小的上传在读取请求体、连接科大讯飞之前拒绝；分块上传在超过上限时中止转写
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > settings.SPEECH_FILE_MAX_BYTES + UPLOAD_OVERHEAD_BYTES:
+        raise too_large
+    # multipart表单由框架完整写入临时文件后才能读取，不限制大小，必须声明Content-Length
+    if not content_length.isdigit() and request.headers.get("content-type", "").startswith("multipart/form-data"):
+        raise HTTPException(status_code=411, detail="multipart上传需要Content-Length，分块上传请直接以请求体发送音频")
+
+    log = log_sampling.session_logger(logger, uuid.uuid4().hex[:8])
+    try:
+        pcm = await PCMStream(_upload_source(request), settings.SPEECH_FILE_MAX_BYTES).open()
+    except AudioFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if pcm.empty:
+        raise HTTPException(status_code=400, detail="音频内容为空")
+
+    transcript = ""
+    error = None
+
+    async def run():
+        nonlocal transcript, error
+        frames = pace_frames(pcm, settings.SPEECH_FRAME_BYTES, settings.SPEECH_FILE_SPEEDUP)
+        async for result in speech_client.transcribe_realtime(frames, log):
+            if not result["success"]:
+                error = result["error"]
+                break
+            transcript = result["transcript"]
+
+    try:
+        async with speech_sessions.session():
+            run_task = asyncio.create_task(run())
+            overflow_task = asyncio.create_task(pcm.overflow.wait())
+            try:
+                done, _ = await asyncio.wait(
+                    {run_task, overflow_task},
+                    timeout=settings.SPEECH_FILE_TIMEOUT,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                # 超过上限、超时或客户端断开时关闭科大讯飞连接，等待清理完成后再释放会话
+                run_task.cancel()
+                overflow_task.cancel()
+                await asyncio.gather(run_task, overflow_task, return_exceptions=True)
+            if not done:
+                raise asyncio.TimeoutError()
+            if run_task in done:
+                run_task.result()
+    except SpeechSessionLimitError as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "5"})
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="语音转写超时")
+
+    if pcm.truncated:
+        raise too_large
+    if error:
+        raise HTTPException(status_code=502, detail=error)
+
+    log.info(f"文件转写完成: 用户{current_user['username']}，音频{pcm.duration:.1f}秒")
+    return SpeechRecognitionResponse(
+        success=True,
+        transcript=transcript,
+        confidence=0.9,
+        language="zh_cn",
+        duration=round(pcm.duration, 2)
+    )
+
+@router.get("/session-stats")
+async def get_speech_session_stats() -> Dict[str, Any]:
+    """
+    实时语音会话统计（当前进程）
+    """
+    return speech_sessions.stats()
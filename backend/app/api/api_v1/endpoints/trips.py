@@ -1,33 +1,64 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, Path, Query, Request, Response, status
+from typing import List, Optional, Tuple
 from uuid import UUID
-from app.core.supabase_client import get_supabase_client
-from app.core.auth import get_current_user
-from app.schemas.trip import TripCreate, TripResponse, TripUpdate, TripBriefResponse
-from decimal import Decimal
+from app.core.supabase_client import get_supabase_client, AsyncSupabaseClient
+from app.core.auth import get_current_user, verify_trip_owner, forget_trip_owner
+from app.core.itinerary_parser import render_itinerary_text
+from app.core.field_selection import parse_fields, select_columns, projected_response
+from app.core.plan_codec import plan_codec
+from app.core.conditional import (
+    rows_etag, last_modified, is_not_modified,
+    validator_headers, not_modified_response, set_validators
+)
+from app.core.responses import adapter_response
+from app.schemas.trip import (
+    TripCreate, TripResponse, TripUpdate, TripBriefResponse, ItineraryDay,
+    trip_brief_list_adapter, itinerary_days_adapter
+)
 from pydantic import BaseModel, Field
+import base64
+import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# 辅助函数：处理Decimal和UUID类型的序列化
-def serialize_fields(data_dict):
-    """将字典中的Decimal和UUID字段转换为JSON可序列化的类型"""
-    serialized = {}
-    for key, value in data_dict.items():
-        if isinstance(value, Decimal):
-            # 将Decimal转换为float
-            serialized[key] = float(value)
-        elif isinstance(value, UUID):
-            # 将UUID转换为字符串
-            serialized[key] = str(value)
-        else:
-            serialized[key] = value
-    return serialized
+# 辅助函数：键集分页游标的编码与解析
+def encode_cursor(trip: dict) -> str:
+    """将一行旅行计划的(created_at, id)编码为分页游标"""
+    raw = json.dumps([str(trip['created_at']), str(trip['id'])])
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """解析分页游标为(created_at, id)"""
+    try:
+        created_at, trip_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(created_at), str(UUID(trip_id))
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="分页游标无效"
+        )
+
+# 辅助函数：校验结构化行程并转为写入数据库函数的参数
+def prepare_itinerary(days: List[ItineraryDay]) -> List[dict]:
+    """天数不能重复（trip_days上有(trip_id, day)唯一约束），按天排序后序列化"""
+    numbers = [day.day for day in days]
+    if len(numbers) != len(set(numbers)):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="结构化行程中存在重复的天数"
+        )
+    return [day.model_dump(mode="json") for day in sorted(days, key=lambda day: day.day)]
 
 # 旅行计划总预算统计响应模型
 class TripBudgetSummaryResponse(BaseModel):
     total_budget: float = Field(..., description="总预算")
     trip_count: int = Field(..., description="旅行计划数量")
+    budget_trip_count: int = Field(0, description="有预算的旅行计划数量")
+    min_budget: Optional[float] = Field(None, description="最小预算")
+    max_budget: Optional[float] = Field(None, description="最大预算")
 
     class Config:
         from_attributes = True
@@ -45,143 +76,260 @@ class TotalBudgetSummaryResponse(BaseModel):
 @router.post("/trips", response_model=TripResponse, status_code=status.HTTP_201_CREATED)
 async def create_trip(
     trip_data: TripCreate,
-    supabase = Depends(get_supabase_client),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
     current_user = Depends(get_current_user)
 ):
     """创建旅行计划"""
-    # 创建旅行计划 - 使用Supabase插入数据
-    trip_dict = trip_data.dict()
+    # 创建旅行计划 - 使用Supabase插入数据（mode="json"：Decimal、UUID转为字符串）
+    trip_dict = trip_data.model_dump(mode="json", exclude={'itinerary_days'})
     trip_dict['user_id'] = str(current_user['id'])
     
-    # 序列化字段（处理Decimal和UUID）
-    trip_dict = serialize_fields(trip_dict)
+    # 只提供结构化行程时，生成plan文本供只读取plan的客户端使用
+    itinerary = prepare_itinerary(trip_data.itinerary_days) if trip_data.itinerary_days else None
+    if itinerary and not trip_dict.get('plan'):
+        trip_dict['plan'] = render_itinerary_text(trip_data.itinerary_days)
     
-    response = supabase.table('trips').insert(trip_dict).execute()
+    # 行程文本压缩存储
+    plan = trip_dict.get('plan')
+    trip_dict['plan'] = plan_codec.encode(plan)
     
-    if response.data:
-        return response.data[0]
-    else:
+    created_trip = await supabase.trips.insert(trip_dict)
+    
+    if not created_trip:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="创建旅行计划失败"
         )
+    
+    if itinerary:
+        try:
+            await supabase.trip_itineraries.save(str(created_trip['id']), itinerary)
+        except Exception as e:
+            # 行程写入失败时删除刚创建的旅行计划，避免客户端重试时产生重复的计划
+            logger.error(f"保存结构化行程失败: {str(e)}")
+            await supabase.trips.delete(str(created_trip['id']), str(current_user['id']))
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="创建旅行计划失败"
+            )
+    
+    # 直接返回写入前的原文，不需要再解压
+    created_trip['plan'] = plan
+    return created_trip
 
 @router.get("/trips", response_model=List[TripBriefResponse])
 async def get_trips(
-    skip: int = 0,
-    limit: int = 100,
-    supabase = Depends(get_supabase_client),
+    request: Request,
+    limit: int = Query(100, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="上一页响应头X-Next-Cursor返回的游标"),
+    fields: Optional[str] = Query(None, description="只返回指定字段，逗号分隔，如id,title,destination"),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
     current_user = Depends(get_current_user)
 ):
-    """获取用户的所有旅行计划（简要信息）"""
-    # 获取旅行计划数据，同时关联用户偏好表获取偏好名称
-    response = supabase.table('trips').select(
-        'id, title, destination, budget, travelers_count, days, preference_id, created_at'
-    ).eq('user_id', str(current_user['id'])).range(skip, skip + limit - 1).execute()
-    
-    if not response.data:
-        return []
-    
-    # 处理每个旅行计划，获取偏好名称
-    trips_with_preference_names = []
-    for trip in response.data:
-        trip_with_preference = dict(trip)
-        
-        # 如果有preference_id，获取偏好名称
-        if trip.get('preference_id'):
-            pref_response = supabase.table('user_preferences').select('name').eq('id', str(trip['preference_id'])).execute()
-            if pref_response.data:
-                trip_with_preference['preference_name'] = pref_response.data[0]['name']
-            else:
-                trip_with_preference['preference_name'] = None
-        else:
-            trip_with_preference['preference_name'] = None
-        
-        trips_with_preference_names.append(trip_with_preference)
-    
-    return trips_with_preference_names
+    """获取用户的所有旅行计划（简要信息），按创建时间倒序键集分页
+
+    响应带ETag，请求头If-None-Match与之相同时返回304（不序列化响应体）。
+    """
+    after = decode_cursor(cursor) if cursor else None
+    names = parse_fields(fields, TripBriefResponse.model_fields)
+    
+    columns = None
+    if names:
+        # preference_name不是trips的列，由preference_id查询得到；created_at和id用于生成分页游标，updated_at用于生成ETag
+        required = ['id', 'created_at', 'updated_at'] + (['preference_id'] if 'preference_name' in names else [])
+        columns = select_columns([name for name in names if name != 'preference_name'], required)
+    trips = await supabase.trips.list_brief(str(current_user['id']), limit, after, columns)
+    
+    headers = {}
+    # 本页已满时返回下一页游标
+    if trips and len(trips) == limit:
+        headers['X-Next-Cursor'] = encode_cursor(trips[-1])
+    
+    preference_names = {}
+    if not names or 'preference_name' in names:
+        # 一次批量查询获取本页所有偏好名称，查询次数与旅行计划数量无关
+        preference_ids = list({str(trip['preference_id']) for trip in trips if trip.get('preference_id')})
+        preference_names = await supabase.user_preferences.get_names(preference_ids)
+    
+    # 偏好名称也在响应中，偏好改名后ETag随之变化；删除旅行计划不会改变最晚修改时间，列表只按ETag判断
+    etag = rows_etag(trips, limit, cursor, names, sorted(preference_names.items()))
+    headers.update(validator_headers(etag, last_modified(trips)))
+    if is_not_modified(request, etag, use_modified_since=False):
+        not_modified = not_modified_response(etag)
+        not_modified.headers.update(headers)
+        return not_modified
+    
+    if not names or 'preference_name' in names:
+        trips_with_preference_names = []
+        for trip in trips:
+            trip_with_preference = dict(trip)
+            preference_id = trip.get('preference_id')
+            trip_with_preference['preference_name'] = preference_names.get(str(preference_id)) if preference_id else None
+            trips_with_preference_names.append(trip_with_preference)
+        trips = trips_with_preference_names
+    
+    if names:
+        projected = projected_response(trips, names)
+        projected.headers.update(headers)
+        return projected
+    
+    return adapter_response(trip_brief_list_adapter, trips, headers=headers)
 
 @router.get("/trips/{trip_id}", response_model=TripResponse)
 async def get_trip(
     trip_id: UUID,
-    supabase = Depends(get_supabase_client),
+    request: Request,
+    response: Response,
+    fields: Optional[str] = Query(None, description="只返回指定字段，逗号分隔，如title,destination,days（不含plan时不读取行程文本）"),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
     current_user = Depends(get_current_user)
 ):
-    """获取特定旅行计划详情"""
-    response = supabase.table('trips').select('*').eq('id', str(trip_id)).eq('user_id', str(current_user['id'])).execute()
+    """获取特定旅行计划详情
+
+    响应带ETag和Last-Modified，支持If-None-Match/If-Modified-Since条件请求，未修改时返回304（不解压行程）。
+    """
+    names = parse_fields(fields, TripResponse.model_fields)
+    columns = select_columns(names, ['id', 'created_at', 'updated_at']) if names else "*"
+    trip = await supabase.trips.get(str(trip_id), str(current_user['id']), columns)
     
-    if not response.data:
+    if not trip:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="旅行计划不存在"
         )
     
-    return response.data[0]
+    etag = rows_etag([trip], names)
+    modified = last_modified([trip])
+    if is_not_modified(request, etag, modified):
+        return not_modified_response(etag, modified)
+    
+    # 只在查询了plan时解压
+    plan_codec.decode_row(trip)
+    
+    if names:
+        projected = projected_response(trip, names)
+        set_validators(projected, etag, modified)
+        return projected
+    set_validators(response, etag, modified)
+    return trip
+
+@router.get("/trips/{trip_id}/plan/days", response_model=List[ItineraryDay])
+async def get_trip_itinerary(
+    trip_id: UUID,
+    first: Optional[int] = Query(None, alias="from", ge=1, description="起始天（含）"),
+    last: Optional[int] = Query(None, alias="to", ge=1, description="结束天（含）"),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
+    current_user = Depends(verify_trip_owner)
+):
+    """获取旅行计划的结构化行程（按天排列），没有结构化行程时返回空列表
+
+    提供from/to时只返回该范围内的天，客户端可以按需分段加载。
+    """
+    if first is not None and last is not None and first > last:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from不能大于to"
+        )
+    days = await supabase.trip_itineraries.list_days(str(trip_id), first, last)
+    return adapter_response(itinerary_days_adapter, days)
+
+@router.get("/trips/{trip_id}/plan/days/{day}", response_model=ItineraryDay)
+async def get_trip_itinerary_day(
+    trip_id: UUID,
+    day: int = Path(..., ge=1, description="第几天"),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
+    current_user = Depends(verify_trip_owner)
+):
+    """获取结构化行程中的某一天"""
+    itinerary_day = await supabase.trip_itineraries.get_day(str(trip_id), day)
+    
+    if not itinerary_day:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"第{day}天的行程不存在"
+        )
+    
+    return itinerary_day
 
 @router.put("/trips/{trip_id}", response_model=TripResponse)
 async def update_trip(
     trip_id: UUID,
     trip_data: TripUpdate,
-    supabase = Depends(get_supabase_client),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
     current_user = Depends(get_current_user)
 ):
-    """更新旅行计划"""
-    # 先验证旅行计划存在且属于当前用户
-    check_response = supabase.table('trips').select('*').eq('id', str(trip_id)).eq('user_id', str(current_user['id'])).execute()
+    """更新旅行计划，提供itinerary_days时整体替换结构化行程（传null或空列表清空）"""
+    # 更新字段（mode="json"：Decimal、UUID转为字符串）
+    update_data = trip_data.model_dump(mode="json", exclude_unset=True, exclude={'itinerary_days'})
     
-    if not check_response.data:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="旅行计划不存在"
-        )
+    replace_itinerary = 'itinerary_days' in trip_data.model_fields_set
+    itinerary = prepare_itinerary(trip_data.itinerary_days or []) if replace_itinerary else None
+    if itinerary and 'plan' not in update_data:
+        update_data['plan'] = render_itinerary_text(trip_data.itinerary_days)
     
-    # 更新字段
-    update_data = trip_data.dict(exclude_unset=True)
+    # 行程文本压缩存储
+    plan = update_data.get('plan')
+    if plan:
+        update_data['plan'] = plan_codec.encode(plan)
     
-    # 序列化字段（处理Decimal和UUID）
-    update_data = serialize_fields(update_data)
+    # 先写入结构化行程再更新trips：行程写入失败时trips中的plan保持不变，不会与trip_days不一致
+    if replace_itinerary:
+        await verify_trip_owner(trip_id, current_user, supabase)
+        try:
+            await supabase.trip_itineraries.save(str(trip_id), itinerary)
+        except Exception as e:
+            logger.error(f"保存结构化行程失败: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="更新旅行计划失败"
+            )
     
-    response = supabase.table('trips').update(update_data).eq('id', str(trip_id)).execute()
+    # 更新条件中包含user_id，旅行计划不存在或不属于当前用户时不会更新任何行
+    # 只替换结构化行程时也更新一次trips，让updated_at（ETag）随之变化
+    if not update_data and replace_itinerary:
+        update_data = {'updated_at': 'now()'}
     
-    if response.data:
-        return response.data[0]
+    if update_data:
+        updated_trip = await supabase.trips.update(str(trip_id), str(current_user['id']), update_data)
     else:
+        updated_trip = await supabase.trips.get(str(trip_id), str(current_user['id']))
+    
+    if not updated_trip:
         raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="更新旅行计划失败"
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="旅行计划不存在"
         )
+    
+    # 本次更新了plan时直接返回原文，否则解压数据库中的行程
+    if plan:
+        updated_trip['plan'] = plan
+        return updated_trip
+    return plan_codec.decode_row(updated_trip)
 
 @router.delete("/trips/{trip_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_trip(
     trip_id: UUID,
-    supabase = Depends(get_supabase_client),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
     current_user = Depends(get_current_user)
 ):
     """删除旅行计划"""
-    # 先验证旅行计划存在且属于当前用户
-    check_response = supabase.table('trips').select('*').eq('id', str(trip_id)).eq('user_id', str(current_user['id'])).execute()
+    # 删除条件中包含user_id，旅行计划不存在或不属于当前用户时不会删除任何行
+    deleted = await supabase.trips.delete(str(trip_id), str(current_user['id']))
     
-    if not check_response.data:
+    if not deleted:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="旅行计划不存在"
         )
     
-    # 删除旅行计划
-    response = supabase.table('trips').delete().eq('id', str(trip_id)).execute()
-    
-    if not response.data:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail="删除旅行计划失败"
-        )
+    forget_trip_owner(current_user['id'], str(trip_id))
     
     return None
 
 @router.get("/users/{user_id}/budget-summary", response_model=TripBudgetSummaryResponse)
 async def get_user_budget_summary(
     user_id: UUID,
-    supabase = Depends(get_supabase_client),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client),
     current_user = Depends(get_current_user)
 ):
     """获取用户所有旅行计划的总预算统计"""
@@ -192,28 +340,15 @@ async def get_user_budget_summary(
             detail="无权访问其他用户的数据"
         )
     
-    # 获取用户的所有旅行计划
-    trips_response = supabase.table('trips').select('budget').eq('user_id', str(user_id)).execute()
-    
-    if not trips_response.data:
-        # 如果用户没有旅行计划，返回默认值
-        return TripBudgetSummaryResponse(total_budget=0.0, trip_count=0)
-    
-    # 计算总预算
-    total_budget = 0.0
-    trip_count = len(trips_response.data)
-    
-    for trip in trips_response.data:
-        if trip.get('budget') is not None:
-            try:
-                total_budget += float(trip['budget'])
-            except (ValueError, TypeError):
-                # 如果预算转换失败，跳过该记录
-                continue
+    # 在数据库端聚合，一次往返获取统计结果
+    summary = await supabase.trips.budget_summary(str(user_id))
     
     return TripBudgetSummaryResponse(
-        total_budget=round(total_budget, 2),  # 保留2位小数
-        trip_count=trip_count
+        total_budget=round(float(summary.get('total_budget') or 0), 2),  # 保留2位小数
+        trip_count=summary.get('trip_count') or 0,
+        budget_trip_count=summary.get('budget_trip_count') or 0,
+        min_budget=summary.get('min_budget'),
+        max_budget=summary.get('max_budget')
     )
 
 # 删除原有的费用管理API，它们已经移到独立的expenses.py文件中
\ No newline at end of file
@@ -1,13 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from app.core.auth import get_current_user
-from app.core.supabase_client import get_supabase_client
-from app.schemas.auth import UserResponse, UserPreferenceCreate, UserPreferenceUpdate, UserPreferenceResponse, UserPreferenceListResponse
-from supabase import Client
+from app.core.conditional import (
+    rows_etag, last_modified, is_not_modified, not_modified_response, set_validators, validator_headers
+)
+from app.core.responses import adapter_response
+from app.core.supabase_client import get_supabase_client, AsyncSupabaseClient
+from app.core.identity_cache import identity_cache
+from app.schemas.auth import UserResponse, UserPreferenceCreate, UserPreferenceUpdate, UserPreferenceResponse, UserPreferenceListResponse, preference_list_adapter
 
 router = APIRouter()
 
 @router.get("/profile", response_model=UserResponse)
-def get_user_profile(current_user: dict = Depends(get_current_user)):
+async def get_user_profile(request: Request, response: Response, current_user: dict = Depends(get_current_user)):
+    # 身份信息已在认证时取得，这里只需按返回的字段生成ETag
+    etag = rows_etag([current_user], current_user["username"], current_user.get("is_active", True))
+    modified = last_modified([current_user])
+    if is_not_modified(request, etag, modified):
+        return not_modified_response(etag, modified)
+    set_validators(response, etag, modified)
+    
     # 确保返回的数据格式正确
     return UserResponse(
         id=current_user["id"],
@@ -17,92 +28,92 @@ def get_user_profile(current_user: dict = Depends(get_current_user)):
     )
 
 @router.put("/profile", response_model=UserResponse)
-def update_user_profile(
+async def update_user_profile(
     user_data: UserResponse,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client)
 ):
     # 检查用户名是否被其他用户使用
     if user_data.username != current_user["username"]:
-        existing_user = supabase.table("users").select("*").eq("username", user_data.username).execute()
-        if existing_user.data:
+        existing_user = await supabase.users.get_by_username(user_data.username, "id")
+        if existing_user:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Username already taken"
             )
     
     # 更新用户信息
-    result = supabase.table("users").update({
+    updated_user = await supabase.users.update(current_user["id"], {
         "username": user_data.username,
         "updated_at": "now()"  # 添加更新时间
-    }).eq("id", current_user["id"]).execute()
+    })
     
-    if not result.data:
+    if not updated_user:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to update user profile"
         )
     
+    # 用户名变更后旧token的subject失效，同时清除新旧用户名的身份缓存
+    await identity_cache.invalidate(current_user["username"])
+    await identity_cache.invalidate(updated_user["username"])
+    
     # 返回更新后的用户信息
     return UserResponse(
-        id=result.data[0]["id"],
-        username=result.data[0]["username"],
-        created_at=result.data[0].get("created_at"),
-        is_active=result.data[0].get("is_active", True)
+        id=updated_user["id"],
+        username=updated_user["username"],
+        created_at=updated_user.get("created_at"),
+        is_active=updated_user.get("is_active", True)
     )
 
 # 用户偏好管理接口 - 修改为支持多个偏好
 @router.get("/preferences", response_model=UserPreferenceListResponse)
-def get_user_preferences(
+async def get_user_preferences(
+    request: Request,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client)
 ):
-    """获取用户所有偏好设置"""
-    result = supabase.table("user_preferences").select("*").eq("user_id", current_user["id"]).order("created_at", desc=True).execute()
-    
-    if not result.data:
-        # 如果用户没有偏好设置，返回空列表
-        return UserPreferenceListResponse(preferences=[])
-    
-    # 转换所有偏好数据
-    preferences = []
-    for preference_data in result.data:
-        preferences.append(UserPreferenceResponse(
-            id=preference_data["id"],
-            user_id=preference_data["user_id"],
-            name=preference_data.get("name", "未命名偏好"),
-            travel_preferences=preference_data.get("travel_preferences"),
-            special_requirements=preference_data.get("special_requirements"),
-            created_at=preference_data.get("created_at"),
-            updated_at=preference_data.get("updated_at")
-        ))
-    
-    return UserPreferenceListResponse(preferences=preferences)
+    """获取用户所有偏好设置，响应带ETag，If-None-Match与之相同时返回304"""
+    preference_rows = await supabase.user_preferences.list_by_user(current_user["id"])
+    
+    # 删除偏好不会改变最晚修改时间，列表只按ETag判断
+    etag = rows_etag(preference_rows)
+    modified = last_modified(preference_rows)
+    if is_not_modified(request, etag, use_modified_since=False):
+        return not_modified_response(etag, modified)
+    
+    # 在pydantic-core中一次完成校验和序列化，不逐行构建响应模型
+    for preference_data in preference_rows:
+        preference_data.setdefault("name", "未命名偏好")
+    return adapter_response(
+        preference_list_adapter,
+        {"preferences": preference_rows},
+        headers=validator_headers(etag, modified)
+    )
 
 @router.post("/preferences", response_model=UserPreferenceResponse)
-def create_user_preferences(
+async def create_user_preferences(
     preference_data: UserPreferenceCreate,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client)
 ):
     """创建用户偏好设置 - 移除创建限制，支持多个偏好"""
     # 创建新的偏好设置
-    result = supabase.table("user_preferences").insert({
+    created_preference = await supabase.user_preferences.insert({
         "user_id": current_user["id"],
         "name": preference_data.name,  # 新增：偏好名称
         "travel_preferences": preference_data.travel_preferences,
         "special_requirements": preference_data.special_requirements,
         "created_at": "now()",
         "updated_at": "now()"
-    }).execute()
+    })
     
-    if not result.data:
+    if not created_preference:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to create user preferences"
         )
     
-    created_preference = result.data[0]
     return UserPreferenceResponse(
         id=created_preference["id"],
         user_id=created_preference["user_id"],
@@ -114,11 +125,11 @@ def create_user_preferences(
     )
 
 @router.put("/preferences/{preference_id}", response_model=UserPreferenceResponse)
-def update_user_preferences(
+async def update_user_preferences(
     preference_id: str,  # 确保这里接收的是字符串类型的preference_id
     preference_data: UserPreferenceUpdate,
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client)
 ):
     """更新特定偏好设置"""
     # 检查preference_id是否有效
@@ -129,9 +140,9 @@ def update_user_preferences(
         )
     
     # 检查偏好设置是否存在且属于当前用户
-    existing_preference = supabase.table("user_preferences").select("*").eq("id", preference_id).eq("user_id", current_user["id"]).execute()
+    existing_preference = await supabase.user_preferences.get(preference_id, current_user["id"])
     
-    if not existing_preference.data:
+    if not existing_preference:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Preference not found"
@@ -148,15 +159,14 @@ def update_user_preferences(
     
     update_data["updated_at"] = "now()"
     
-    result = supabase.table("user_preferences").update(update_data).eq("id", preference_id).execute()
+    updated_preference = await supabase.user_preferences.update(preference_id, update_data)
     
-    if not result.data:
+    if not updated_preference:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to update user preferences"
         )
     
-    updated_preference = result.data[0]
     return UserPreferenceResponse(
         id=updated_preference["id"],
         user_id=updated_preference["user_id"],
@@ -168,10 +178,10 @@ def update_user_preferences(
     )
 
 @router.delete("/preferences/{preference_id}")
-def delete_user_preferences(
+async def delete_user_preferences(
     preference_id: str,  # 确保这里接收的是字符串类型的preference_id
     current_user: dict = Depends(get_current_user),
-    supabase: Client = Depends(get_supabase_client)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client)
 ):
     """删除特定偏好设置"""
     # 检查preference_id是否有效
@@ -182,17 +192,17 @@ def delete_user_preferences(
         )
     
     # 检查偏好设置是否存在且属于当前用户
-    existing_preference = supabase.table("user_preferences").select("*").eq("id", preference_id).eq("user_id", current_user["id"]).execute()
+    existing_preference = await supabase.user_preferences.get(preference_id, current_user["id"])
     
-    if not existing_preference.data:
+    if not existing_preference:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Preference not found"
         )
     
-    result = supabase.table("user_preferences").delete().eq("id", preference_id).execute()
+    deleted = await supabase.user_preferences.delete(preference_id)
     
-    if result.data is None:
+    if deleted is None:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Failed to delete user preferences"
@@ -1,10 +1,11 @@
 import os
 import json
+import time
 import logging
-from typing import Dict, Any, List, Optional
-from dashscope import Generation
-import dashscope
+from typing import Dict, Any, List, Optional, AsyncGenerator
 from app.core.config import settings
+from app.core.llm_gateway import llm_gateway, LLMGatewayError
+from app.core import requirements_parser, itinerary_parser
 
 logger = logging.getLogger(__name__)
 
@@ -31,60 +32,106 @@ class AIClient:
 
 请确保计划合理、实用，并充分考虑用户的预算、时间、偏好等约束条件。"""
 
-    async def generate_travel_plan(self, user_input: str) -> Dict[str, Any]:
+        # 结构化行程的系统提示词 - 要求输出JSON，按天组织活动，便于分天存储和展示
+        self.structured_system_prompt = """你是一个专业的旅行规划专家。请根据用户的需求生成详细、个性化的旅行计划，并充分考虑预算、时间、偏好等约束条件。
+
+只输出一个JSON对象，不要输出任何其他文字，格式如下：
+{
+  "overview": "行程总体概述",
+  "days": [
+    {
+      "day": 1,
+      "title": "当天主题",
+      "summary": "当天概述",
+      "activities": [
+        {
+          "time": "09:00",
+          "name": "地点或活动名称",
+          "description": "游玩内容、交通方式或推荐菜品",
+          "address": "详细地址",
+          "location": "经度,纬度",
+          "cost": 120,
+          "category": "景点/餐饮/交通/住宿/其他"
+        }
+      ]
+    }
+  ],
+  "budget_usage": {"交通": 0, "住宿": 0, "餐饮": 0, "门票": 0, "其他": 0},
+  "recommendations": [{"name": "推荐名称", "description": "推荐理由", "type": "美食/景点/购物"}],
+  "tips": ["注意事项"]
+}
+
+要求：days按天排列，天数与用户需求一致；activities按时间顺序排列，包含交通、住宿、景点和餐饮；
+cost为人民币数字（不含单位，免费为0）；不确定坐标时location填null。"""
+
+    def _build_plan_messages(self, user_input: str, structured: bool = False) -> List[Dict[str, str]]:
+        """构建旅行计划生成的对话消息，structured为True时要求输出JSON格式的结构化行程"""
+        return [
+            {'role': 'system', 'content': self.structured_system_prompt if structured else self.system_prompt},
+            {'role': 'user', 'content': f"请为以下旅行需求生成详细的旅行计划：\n\n{user_input}"}
+        ]
+
+    @staticmethod
+    def _parse_plan_content(content: str) -> Dict[str, Any]:
+        """解析模型返回的行程
+
+        能解析出结构化行程时，itinerary为按天渲染的文本；否则保留模型原始文本，itinerary_days为空。
+        """
+        plan_data = itinerary_parser.extract_json_object(content)
+        if not isinstance(plan_data, dict):
+            plan_data = {}
+        days = itinerary_parser.parse_itinerary(plan_data)
+        if not days:
+            logger.warning("模型输出无法解析为结构化行程，使用原始文本")
+
+        budget_usage = plan_data.get("budget_usage")
+        recommendations = plan_data.get("recommendations")
+        overview = plan_data.get("overview") if isinstance(plan_data.get("overview"), str) else None
+        tips = plan_data.get("tips")
+        tips = [str(tip) for tip in tips if tip] if isinstance(tips, list) else None
+        if days:
+            itinerary = itinerary_parser.render_itinerary_text(days, overview, tips)
+        elif isinstance(plan_data.get("itinerary"), str):
+            itinerary = plan_data["itinerary"]
+        else:
+            itinerary = content
+        return {
+            "itinerary": itinerary,
+            "itinerary_days": [day.model_dump(mode="json") for day in days],
+            "budget_usage": budget_usage if isinstance(budget_usage, dict) else {},
+            "recommendations": [item for item in recommendations if isinstance(item, dict)] if isinstance(recommendations, list) else [],
+            "weather_info": plan_data.get("weather_info") if isinstance(plan_data.get("weather_info"), dict) else {},
+            "status": "success"
+        }
+
+    async def generate_travel_plan(self, user_input: str, user_key: Optional[str] = None) -> Dict[str, Any]:
         """
         使用阿里云百炼平台生成旅行计划
+        user_key用于按用户限制并发，超限或超时时抛出LLMGatewayError
         """
         try:
             if not self.api_key:
                 raise ValueError("ALIYUN_AI_KEY is not configured")
             
-            # 构建用户消息
-            messages = [
-                {'role': 'system', 'content': self.system_prompt},
-                {'role': 'user', 'content': f"请为以下旅行需求生成详细的旅行计划：\n\n{user_input}"}
-            ]
-            
-            # 调用阿里云百炼API
-            response = Generation.call(
-                api_key=self.api_key,
-                model=self.model,
-                messages=messages,
-                result_format="message"
+            # 调用阿里云百炼API（线程池中执行，不阻塞事件循环）
+            kwargs = {"response_format": {"type": "json_object"}} if settings.AI_PLAN_JSON_MODE else {}
+            response = await llm_gateway.call(
+                self._build_plan_messages(user_input, structured=True),
+                self.model,
+                self.api_key,
+                user_key=user_key,
+                **kwargs
             )
             
             if response.status_code == 200:
-                # 解析AI返回的内容
-                ai_response = response.output.choices[0].message.content
-                
-                # 尝试解析JSON格式的响应，如果失败则使用原始文本
-                try:
-                    plan_data = json.loads(ai_response)
-                except json.JSONDecodeError:
-                    # 如果AI返回的不是标准JSON，使用原始文本并创建结构化数据
-                    # 修复：确保返回正确的数据类型
-                    plan_data = {
-                        "itinerary": ai_response,
-                        "budget_usage": {},  # 修复：改为空字典
-                        "recommendations": [],  # 修复：改为空列表
-                        "weather_info": {},  # 修复：改为空字典
-                        "status": "success",
-                        "raw_response": ai_response
-                    }
-                
-                # 确保返回标准格式
-                return {
-                    "itinerary": plan_data.get("itinerary", ai_response),
-                    "budget_usage": plan_data.get("budget_usage", {}),
-                    "recommendations": plan_data.get("recommendations", []),
-                    "weather_info": plan_data.get("weather_info", {}),
-                    "status": "success"
-                }
+                # 解析AI返回的结构化行程，无法解析时退回原始文本
+                return self._parse_plan_content(response.output.choices[0].message.content)
                 
             else:
                 logger.error(f"AI API调用失败: {response.status_code} - {response.message}")
                 return {
                     "itinerary": "AI服务暂时不可用，请稍后重试",
+                    "itinerary_days": [],
                     "budget_usage": {},
                     "recommendations": [],
                     "weather_info": {},
@@ -92,10 +139,13 @@ class AIClient:
                     "error": f"API调用失败: {response.message}"
                 }
                 
+        except LLMGatewayError:
+            raise
         except Exception as e:
             logger.error(f"生成旅行计划时发生错误: {str(e)}")
             return {
                 "itinerary": "生成旅行计划时发生错误",
+                "itinerary_days": [],
                 "budget_usage": {},
                 "recommendations": [],
                 "weather_info": {},
@@ -103,7 +153,64 @@ class AIClient:
                 "error": str(e)
             }
 
-    async def get_poi_recommendations(self, destination: str, preferences: List[str]) -> List[Dict[str, Any]]:
+    async def stream_travel_plan(self, user_input: str, user_key: Optional[str] = None) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        流式生成结构化旅行计划，产出三类事件：
+        - delta：模型新生成的文本片段（JSON原文），day为片段所在的天数（第一天开始前为0）
+        - day：某一天的JSON生成完毕，content为该天渲染后的文本，data为该天的结构化行程
+        - done：生成结束，附带与generate_travel_plan相同的解析结果（itinerary、itinerary_days等）
+          以及首字延迟和总耗时
+        """
+        if not self.api_key:
+            raise ValueError("ALIYUN_AI_KEY is not configured")
+        
+        start_time = time.monotonic()
+        first_token_time = None
+        scanner = itinerary_parser.DayStreamScanner()
+        last_day = 0  # 最近一个生成完毕的天数
+        streamed_days = set()
+        
+        kwargs = {"response_format": {"type": "json_object"}} if settings.AI_PLAN_JSON_MODE else {}
+        async for delta in llm_gateway.stream(
+            self._build_plan_messages(user_input, structured=True),
+            self.model,
+            self.api_key,
+            user_key=user_key,
+            **kwargs
+        ):
+            if first_token_time is None:
+                first_token_time = time.monotonic()
+            finished = scanner.feed(delta)
+            yield {"event": "delta", "day": last_day + 1 if scanner.in_day or finished else last_day, "content": delta}
+            
+            for raw_day in finished:
+                day = itinerary_parser.parse_day(raw_day, last_day + 1)
+                if day is None or day.day in streamed_days:
+                    continue
+                streamed_days.add(day.day)
+                last_day = day.day
+                yield {
+                    "event": "day",
+                    "day": day.day,
+                    "content": itinerary_parser.render_itinerary_text([day]),
+                    "data": day.model_dump(mode="json")
+                }
+        
+        result = self._parse_plan_content(scanner.buffer)
+        end_time = time.monotonic()
+        ttft_ms = round((first_token_time - start_time) * 1000) if first_token_time else None
+        total_ms = round((end_time - start_time) * 1000)
+        logger.info(f"流式行程生成完成: 首字延迟={ttft_ms}ms, 总耗时={total_ms}ms, 字数={len(scanner.buffer)}")
+        yield {
+            "event": "done",
+            "ttft_ms": ttft_ms,
+            "total_ms": total_ms,
+            "chars": len(scanner.buffer),
+            "days": len(result["itinerary_days"]),
+            **{key: result[key] for key in ("itinerary", "itinerary_days", "budget_usage", "recommendations", "weather_info")}
+        }
+
+    async def get_poi_recommendations(self, destination: str, preferences: List[str], user_key: Optional[str] = None) -> List[Dict[str, Any]]:
         """
         获取景点推荐（简化实现）
         """
@@ -116,12 +223,7 @@ class AIClient:
                 {'role': 'user', 'content': prompt}
             ]
             
-            response = Generation.call(
-                api_key=self.api_key,
-                model=self.model,
-                messages=messages,
-                result_format="message"
-            )
+            response = await llm_gateway.call(messages, self.model, self.api_key, user_key=user_key)
             
             if response.status_code == 200:
                 recommendations = response.output.choices[0].message.content
@@ -130,11 +232,29 @@ class AIClient:
             else:
                 return []
                 
+        except LLMGatewayError:
+            raise
         except Exception as e:
             logger.error(f"获取景点推荐失败: {str(e)}")
             return []
 
-    async def parse_travel_requirements(self, travel_requirements: str) -> Dict[str, Any]:
+    async def parse_travel_requirements(self, travel_requirements: str, user_key: Optional[str] = None) -> Dict[str, Any]:
+        """
+        解析用户输入的旅行需求
+        先使用本地规则解析常见表述，无法确定时再交给大模型
+        """
+        if settings.AI_PARSE_RULES_ENABLED:
+            start_time = time.perf_counter()
+            result = requirements_parser.parse_travel_requirements(travel_requirements)
+            elapsed_us = (time.perf_counter() - start_time) * 1e6
+            if result is not None:
+                logger.info(f"规则解析旅行需求成功，耗时{elapsed_us:.0f}μs")
+                return result
+            logger.info(f"规则无法确定旅行需求，交给大模型解析（规则耗时{elapsed_us:.0f}μs）")
+        
+        return await self.parse_travel_requirements_with_llm(travel_requirements, user_key)
+
+    async def parse_travel_requirements_with_llm(self, travel_requirements: str, user_key: Optional[str] = None) -> Dict[str, Any]:
         """
         使用大模型解析用户输入的旅行需求
         """
@@ -174,12 +294,10 @@ class AIClient:
                 {'role': 'user', 'content': parse_prompt}
             ]
             
-            # 调用阿里云百炼API
-            response = Generation.call(
-                api_key=self.api_key,
-                model=self.model,
-                messages=messages,
-                result_format="message"
+            # 调用阿里云百炼API（解析请求较短，使用单独的超时时间）
+            response = await llm_gateway.call(
+                messages, self.model, self.api_key,
+                user_key=user_key, timeout=settings.AI_PARSE_TIMEOUT
             )
             
             if response.status_code == 200:
@@ -228,6 +346,8 @@ class AIClient:
                     "error": f"API调用失败: {response.message}"
                 }
                 
+        except LLMGatewayError:
+            raise
         except Exception as e:
             logger.error(f"解析旅行需求时发生错误: {str(e)}")
             return {
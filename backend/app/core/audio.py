@@ -0,0 +1,160 @@
+import struct
+import asyncio
+from typing import AsyncGenerator, AsyncIterable, AsyncIterator, Dict, Optional, Tuple
+from app.core.speech_session import coalesce_frames
+
+# 科大讯飞实时转写要求的音频格式：16kHz、16bit、单声道PCM
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+BYTES_PER_SECOND = SAMPLE_RATE * SAMPLE_WIDTH * CHANNELS
+
+# 读取WAV头时最多缓冲的字节数（fmt和data之间可能有LIST等附加块）
+MAX_HEADER_BYTES = 64 * 1024
+
+class AudioFormatError(ValueError):
+    """音频格式不符合要求"""
+
+def _parse_wav_header(buffer: bytes) -> Tuple[Dict[str, int], int]:
+    """解析WAV头，返回(格式, data块起始偏移)；头部数据不完整时抛出EOFError"""
+    if len(buffer) < 12:
+        raise EOFError
+    if buffer[:4] != b"RIFF" or buffer[8:12] != b"WAVE":
+        raise AudioFormatError("不是有效的WAV文件")
+
+    offset = 12
+    fmt = None
+    while True:
+        if len(buffer) < offset + 8:
+            raise EOFError
+        chunk_id = buffer[offset:offset + 4]
+        chunk_size = struct.unpack("<I", buffer[offset + 4:offset + 8])[0]
+        body = offset + 8
+        if chunk_id == b"data":
+            if fmt is None:
+                raise AudioFormatError("WAV文件缺少fmt块")
+            return fmt, body
+        if len(buffer) < body + chunk_size:
+            raise EOFError
+        if chunk_id == b"fmt ":
+            if chunk_size < 16:
+                raise AudioFormatError("WAV文件fmt块无效")
+            audio_format, channels, sample_rate = struct.unpack("<HHI", buffer[body:body + 8])
+            bits_per_sample = struct.unpack("<H", buffer[body + 14:body + 16])[0]
+            fmt = {
+                "audio_format": audio_format,
+                "channels": channels,
+                "sample_rate": sample_rate,
+                "bits_per_sample": bits_per_sample
+            }
+        # 块按偶数字节对齐
+        offset = body + chunk_size + (chunk_size & 1)
+
+def _check_format(fmt: Dict[str, int]):
+    if fmt["audio_format"] != 1:
+        raise AudioFormatError("只支持未压缩的PCM编码WAV")
+    if (fmt["sample_rate"], fmt["bits_per_sample"], fmt["channels"]) != (SAMPLE_RATE, SAMPLE_WIDTH * 8, CHANNELS):
+        raise AudioFormatError(
+            f"音频格式需为16kHz、16bit、单声道，当前为{fmt['sample_rate']}Hz、"
+            f"{fmt['bits_per_sample']}bit、{fmt['channels']}声道"
+        )
+
+class PCMStream:
+    """把上传的WAV/PCM字节流转换为PCM数据流，不在内存中缓冲整个文件
+
+    open()读取到WAV头完整为止并校验格式（格式错误在开始转写前就能返回）；
+    之后迭代时逐块产出PCM数据。超过max_bytes时停止产出，设置truncated和overflow事件，
+    调用方等待overflow即可立即中止转写并返回错误（转写过程中抛出的异常会被发送任务吞掉）。
+    """
+
+    def __init__(self, source: AsyncIterable[bytes], max_bytes: int):
+        self._source: AsyncIterator[bytes] = source.__aiter__()
+        self.max_bytes = max_bytes
+        self.received = 0
+        self.truncated = False
+        self.overflow = asyncio.Event()
+        self._head = b""
+
+    async def _next(self) -> Optional[bytes]:
+        try:
+            return await self._source.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    async def open(self) -> "PCMStream":
+        buffer = b""
+        while len(buffer) < 12:
+            chunk = await self._next()
+            if chunk is None:
+                break
+            buffer += chunk
+
+        if buffer[:4] != b"RIFF":
+            # 没有WAV头，按16kHz 16bit单声道的裸PCM处理
+            self._head = buffer
+            return self
+
+        while True:
+            try:
+                fmt, data_offset = _parse_wav_header(buffer)
+                break
+            except EOFError:
+                if len(buffer) > MAX_HEADER_BYTES:
+                    raise AudioFormatError("WAV头过大")
+                chunk = await self._next()
+                if chunk is None:
+                    raise AudioFormatError("WAV文件不完整")
+                buffer += chunk
+        _check_format(fmt)
+        self._head = buffer[data_offset:]
+        if not self._head:
+            self._head = await self._next() or b""
+        return self
+
+    @property
+    def empty(self) -> bool:
+        """open()之后没有任何音频数据"""
+        return self.received == 0 and not self._head
+
+    @property
+    def duration(self) -> float:
+        """已产出的音频时长（秒）"""
+        return self.received / BYTES_PER_SECOND
+
+    async def __aiter__(self) -> AsyncGenerator[bytes, None]:
+        if self._head:
+            chunk, self._head = self._head, b""
+            if not self._accept(len(chunk)):
+                return
+            yield chunk
+        async for chunk in self._source:
+            if not chunk:
+                continue
+            if not self._accept(len(chunk)):
+                return
+            yield chunk
+
+    def _accept(self, size: int) -> bool:
+        self.received += size
+        if self.received > self.max_bytes:
+            self.truncated = True
+            self.overflow.set()
+            return False
+        return True
+
+async def pace_frames(audio: AsyncIterable[bytes], frame_bytes: int, speedup: float) -> AsyncGenerator[bytes, None]:
+    """把PCM数据切成固定大小的帧，按实时速度的speedup倍发送
+
+    按起始时间计算每一帧的发送时刻（而不是每帧固定sleep），调度延迟不会累积。
+    """
+    loop = asyncio.get_running_loop()
+    frame_seconds = frame_bytes / BYTES_PER_SECOND / speedup
+    start = loop.time()
+    sent = 0
+
+    async for frame in coalesce_frames(audio, frame_bytes):
+        delay = start + sent * frame_seconds - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        sent += 1
+        yield frame
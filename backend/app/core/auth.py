@@ -1,15 +1,38 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Optional, Tuple
+from uuid import UUID
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from app.core.supabase_client import get_supabase_client
+from app.core.supabase_client import get_supabase_client, AsyncSupabaseClient
 from app.core.config import settings
+from app.core.identity_cache import identity_cache
+from app.core.cache import TTLCache
+from app.core.metrics import metrics
 import hashlib
 
 # 使用更稳定的密码哈希方案，避免bcrypt版本问题
-pwd_context = CryptContext(schemes=["argon2", "bcrypt"], deprecated="auto")
+# argon2参数可配置；参数变化后旧哈希在下次登录成功时自动重新哈希（bcrypt哈希同样会迁移到argon2）
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__time_cost=settings.ARGON2_TIME_COST,
+    argon2__memory_cost=settings.ARGON2_MEMORY_COST,
+    argon2__parallelism=settings.ARGON2_PARALLELISM
+)
+
+# 密码哈希是CPU密集操作（几十毫秒），放到专用的有界线程池中执行，避免阻塞事件循环。
+# argon2-cffi和bcrypt在计算时会释放GIL，线程池即可利用多核。
+password_executor = ThreadPoolExecutor(max_workers=settings.PASSWORD_HASH_WORKERS, thread_name_prefix="password")
+
+password_hash_seconds = metrics.histogram(
+    "password_hash_seconds",
+    "密码哈希/校验耗时（秒），不含线程池排队时间",
+    labelnames=("operation",)
+)
 
 # JWT配置
 SECRET_KEY = settings.JWT_SECRET
@@ -17,16 +40,38 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 24 * 60  # 延长到24小时
 
 security = HTTPBearer()
+# 可选认证：未携带token时不报错，用于匿名也可访问的接口
+optional_security = HTTPBearer(auto_error=False)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# 旅行计划归属校验缓存：(user_id, trip_id) -> True，只缓存校验通过的结果
+trip_owner_cache = TTLCache(maxsize=settings.TRIP_OWNER_CACHE_MAXSIZE, ttl=settings.TRIP_OWNER_CACHE_TTL)
 
-def get_password_hash(password: str) -> str:
+def normalize_password(password: str) -> str:
     # 处理bcrypt的72字节限制：如果密码超过72字节，先进行哈希处理
     if len(password.encode('utf-8')) > 72:
         # 使用SHA-256对长密码进行预处理
         password = hashlib.sha256(password.encode('utf-8')).hexdigest()
-    return pwd_context.hash(password)
+    return password
+
+def _timed(operation: str, func, *args):
+    with password_hash_seconds.time(operation=operation):
+        return func(*args)
+
+async def _run_in_password_pool(operation: str, func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(password_executor, _timed, operation, func, *args)
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return await _run_in_password_pool("verify", pwd_context.verify, normalize_password(plain_password), hashed_password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """校验密码，哈希方案或参数已过时返回新的哈希（需要写回数据库），否则为None"""
+    return await _run_in_password_pool(
+        "verify", pwd_context.verify_and_update, normalize_password(plain_password), hashed_password
+    )
+
+async def get_password_hash(password: str) -> str:
+    return await _run_in_password_pool("hash", pwd_context.hash, normalize_password(password))
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
@@ -38,9 +83,9 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def get_current_user(
+async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    supabase = Depends(get_supabase_client)
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client)
 ):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -53,11 +98,55 @@ def get_current_user(
         if username is None:
             raise credentials_exception
         
-        # 直接查询用户表验证用户
-        result = supabase.table("users").select("*").eq("username", username).execute()
-        if not result.data:
+        # 优先使用身份缓存，未命中时再查询用户表验证用户
+        user = await identity_cache.get(username)
+        if user is not None:
+            return user
+        
+        user = await supabase.users.get_by_username(username, supabase.users.PUBLIC_COLUMNS)
+        if not user:
             raise credentials_exception
         
-        return result.data[0]
+        await identity_cache.set(username, user)
+        return user
     except JWTError:
-        raise credentials_exception
\ No newline at end of file
+        raise credentials_exception
+
+async def get_optional_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client)
+) -> Optional[dict]:
+    """获取当前用户，未登录或token无效时返回None"""
+    if credentials is None:
+        return None
+    try:
+        return await get_current_user(credentials, supabase)
+    except HTTPException:
+        return None
+
+async def verify_trip_owner(
+    trip_id: UUID,
+    current_user = Depends(get_current_user),
+    supabase: AsyncSupabaseClient = Depends(get_supabase_client)
+):
+    """校验旅行计划属于当前用户，校验通过时返回当前用户
+
+    只查询id字段，不拉取plan等大字段；校验结果在TRIP_OWNER_CACHE_TTL内复用。
+    """
+    cache_key = (str(current_user['id']), str(trip_id))
+    if trip_owner_cache.get(cache_key):
+        return current_user
+    
+    trip = await supabase.trips.get(str(trip_id), str(current_user['id']), columns="id")
+    if not trip:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="旅行计划不存在"
+        )
+    
+    trip_owner_cache.set(cache_key, True)
+    return current_user
+
+def forget_trip_owner(user_id: str, trip_id: str):
+    """旅行计划删除后清除归属校验缓存"""
+    trip_owner_cache.delete((str(user_id), str(trip_id)))
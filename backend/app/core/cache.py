@@ -0,0 +1,180 @@
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+class TTLCache:
+    """进程内缓存 - LRU淘汰 + TTL过期，并统计命中/未命中次数
+
+    只在事件循环线程中使用，不做加锁处理。
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取缓存，过期条目视为未命中并被删除"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return default
+
+        value, expires_at = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+
+        # 标记为最近使用
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+class SQLiteTTLCache:
+    """磁盘缓存 - SQLite存储，TTL过期 + 按最近访问时间的LRU淘汰，进程重启后仍然有效
+
+    值以字符串保存（调用方负责序列化）。连接在线程间共享并加锁，
+    可以通过asyncio.to_thread在线程池中调用，避免磁盘IO阻塞事件循环。
+    过期时间使用墙上时间，以便跨进程、跨重启使用。
+    """
+
+    def __init__(self, path: str, maxsize: int, ttl: float, table: str = "cache"):
+        self.path = path
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # WAL模式允许多个worker进程同时读写同一个缓存文件
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_accessed_at ON {table}(accessed_at)")
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，命中时刷新访问时间，过期条目视为未命中并被删除"""
+        item = self.get_with_ttl(key)
+        return item[0] if item is not None else None
+
+    def get_with_ttl(self, key: str) -> Optional[Tuple[str, float]]:
+        """读取缓存，返回(值, 剩余有效时间秒数)；用于把条目提升到内存缓存时保留原来的过期时间"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return value, expires_at - now
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        """写入缓存，超出容量时先清理过期条目，再淘汰最久未访问的条目"""
+        now = time.time()
+        expires_at = now + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now)
+            )
+            size = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            if size > self.maxsize:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (now,))
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN ("
+                    f"SELECT key FROM {self.table} ORDER BY accessed_at LIMIT "
+                    f"MAX((SELECT COUNT(*) FROM {self.table}) - ?, 0))",
+                    (self.maxsize,)
+                )
+
+    def delete(self, key: str):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def purge_expired(self) -> int:
+        """删除所有过期条目，返回删除的条数"""
+        with self._lock:
+            return self._conn.execute(f"DELETE FROM {self.table} WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def values(self) -> List[str]:
+        """所有未过期条目的值"""
+        with self._lock:
+            rows = self._conn.execute(f"SELECT value FROM {self.table} WHERE expires_at >= ?", (time.time(),)).fetchall()
+        return [row[0] for row in rows]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中率统计"""
+        total = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
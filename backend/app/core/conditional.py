@@ -0,0 +1,82 @@
+import json
+import hashlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Iterable, Optional
+from fastapi import Request, Response, status
+
+# 数据可能被其他设备修改，浏览器每次使用缓存前都要用ETag向服务端确认
+CACHE_CONTROL = "private, no-cache"
+
+def row_version(row: Dict[str, Any]) -> str:
+    """行版本：updated_at（由数据库触发器在每次更新时设置，见init_database.py），从未更新过的行用created_at"""
+    return str(row.get("updated_at") or row.get("created_at") or "")
+
+def make_etag(*parts: Any) -> str:
+    """由行版本和影响响应内容的请求参数生成强ETag"""
+    raw = json.dumps(parts, default=str, ensure_ascii=False, separators=(",", ":"))
+    return '"' + hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest() + '"'
+
+def rows_etag(rows: Iterable[Dict[str, Any]], *extra: Any) -> str:
+    """列表的ETag：按顺序包含每一行的(id, 版本)，增删改和顺序变化都会改变ETag"""
+    return make_etag([(str(row.get("id")), row_version(row)) for row in rows], *extra)
+
+def _parse_timestamp(value: Any) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def last_modified(rows: Iterable[Dict[str, Any]]) -> Optional[datetime]:
+    """各行版本中最晚的时间"""
+    times = [t for t in (_parse_timestamp(row_version(row)) for row in rows) if t is not None and t.tzinfo is not None]
+    return max(times) if times else None
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match使用弱比较：忽略W/前缀"""
+    if header.strip() == "*":
+        return True
+    candidates = (tag.strip() for tag in header.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+def is_not_modified(
+    request: Request,
+    etag: str,
+    modified: Optional[datetime] = None,
+    use_modified_since: bool = True
+) -> bool:
+    """判断客户端缓存的版本是否仍然有效
+
+    有If-None-Match时只比较ETag；否则比较If-Modified-Since（精确到秒）。
+    列表接口应传use_modified_since=False：删除行不会让最晚修改时间变化，只能依靠ETag。
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if not (use_modified_since and if_modified_since and modified):
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        return False
+    return modified.replace(microsecond=0) <= since
+
+def validator_headers(etag: str, modified: Optional[datetime] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if modified is not None:
+        headers["Last-Modified"] = format_datetime(modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+def not_modified_response(etag: str, modified: Optional[datetime] = None) -> Response:
+    """304响应：不查询后续数据、不序列化响应体"""
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=validator_headers(etag, modified))
+
+def set_validators(response: Response, etag: str, modified: Optional[datetime] = None):
+    """在正常响应上设置ETag、Last-Modified和Cache-Control"""
+    response.headers.update(validator_headers(etag, modified))
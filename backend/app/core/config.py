@@ -1,7 +1,10 @@
 from pydantic_settings import BaseSettings
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
 
+# backend目录，本地缓存等数据文件默认存放在backend/data下
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
 class Settings(BaseSettings):
     # 项目配置
     PROJECT_NAME: str = "AI旅行规划师"
@@ -10,21 +13,102 @@ class Settings(BaseSettings):
     # Supabase配置
     SUPABASE_URL: str
     SUPABASE_KEY: str
+    # 数据库访问线程池大小（同时在途的PostgREST请求上限）
+    SUPABASE_MAX_WORKERS: int = 32
     
     # 阿里云AI配置 - 用于智能行程规划
     ALIYUN_AI_KEY: str
+    AI_MAX_CONCURRENCY: int = 8  # 同时调用模型的全局上限
+    AI_MAX_CONCURRENCY_PER_USER: int = 2  # 单个用户同时进行的AI请求上限
+    AI_REQUEST_TIMEOUT: float = 120.0  # 行程生成等长请求的截止时间（秒）
+    AI_PARSE_TIMEOUT: float = 30.0  # 需求解析等短请求的截止时间（秒）
+    AI_PARSE_RULES_ENABLED: bool = True  # 需求解析先尝试本地规则，无法确定时才调用模型
+    AI_PLAN_JSON_MODE: bool = True  # 生成行程时要求模型输出JSON对象（response_format=json_object），模型不支持时关闭
+    
+    # AI旅行计划缓存 - 相同（规范化后）的规划请求直接返回已生成的计划
+    PLAN_CACHE_ENABLED: bool = True
+    PLAN_CACHE_PATH: str = os.path.join(BACKEND_DIR, "data", "plan_cache.sqlite3")
+    PLAN_CACHE_TTL: int = 7 * 24 * 3600  # 秒
+    PLAN_CACHE_MAXSIZE: int = 5000
+    PLAN_CACHE_BUDGET_STEP: float = 0.2  # 预算分桶时相邻区间的比例差
+    
+    # trips.plan压缩存储 - zstd + 针对行程文本训练的字典（需要安装zstandard）
+    PLAN_COMPRESSION_ENABLED: bool = True  # 关闭后新写入的行程不再压缩，已压缩的行程仍可读取
+    PLAN_ZSTD_LEVEL: int = 9
+    PLAN_COMPRESS_MIN_BYTES: int = 512  # 短于该长度（UTF-8字节）的行程不压缩
+    # 训练好的字典与代码一起部署（解码旧数据需要对应的字典），由init_database.py train-plan-dict生成
+    PLAN_ZSTD_DICT_DIR: str = os.path.join(BACKEND_DIR, "plan_dicts")
     
     # 地图服务配置 - 用于地图交互界面
     MAP_API_KEY: str
+    MAP_HTTP2: bool = True  # 需要安装h2（httpx[http2]）
+    MAP_MAX_CONNECTIONS: int = 100  # 连接池最大连接数
+    MAP_MAX_KEEPALIVE_CONNECTIONS: int = 20  # 保持的空闲长连接数
+    MAP_KEEPALIVE_EXPIRY: float = 30.0  # 空闲连接保留时间（秒）
+    MAP_CONNECT_TIMEOUT: float = 3.0  # 建立连接超时（秒）
+    MAP_TIMEOUT: float = 5.0  # 地理编码、POI搜索等请求的超时（秒）
+    MAP_ROUTE_TIMEOUT: float = 10.0  # 路径规划、静态地图等较慢请求的超时（秒）
+    MAP_RETRIES: int = 2  # 网络错误、5xx和限流时的重试次数
+    MAP_RETRY_BACKOFF: float = 0.2  # 重试退避基准时间（秒）
+    MAP_MATRIX_CONCURRENCY: int = 4  # 路线矩阵同时进行的高德请求数
+    MAP_SECURITY_KEY: Optional[str] = None  # 高德Web服务数字签名私钥，配置后静态地图等URL附带sig
+    
+    # 静态地图图片代理 - 需要图片内容的客户端通过后端获取，按内容寻址缓存在磁盘上
+    STATIC_MAP_PROXY_ENABLED: bool = False
+    STATIC_MAP_CACHE_DIR: str = os.path.join(BACKEND_DIR, "data", "static_maps")
+    STATIC_MAP_CACHE_TTL: int = 7 * 24 * 3600  # 秒
+    STATIC_MAP_CACHE_MAXSIZE: int = 20000
+    STATIC_MAP_CACHE_SWEEP_INTERVAL: int = 3600  # 秒，清理没有索引引用的图片文件的间隔（启动时也会清理一次）
+    
+    # 地理编码缓存 - 内存LRU + 本地SQLite两级缓存
+    GEOCODE_CACHE_ENABLED: bool = True
+    GEOCODE_CACHE_PATH: str = os.path.join(BACKEND_DIR, "data", "geocode_cache.sqlite3")
+    GEOCODE_CACHE_TTL: int = 30 * 24 * 3600  # 秒，地址坐标很少变化
+    GEOCODE_CACHE_NEGATIVE_TTL: int = 3600  # 秒，查不到结果的地址
+    GEOCODE_CACHE_MEMORY_MAXSIZE: int = 5000
+    GEOCODE_CACHE_DISK_MAXSIZE: int = 200000
+    GEOCODE_COORD_PRECISION: int = 4  # 逆地理编码缓存键的坐标小数位数（4位约11米）
     
     # 语音识别配置 - 科大讯飞实时语音转写API
     SPEECH_APP_ID: str  # 科大讯飞应用ID
     SPEECH_API_KEY: str  # 科大讯飞实时语音转写API Key
+    SPEECH_MAX_SESSIONS: int = 200  # 单个进程同时进行的实时转写会话上限
+    SPEECH_FRAME_BYTES: int = 1280  # 发送给科大讯飞的音频帧大小（16kHz 16bit单声道40ms）
+    SPEECH_QUEUE_MAX_CHUNKS: int = 50  # 每个会话缓冲的音频块上限，超出时暂停读取浏览器数据
+    SPEECH_FILE_MAX_BYTES: int = 50 * 1024 * 1024  # 上传音频文件大小上限（16kHz 16bit单声道约27分钟）
+    SPEECH_FILE_SPEEDUP: float = 4.0  # 上传文件转写时相对实时的发送速度倍数
+    SPEECH_FILE_TIMEOUT: float = 600.0  # 上传文件转写的截止时间（秒）
     
     # 安全配置
     SECRET_KEY: str
     JWT_SECRET: str
     
+    # 密码哈希配置 - 修改argon2参数后，旧哈希在用户下次登录时自动更新
+    PASSWORD_HASH_WORKERS: int = 4  # 密码哈希线程池大小（同时进行的哈希计算数）
+    ARGON2_TIME_COST: int = 3  # 迭代次数
+    ARGON2_MEMORY_COST: int = 65536  # 内存（KiB）
+    ARGON2_PARALLELISM: int = 4  # 并行度（默认值与passlib一致，已有哈希不会被重新计算）
+    
+    # 身份缓存配置 - 减少get_current_user对users表的查询
+    IDENTITY_CACHE_TTL: int = 300  # 秒
+    IDENTITY_CACHE_MAXSIZE: int = 10000
+    IDENTITY_CACHE_REDIS_URL: Optional[str] = None  # 多worker部署时使用的共享缓存
+    
+    # 旅行计划归属校验缓存
+    TRIP_OWNER_CACHE_TTL: int = 30  # 秒，删除旅行计划后其他worker最多在该时间内仍视为有效
+    TRIP_OWNER_CACHE_MAXSIZE: int = 10000
+    
+    # 可观测性配置
+    METRICS_ENABLED: bool = True  # 记录请求/外部调用指标并开放/metrics
+    OTEL_ENABLED: bool = False  # 需要安装opentelemetry-api，导出器通过OTEL_*环境变量配置
+    
+    # 日志配置 - 写日志经队列交给后台线程，不阻塞事件循环
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: Dict[str, str] = {}  # 单独设置某些日志的级别，如{"app.core.speech_client": "DEBUG"}
+    LOG_JSON: bool = False  # 每条日志输出一行JSON
+    LOG_SESSION_SAMPLE_RATE: float = 1.0  # 开启DEBUG级别后，实时语音等会话中输出调试日志的会话比例（0~1）
+    LOG_ADMIN_TOKEN: Optional[str] = None  # 配置后可通过/logging接口（X-Admin-Token请求头）在运行时调整日志级别
+    
     # CORS配置
     BACKEND_CORS_ORIGINS: List[str] = ["http://localhost:3000"]
 
@@ -0,0 +1,37 @@
+from typing import Any, Dict, Iterable, List, Optional
+from fastapi import HTTPException, status
+from app.core.responses import FastJSONResponse
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """解析?fields=逗号分隔的字段列表，未提供时返回None
+
+    只允许响应模型中的字段（同时也是拼接到PostgREST select中的列名），包含未知字段时返回400。
+    """
+    if fields is None:
+        return None
+    allowed = set(allowed)
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if not names or unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"不支持的字段: {', '.join(unknown)}" if unknown else "fields不能为空"
+        )
+    return names
+
+def select_columns(names: List[str], required: Iterable[str] = ()) -> str:
+    """生成PostgREST的select参数，required为接口内部需要的列（如分页游标用到的列）"""
+    return ",".join(dict.fromkeys([*required, *names]))
+
+def project(row: Dict[str, Any], names: List[str]) -> Dict[str, Any]:
+    """只保留请求的字段"""
+    return {name: row.get(name) for name in names}
+
+def projected_response(rows: Any, names: List[str]) -> FastJSONResponse:
+    """返回只包含请求字段的JSON响应
+
+    部分字段无法通过完整的响应模型校验，这里直接返回数据库结果（PostgREST返回的已是JSON类型）。
+    """
+    if isinstance(rows, list):
+        return FastJSONResponse([project(row, names) for row in rows])
+    return FastJSONResponse(project(rows, names))
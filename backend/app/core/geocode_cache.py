@@ -0,0 +1,121 @@
+import re
+import json
+import asyncio
+import logging
+import unicodedata
+from typing import Any, Awaitable, Callable, Dict, Optional
+from app.core.cache import TTLCache, SQLiteTTLCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class GeocodeCache:
+    """地理编码两级缓存
+
+    - 内存LRU：热点地址（城市名、地标）直接命中
+    - SQLite：进程重启后仍然有效，多个worker共享
+    同一个键的并发查询合并为一次上游请求，其余请求等待同一个结果。
+    """
+
+    def __init__(self, path: str, memory_maxsize: int, disk_maxsize: int, ttl: float, coord_precision: int):
+        self.ttl = ttl
+        self.coord_precision = coord_precision
+        self.memory = TTLCache(memory_maxsize, ttl)
+        self.disk = SQLiteTTLCache(path, disk_maxsize, ttl, table="geocode_cache")
+        self.coalesced = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _normalize(text: Optional[str]) -> str:
+        return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text or "").strip().lower())
+
+    def address_key(self, address: str, city: Optional[str] = None) -> str:
+        """地理编码缓存键：规范化后的地址+城市"""
+        return f"geo:{self._normalize(address)}|{self._normalize(city)}"
+
+    def location_key(self, location: str) -> Optional[str]:
+        """逆地理编码缓存键：按精度取整后的坐标，坐标格式不正确时返回None（不缓存）"""
+        try:
+            lng, lat = (float(part) for part in location.split(","))
+        except ValueError:
+            return None
+        return f"regeo:{lng:.{self.coord_precision}f},{lat:.{self.coord_precision}f}"
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+
+        try:
+            item = await asyncio.to_thread(self.disk.get_with_ttl, key)
+        except Exception as e:
+            logger.warning(f"读取地理编码缓存失败: {str(e)}")
+            return None
+        if item is None:
+            return None
+
+        # 按磁盘条目的剩余有效时间放入内存（空结果只缓存GEOCODE_CACHE_NEGATIVE_TTL，不能按默认TTL延长）
+        raw, remaining = item
+        value = json.loads(raw)
+        self.memory.set(key, value, remaining)
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any], ttl: Optional[float] = None):
+        self.memory.set(key, value, ttl)
+        try:
+            await asyncio.to_thread(self.disk.set, key, json.dumps(value, ensure_ascii=False), ttl)
+        except Exception as e:
+            logger.warning(f"写入地理编码缓存失败: {str(e)}")
+
+    async def get_or_fetch(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+        ttl_for: Callable[[Dict[str, Any]], Optional[float]]
+    ) -> Dict[str, Any]:
+        """读取缓存，未命中时调用fetch并按ttl_for返回的时间缓存结果（返回None表示不缓存）"""
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = asyncio.ensure_future(self._load(key, fetch, ttl_for))
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # shield：某个等待者被取消时不影响其他等待同一结果的请求
+        return await asyncio.shield(future)
+
+    async def _load(
+        self,
+        key: str,
+        fetch: Callable[[], Awaitable[Dict[str, Any]]],
+        ttl_for: Callable[[Dict[str, Any]], Optional[float]]
+    ) -> Dict[str, Any]:
+        value = await self.get(key)
+        if value is not None:
+            return value
+
+        value = await fetch()
+        ttl = ttl_for(value)
+        if ttl is not None:
+            await self.set(key, value, ttl)
+        return value
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats(),
+            "coalesced": self.coalesced
+        }
+
+    def close(self):
+        self.disk.close()
+
+# 创建全局地理编码缓存实例（未启用时为None）
+geocode_cache = GeocodeCache(
+    path=settings.GEOCODE_CACHE_PATH,
+    memory_maxsize=settings.GEOCODE_CACHE_MEMORY_MAXSIZE,
+    disk_maxsize=settings.GEOCODE_CACHE_DISK_MAXSIZE,
+    ttl=settings.GEOCODE_CACHE_TTL,
+    coord_precision=settings.GEOCODE_COORD_PRECISION
+) if settings.GEOCODE_CACHE_ENABLED else None
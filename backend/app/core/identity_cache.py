@@ -0,0 +1,86 @@
+import json
+import logging
+from typing import Any, Dict, Optional
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class UserIdentityCache:
+    """已验证用户身份缓存 - 以token subject（用户名）为键缓存users行
+
+    默认使用进程内TTL+LRU缓存；配置IDENTITY_CACHE_REDIS_URL后改用Redis作为共享存储，
+    这样多worker部署时任意worker上的失效操作都能立即对其他worker生效。
+    """
+
+    KEY_PREFIX = "identity:"
+
+    def __init__(self, maxsize: int, ttl: int, redis_url: Optional[str] = None):
+        self.ttl = ttl
+        self.local = TTLCache(maxsize, ttl)
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self._redis = None
+
+        if redis_url:
+            try:
+                import redis.asyncio as redis
+                self._redis = redis.from_url(redis_url, decode_responses=True)
+            except ImportError:
+                logger.warning("未安装redis依赖，身份缓存退回进程内存储")
+
+    async def get(self, subject: str) -> Optional[Dict[str, Any]]:
+        if self._redis is None:
+            return self.local.get(subject)
+
+        try:
+            raw = await self._redis.get(self.KEY_PREFIX + subject)
+        except Exception as e:
+            logger.warning(f"读取共享身份缓存失败: {str(e)}")
+            self.shared_misses += 1
+            return None
+
+        if raw is None:
+            self.shared_misses += 1
+            return None
+        self.shared_hits += 1
+        return json.loads(raw)
+
+    async def set(self, subject: str, user: Dict[str, Any]):
+        if self._redis is None:
+            self.local.set(subject, user)
+            return
+
+        try:
+            await self._redis.set(self.KEY_PREFIX + subject, json.dumps(user, default=str), ex=self.ttl)
+        except Exception as e:
+            logger.warning(f"写入共享身份缓存失败: {str(e)}")
+
+    async def invalidate(self, subject: str):
+        """使某个用户的缓存失效（资料更新、登出时调用）"""
+        self.local.delete(subject)
+        if self._redis is not None:
+            try:
+                await self._redis.delete(self.KEY_PREFIX + subject)
+            except Exception as e:
+                logger.warning(f"删除共享身份缓存失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """命中/未命中统计"""
+        if self._redis is None:
+            return {"backend": "local", **self.local.stats()}
+
+        total = self.shared_hits + self.shared_misses
+        return {
+            "backend": "redis",
+            "hits": self.shared_hits,
+            "misses": self.shared_misses,
+            "hit_rate": round(self.shared_hits / total, 4) if total else 0.0
+        }
+
+# 创建全局身份缓存实例
+identity_cache = UserIdentityCache(
+    maxsize=settings.IDENTITY_CACHE_MAXSIZE,
+    ttl=settings.IDENTITY_CACHE_TTL,
+    redis_url=settings.IDENTITY_CACHE_REDIS_URL
+)
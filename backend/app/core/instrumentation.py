@@ -0,0 +1,101 @@
+import time
+from typing import Any, Callable, Dict
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from app.core.metrics import metrics
+
+http_request_seconds = metrics.histogram(
+    "http_request_duration_seconds",
+    "HTTP请求处理耗时（秒），按路由模板统计",
+    labelnames=("method", "route")
+)
+http_requests_total = metrics.counter(
+    "http_requests_total",
+    "HTTP请求数，按状态码统计",
+    labelnames=("method", "route", "status")
+)
+http_requests_in_flight = metrics.gauge(
+    "http_requests_in_flight",
+    "正在处理的HTTP请求数"
+)
+http_request_exceptions = metrics.counter(
+    "http_request_exceptions_total",
+    "处理过程中抛出未捕获异常的请求数",
+    labelnames=("method", "route")
+)
+websocket_connections = metrics.gauge(
+    "websocket_connections",
+    "当前打开的WebSocket连接数",
+    labelnames=("route",)
+)
+
+class MetricsMiddleware:
+    """请求级指标中间件（纯ASGI实现，不缓冲响应体，流式响应和WebSocket不受影响）
+
+    路由标签使用路由模板（如/api/v1/trips/{trip_id}）而不是实际路径，避免标签基数随ID增长；
+    未匹配任何路由的请求统一记为"unmatched"。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self._routes: Dict[Callable[..., Any], str] = {}
+
+    def _route_template(self, scope: Scope) -> str:
+        # starlette 0.27在路由匹配后只把endpoint写入scope，按endpoint反查路由模板
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if not self._routes:
+            for route in scope["app"].routes:
+                self._routes.setdefault(getattr(route, "endpoint", None), getattr(route, "path", "unmatched"))
+        return self._routes.get(endpoint, "unmatched")
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] == "websocket":
+            await self._websocket(scope, receive, send)
+            return
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            with metrics.span(f"{method} {scope['path']}", **{"http.method": method}) as span:
+                await self.app(scope, receive, send_wrapper)
+                if span is not None:
+                    span.set_attribute("http.route", self._route_template(scope))
+                    span.set_attribute("http.status_code", status_code)
+        except Exception:
+            http_request_exceptions.inc(method=method, route=self._route_template(scope))
+            raise
+        finally:
+            http_requests_in_flight.dec()
+            route = self._route_template(scope)
+            http_request_seconds.observe(time.perf_counter() - start, method=method, route=route)
+            http_requests_total.inc(method=method, route=route, status=str(status_code))
+
+    async def _websocket(self, scope: Scope, receive: Receive, send: Send):
+        route = None
+
+        async def receive_wrapper() -> Message:
+            nonlocal route
+            # 第一次接收消息时路由已经匹配完成
+            if route is None:
+                route = self._route_template(scope)
+                websocket_connections.inc(route=route)
+            return await receive()
+
+        try:
+            await self.app(scope, receive_wrapper, send)
+        finally:
+            if route is not None:
+                websocket_connections.dec(route=route)
@@ -0,0 +1,433 @@
+import numpy as np
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+EARTH_RADIUS_KM = 6371.0
+# 直线距离换算为道路距离的经验系数，用于估算交通时间
+ROAD_DISTANCE_FACTOR = 1.3
+# 晚于营业时间每分钟的惩罚（远大于交通时间，优先满足营业时间）
+LATE_PENALTY = 1000.0
+# 改进量小于该值视为没有改进，避免浮点误差导致死循环
+EPSILON = 1e-9
+MAX_PASSES = 50
+# Or-opt移动的最大片段长度
+OR_OPT_MAX_SEGMENT = 3
+# 营业时间修复的轮数，以及每个站点精确计算代价的候选插入位置数
+REPAIR_PASSES = 3
+REPAIR_CANDIDATES = 8
+
+def parse_location(location: str) -> Tuple[float, float]:
+    """解析"经度,纬度"坐标"""
+    lng, lat = location.split(",")
+    return float(lng), float(lat)
+
+def parse_clock(text: Optional[str]) -> Optional[float]:
+    """将"HH:MM"转换为当天的分钟数"""
+    if not text:
+        return None
+    hours, minutes = text.split(":")
+    return int(hours) * 60 + int(minutes)
+
+def format_clock(minutes: float) -> str:
+    """将分钟数格式化为"HH:MM"，超过24点时继续累加（如"25:30"）"""
+    minutes = int(round(minutes))
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def haversine_matrix(coords: np.ndarray) -> np.ndarray:
+    """计算坐标两两之间的球面距离（公里），coords为(n, 2)的[经度, 纬度]数组"""
+    radians = np.radians(coords)
+    lng = radians[:, 0]
+    lat = radians[:, 1]
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+def tour_cost(tour: Sequence[int], cost: np.ndarray) -> float:
+    """闭合路线的总代价（tour[0]为出发点）"""
+    tour = np.asarray(tour)
+    return float(cost[tour, np.roll(tour, -1)].sum())
+
+def nearest_neighbor_tour(cost: np.ndarray) -> List[int]:
+    """最近邻构造初始路线，从节点0（出发点）开始"""
+    size = len(cost)
+    visited = np.zeros(size, dtype=bool)
+    visited[0] = True
+    tour = [0]
+    for _ in range(size - 1):
+        row = np.where(visited, np.inf, cost[tour[-1]])
+        nxt = int(np.argmin(row))
+        visited[nxt] = True
+        tour.append(nxt)
+    return tour
+
+def two_opt(tour: List[int], cost: np.ndarray) -> List[int]:
+    """2-opt：反转路线片段消除交叉，对每个i向量化计算所有j的改进量
+
+    要求除进出节点0的边外代价对称（片段反转不改变片段内部代价）。
+    """
+    tour = np.array(tour)
+    size = len(tour)
+    if size < 4:
+        return tour.tolist()
+
+    for _ in range(MAX_PASSES):
+        improved = False
+        for i in range(1, size - 1):
+            j = np.arange(i + 1, size)
+            a, b = tour[i - 1], tour[i]
+            c = tour[j]
+            d = tour[(j + 1) % size]
+            delta = cost[a, c] + cost[b, d] - cost[a, b] - cost[c, d]
+            best = int(np.argmin(delta))
+            if delta[best] < -EPSILON:
+                k = j[best]
+                tour[i:k + 1] = tour[i:k + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return tour.tolist()
+
+def or_opt(tour: List[int], cost: np.ndarray) -> List[int]:
+    """Or-opt：把长度1~3的片段（可反向）移动到路线其他位置，向量化计算所有插入位置的改进量
+
+    使用"don't look bits"：某个片段找不到改进后不再检查，直到其附近的路线发生变化，
+    第一轮之后的扫描几乎不产生开销。
+    """
+    tour = np.array(tour)
+    size = len(tour)
+    if size < 4:
+        return tour.tolist()
+
+    # active[length][node]：以node开头、长度为length的片段是否需要检查
+    active = np.ones((OR_OPT_MAX_SEGMENT + 1, size), dtype=bool)
+    nxt_tour = np.roll(tour, -1)
+    edge_cost = cost[tour, nxt_tour]
+
+    for _ in range(MAX_PASSES):
+        improved = False
+        for length in range(1, OR_OPT_MAX_SEGMENT + 1):
+            i = 1
+            while i + length <= size:
+                if not active[length, tour[i]]:
+                    i += 1
+                    continue
+
+                first, last = tour[i], tour[i + length - 1]
+                prev, nxt = tour[i - 1], tour[(i + length) % size]
+                removal_gain = cost[prev, first] + cost[last, nxt] - cost[prev, nxt]
+
+                # 第k条边为tour[k] -> tour[k+1]，插入到该边中间
+                forward = cost[tour, first] + cost[last, nxt_tour] - edge_cost
+                backward = cost[tour, last] + cost[first, nxt_tour] - edge_cost
+                # 与片段相连的边不能作为插入位置
+                forward[i - 1:i + length] = np.inf
+                backward[i - 1:i + length] = np.inf
+
+                best_forward = int(np.argmin(forward))
+                best_backward = int(np.argmin(backward))
+                if forward[best_forward] <= backward[best_backward]:
+                    k, delta, reverse = best_forward, forward[best_forward], False
+                else:
+                    k, delta, reverse = best_backward, backward[best_backward], True
+
+                if delta - removal_gain >= -EPSILON:
+                    active[length, first] = False
+                    i += 1
+                    continue
+
+                touched = [prev, nxt, first, last, tour[k], nxt_tour[k]]
+                segment = tour[i:i + length]
+                if reverse:
+                    segment = segment[::-1]
+                if k < i:
+                    tour = np.concatenate([tour[:k + 1], segment, tour[k + 1:i], tour[i + length:]])
+                else:
+                    tour = np.concatenate([tour[:i], tour[i + length:k + 1], segment, tour[k + 1:]])
+                nxt_tour = np.roll(tour, -1)
+                edge_cost = cost[tour, nxt_tour]
+                active[:, touched] = True
+                improved = True
+        if not improved:
+            break
+    return tour.tolist()
+
+class Schedule:
+    """按路线顺序排列的时间表（位置0为出发点），各字段为与路线等长的NumPy数组
+
+    step为每个位置的代价：到达该站的交通时间 + 等待时间 + LATE_PENALTY * 迟到分钟数。
+    """
+
+    def __init__(self, nodes, arrive, begin, depart, step):
+        self.nodes, self.arrive, self.begin, self.depart, self.step = nodes, arrive, begin, depart, step
+
+    @property
+    def cost(self) -> float:
+        return float(self.step.sum())
+
+    def violations(self, close_at: np.ndarray) -> List[int]:
+        """需要等待开门或晚于关门时间的站点"""
+        mask = (self.begin > self.arrive) | (self.depart > close_at[self.nodes])
+        mask[0] = False
+        return self.nodes[mask].tolist()
+
+    def concat(self, *parts: "Schedule") -> "Schedule":
+        return Schedule(*(np.concatenate([getattr(part, name) for part in (self, *parts)]) for name in Schedule.FIELDS))
+
+    def slice(self, start: int, stop: Optional[int] = None) -> "Schedule":
+        return Schedule(*(getattr(self, name)[start:stop] for name in Schedule.FIELDS))
+
+Schedule.FIELDS = ("nodes", "arrive", "begin", "depart", "step")
+
+def build_schedule(
+    tour: Sequence[int],
+    travel_minutes: np.ndarray,
+    stay: np.ndarray,
+    open_at: np.ndarray,
+    close_at: np.ndarray,
+    start_time: float
+) -> Schedule:
+    """按路线顺序逐站推算时间表"""
+    nodes = np.asarray(tour)
+    arrive, begin, depart = (np.full(len(nodes), float(start_time)) for _ in range(3))
+    legs = travel_minutes[nodes[:-1], nodes[1:]]
+    for index in range(1, len(nodes)):
+        arrive[index] = depart[index - 1] + legs[index - 1]
+        begin[index] = max(arrive[index], open_at[nodes[index]])
+        depart[index] = begin[index] + stay[nodes[index]]
+    step = np.zeros(len(nodes))
+    step[1:] = legs + (begin[1:] - arrive[1:]) + LATE_PENALTY * np.maximum(depart[1:] - close_at[nodes[1:]], 0.0)
+    return Schedule(nodes, arrive, begin, depart, step)
+
+def shift_schedule(suffix: Schedule, delta: float, leg_change: float, open_at: np.ndarray, close_at: np.ndarray) -> Schedule:
+    """路线片段的到达时间整体变化delta（前面插入或删除了站点）后的时间表，leg_change为到达第一站的交通时间变化
+
+    推迟到达时，推迟的时间先被各站的等待抵消，离开时间推迟max(delta - 累计等待, 0)；
+    提前到达时，遇到需要等待开门的站点后不再提前，离开时间变化为max(delta, 各站min(开门 - 到达, 0)的前缀最大值)。
+    两种情况都是NumPy前缀运算，不需要逐站模拟。
+    """
+    if not len(suffix.nodes):
+        return suffix
+    nodes, arrive, begin, depart = suffix.nodes, suffix.arrive, suffix.begin, suffix.depart
+    if delta >= 0:
+        shift = np.maximum(delta - np.cumsum(begin - arrive), 0.0)
+    else:
+        shift = np.maximum(delta, np.maximum.accumulate(np.minimum(open_at[nodes] - arrive, 0.0)))
+    incoming = np.concatenate(([delta], shift[:-1]))
+    close = close_at[nodes]
+    new_depart = depart + shift
+    step = suffix.step + (shift - incoming) + LATE_PENALTY * (
+        np.maximum(new_depart - close, 0.0) - np.maximum(depart - close, 0.0)
+    )
+    step[0] += leg_change
+    return Schedule(nodes, arrive + incoming, begin + shift, new_depart, step)
+
+def remove_stop(
+    schedule: Schedule,
+    index: int,
+    travel_minutes: np.ndarray,
+    open_at: np.ndarray,
+    close_at: np.ndarray
+) -> Schedule:
+    """去掉位置index的站点后的时间表"""
+    prefix = schedule.slice(0, index)
+    suffix = schedule.slice(index + 1)
+    if not len(suffix.nodes):
+        return prefix
+    previous, node, following = schedule.nodes[index - 1], schedule.nodes[index], suffix.nodes[0]
+    leg = travel_minutes[previous, following]
+    delta = schedule.depart[index - 1] + leg - suffix.arrive[0]
+    return prefix.concat(shift_schedule(suffix, delta, leg - travel_minutes[node, following], open_at, close_at))
+
+def insert_stop(
+    schedule: Schedule,
+    index: int,
+    node: int,
+    travel_minutes: np.ndarray,
+    stay: np.ndarray,
+    open_at: np.ndarray,
+    close_at: np.ndarray
+) -> Schedule:
+    """把站点插入到位置index（原来index及之后的站点后移）后的时间表"""
+    previous = schedule.nodes[index - 1]
+    leg = travel_minutes[previous, node]
+    arrival = schedule.depart[index - 1] + leg
+    begin = max(arrival, open_at[node])
+    depart = begin + stay[node]
+    step = leg + begin - arrival + LATE_PENALTY * max(depart - close_at[node], 0.0)
+    inserted = Schedule(*(np.array([value]) for value in (node, arrival, begin, depart, step)))
+
+    suffix = schedule.slice(index)
+    if len(suffix.nodes):
+        following = suffix.nodes[0]
+        delta = depart + travel_minutes[node, following] - suffix.arrive[0]
+        leg_change = travel_minutes[node, following] - travel_minutes[previous, following]
+        suffix = shift_schedule(suffix, delta, leg_change, open_at, close_at)
+    return schedule.slice(0, index).concat(inserted, suffix)
+
+def estimate_insertions(
+    rest: Schedule,
+    node: int,
+    travel_minutes: np.ndarray,
+    stay: np.ndarray,
+    open_at: np.ndarray,
+    close_at: np.ndarray
+) -> np.ndarray:
+    """估算把站点插入到rest每个位置（1..len）后的总代价，O(1)/位置，全部位置一起向量化计算
+
+    站点本身和插入点后一站的代价变化是精确的；再往后推迟的时间先被各站的等待抵消（精确），
+    新增的迟到按时间余量估算（余量 = 之后各站的等待时间 + 离关门的剩余时间，推迟不超过余量时不会迟到）。
+    距离满足三角不等式，插入站点只会推迟后面的站点，估算的迟到不会多于实际，估算值是总代价的下界。
+    """
+    nodes, arrive, begin, depart = rest.nodes, rest.arrive, rest.begin, rest.depart
+    leg_in = travel_minutes[nodes, node]
+    node_arrival = depart + leg_in
+    node_begin = np.maximum(node_arrival, open_at[node])
+    node_depart = node_begin + stay[node]
+    estimate = rest.cost + leg_in + node_begin - node_arrival + LATE_PENALTY * np.maximum(node_depart - close_at[node], 0.0)
+
+    following = nodes[1:]
+    close = close_at[following]
+    following_arrival = node_depart[:-1] + travel_minutes[node, following]
+    following_begin = np.maximum(following_arrival, open_at[following])
+    following_depart = following_begin + stay[following]
+    estimate[:-1] += (
+        travel_minutes[node, following] - travel_minutes[nodes[:-1], following]
+        + (following_begin - following_arrival) - (begin[1:] - arrive[1:])
+        + LATE_PENALTY * (np.maximum(following_depart - close, 0.0) - np.maximum(depart[1:] - close, 0.0))
+    )
+
+    # slack[k] = min_{j>=k}(位置k..j的等待之和 + 位置j离关门的剩余时间)：到达位置k推迟不超过slack[k]时后续不会迟到
+    waits = np.cumsum(begin - arrive)
+    waits_before = np.concatenate(([0.0], waits[:-1]))
+    room = np.maximum(close_at[nodes] - depart, 0.0)
+    slack = np.minimum.accumulate((waits + room)[::-1])[::-1] - waits_before
+    # 已经迟到的站点，在遇到下一个需要等待的站点前，每一站都会再迟到同样的时间
+    size = len(nodes)
+    late = np.cumsum(np.concatenate(([0], depart > close_at[nodes])))
+    next_wait = np.minimum.accumulate(np.where(begin > arrive, np.arange(size), size)[::-1])[::-1]
+    late_in_row = late[next_wait[2:]] - late[2:size]
+
+    delay = following_depart[:-1] - depart[1:-1]
+    estimate[:-2] += (
+        LATE_PENALTY * np.maximum(np.maximum(delay - slack[2:], 0.0), delay * late_in_row)
+        - np.minimum(delay, waits[-1] - waits_before[2:])
+    )
+    return estimate
+
+def repair_time_windows(
+    tour: List[int],
+    travel_minutes: np.ndarray,
+    stay: np.ndarray,
+    open_at: np.ndarray,
+    close_at: np.ndarray,
+    start_time: float
+) -> List[int]:
+    """营业时间修复：把需要等待或迟到的站点移动到其他位置，接受使总代价下降的移动
+
+    代价 = 交通时间 + 等待时间 + LATE_PENALTY * 迟到分钟数。
+    对每个违反营业时间的站点，先向量化估算插入到每个位置的代价（下界），再按下界从小到大、
+    最多对REPAIR_CANDIDATES个位置计算精确代价，选其中最好的；删除、插入站点后的时间表都由前缀运算得到（见shift_schedule），不逐站模拟。
+    """
+    schedule = build_schedule(tour, travel_minutes, stay, open_at, close_at, start_time)
+    best_cost = schedule.cost
+    violations = schedule.violations(close_at)
+    for _ in range(REPAIR_PASSES):
+        improved = False
+        for node in dict.fromkeys(violations):
+            index = int(np.flatnonzero(schedule.nodes == node)[0])
+            rest = remove_stop(schedule, index, travel_minutes, open_at, close_at)
+            estimate = estimate_insertions(rest, node, travel_minutes, stay, open_at, close_at)
+
+            # 按下界从小到大计算精确代价，下界不低于已找到的最好结果时停止
+            candidates = np.flatnonzero(estimate < best_cost - EPSILON)
+            best_candidate = None
+            for index in candidates[np.argsort(estimate[candidates])][:REPAIR_CANDIDATES]:
+                if best_candidate is not None and estimate[index] >= best_candidate.cost - EPSILON:
+                    break
+                candidate = insert_stop(rest, int(index) + 1, node, travel_minutes, stay, open_at, close_at)
+                if candidate.cost < best_cost - EPSILON and (best_candidate is None or candidate.cost < best_candidate.cost):
+                    best_candidate = candidate
+            if best_candidate is not None:
+                schedule, best_cost = best_candidate, best_candidate.cost
+                improved = True
+        violations = schedule.violations(close_at)
+        if not improved or not violations:
+            break
+    return schedule.nodes.tolist()
+
+def optimize_day(
+    stops: List[Dict[str, Any]],
+    start_location: Optional[str] = None,
+    start_time: str = "09:00",
+    speed_kmh: float = 30.0,
+    return_to_start: bool = False
+) -> Dict[str, Any]:
+    """优化一天内的游览顺序
+
+    stops中每个站点需要location（"经度,纬度"），可选stay_minutes、open_time、close_time。
+    流程：NumPy向量化计算球面距离矩阵 → 最近邻构造 → 2-opt与Or-opt交替改进 → 营业时间修复。
+    未提供出发点时路线起点不固定；return_to_start为False时不计算返回出发点的距离。
+    """
+    count = len(stops)
+    coords = [parse_location(stop["location"]) for stop in stops]
+    has_start = start_location is not None
+    # 节点0为出发点：未提供出发点时使用虚拟节点，到任何站点的代价都为0
+    coords = [parse_location(start_location) if has_start else (0.0, 0.0)] + coords
+
+    distance = haversine_matrix(np.array(coords, dtype=float))
+    if not has_start:
+        distance[0, :] = 0.0
+        distance[:, 0] = 0.0
+    elif not return_to_start:
+        distance[:, 0] = 0.0
+
+    travel_minutes = distance * ROAD_DISTANCE_FACTOR / speed_kmh * 60
+    stay = np.array([0.0] + [float(stop.get("stay_minutes") or 0) for stop in stops])
+    open_at = np.array([0.0] + [parse_clock(stop.get("open_time")) or 0.0 for stop in stops])
+    close_at = np.array([np.inf] + [
+        parse_clock(stop.get("close_time")) if stop.get("close_time") else np.inf for stop in stops
+    ])
+    start_minutes = parse_clock(start_time)
+
+    original = list(range(count + 1))
+    tour = nearest_neighbor_tour(distance)
+    for _ in range(MAX_PASSES):
+        previous_cost = tour_cost(tour, distance)
+        tour = or_opt(two_opt(tour, distance), distance)
+        if tour_cost(tour, distance) >= previous_cost - EPSILON:
+            break
+
+    if np.isfinite(close_at).any() or open_at.any():
+        tour = repair_time_windows(tour, travel_minutes, stay, open_at, close_at, start_minutes)
+
+    # 生成时间表
+    schedule = []
+    clock = start_minutes
+    previous = 0
+    for node in tour[1:]:
+        leg_km = float(distance[previous, node])
+        leg_minutes = float(travel_minutes[previous, node])
+        clock += leg_minutes
+        wait = max(open_at[node] - clock, 0.0)
+        clock += wait
+        arrival = clock
+        clock += stay[node]
+        stop = stops[node - 1]
+        schedule.append({
+            **stop,
+            "original_index": node - 1,
+            "arrival_time": format_clock(arrival),
+            "departure_time": format_clock(clock),
+            "distance_km": round(leg_km, 3),
+            "travel_minutes": round(leg_minutes, 1),
+            "wait_minutes": round(float(wait), 1),
+            "late": bool(clock > close_at[node])
+        })
+        previous = node
+
+    return {
+        "stops": schedule,
+        "total_distance_km": round(tour_cost(tour, distance), 3),
+        "original_distance_km": round(tour_cost(original, distance), 3),
+        "late_count": sum(1 for stop in schedule if stop["late"])
+    }
@@ -0,0 +1,265 @@
+import re
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, List, Optional
+from pydantic import ValidationError
+from app.core import requirements_parser
+from app.schemas.trip import ItineraryActivity, ItineraryDay, MAX_ACTIVITY_COST
+
+logger = logging.getLogger(__name__)
+
+# 模型常把JSON包在```json ... ```代码块里
+CODE_FENCE_PATTERN = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL | re.IGNORECASE)
+# 对象/数组最后一个元素后多余的逗号
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+# 费用文本中的第一个数字，如"约200元"、"150-200元/人"
+COST_NUMBER_PATTERN = re.compile(r"\d+(?:\.\d+)?")
+FREE_COST_WORDS = ("免费", "免门票", "无需门票")
+# 天数文本，如"第3天"、"Day 3"、"D3"
+DAY_NUMBER_PATTERN = re.compile(r"(?:第\s*([0-9一二三四五六七八九十]+)\s*天|(?:day|d)\s*(\d+))", re.IGNORECASE)
+
+# 字段别名：模型不一定严格使用要求的字段名
+DAY_LIST_KEYS = ("days", "itinerary", "daily_plan", "schedule")
+ACTIVITY_LIST_KEYS = ("activities", "items", "schedule", "spots")
+ACTIVITY_NAME_KEYS = ("name", "place", "title", "activity", "spot")
+
+def extract_json_object(text: str) -> Optional[Any]:
+    """从模型输出中提取JSON，容忍代码块、前后说明文字和多余的逗号，无法解析时返回None"""
+    if not text:
+        return None
+
+    candidates = [text]
+    fence = CODE_FENCE_PATTERN.search(text)
+    if fence:
+        candidates.insert(0, fence.group(1))
+
+    for candidate in candidates:
+        candidate = candidate.strip()
+        start = candidate.find("{")
+        end = candidate.rfind("}")
+        if start == -1 or end <= start:
+            continue
+        body = candidate[start:end + 1]
+        for attempt in (body, TRAILING_COMMA_PATTERN.sub(r"\1", body)):
+            try:
+                return json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+    return None
+
+def _first(raw: Dict[str, Any], keys) -> Any:
+    for key in keys:
+        value = raw.get(key)
+        if value not in (None, "", []):
+            return value
+    return None
+
+def _text(value: Any, limit: Optional[int] = None) -> Optional[str]:
+    """转为去除首尾空白的文本，超出长度上限时截断（而不是让整项校验失败）"""
+    if value is None:
+        return None
+    value = str(value).strip()[:limit]
+    return value or None
+
+def _coerce_cost(value: Any) -> Optional[Decimal]:
+    """解析费用：数字，或"约200元"、"免费"这类文本；无法解析或超出上限时返回None"""
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        cost = Decimal(str(value)) if value >= 0 else None
+    else:
+        text = str(value)
+        if any(word in text for word in FREE_COST_WORDS):
+            return Decimal(0)
+        match = COST_NUMBER_PATTERN.search(text.replace(",", ""))
+        if not match:
+            return None
+        try:
+            cost = Decimal(match.group())
+        except InvalidOperation:
+            return None
+    return cost if cost is not None and cost.is_finite() and cost <= MAX_ACTIVITY_COST else None
+
+def _coerce_location(value: Any) -> Optional[str]:
+    """解析坐标为"经度,纬度"：支持"116.39,39.90"、[116.39, 39.90]和{"lng":..,"lat":..}，超出范围时返回None"""
+    try:
+        if isinstance(value, str):
+            lng, lat = (float(part) for part in value.replace("，", ",").split(","))
+        elif isinstance(value, (list, tuple)) and len(value) == 2:
+            lng, lat = float(value[0]), float(value[1])
+        elif isinstance(value, dict):
+            lng = float(value.get("lng", value.get("longitude")))
+            lat = float(value.get("lat", value.get("latitude")))
+        else:
+            return None
+    except (TypeError, ValueError):
+        return None
+    if not (-180 <= lng <= 180 and -90 <= lat <= 90):
+        return None
+    return f"{lng:.6f},{lat:.6f}"
+
+def parse_activity(raw: Any) -> Optional[ItineraryActivity]:
+    """把模型输出的一项活动校验为ItineraryActivity，缺少名称等无法修复的情况返回None"""
+    if isinstance(raw, str):
+        raw = {"name": raw}
+    if not isinstance(raw, dict):
+        return None
+    try:
+        return ItineraryActivity(
+            time=_text(raw.get("time"), 20),
+            name=_text(_first(raw, ACTIVITY_NAME_KEYS), 200) or "",
+            description=_text(raw.get("description"), 2000),
+            address=_text(raw.get("address"), 300),
+            location=_coerce_location(raw.get("location")),
+            cost=_coerce_cost(raw.get("cost")),
+            category=_text(raw.get("category") or raw.get("type"), 20)
+        )
+    except ValidationError:
+        return None
+
+def _day_number(value: Any, default: int) -> int:
+    if isinstance(value, int) and not isinstance(value, bool) and value >= 1:
+        return value
+    text = str(value or "").strip()
+    if text.isdigit() and int(text) >= 1:
+        return int(text)
+    match = DAY_NUMBER_PATTERN.search(text)
+    if match:
+        number = match.group(2) or match.group(1)
+        parsed = int(number) if number.isdigit() else requirements_parser.parse_chinese_integer(number)
+        if parsed:
+            return parsed
+    return default
+
+def parse_day(raw_day: Any, default: int) -> Optional[ItineraryDay]:
+    """校验一天的行程，缺少天数时使用default；无效的活动被丢弃，整天无效时返回None"""
+    if not isinstance(raw_day, dict):
+        return None
+    raw_activities = _first(raw_day, ACTIVITY_LIST_KEYS) or []
+    activities = [
+        activity for activity in map(parse_activity, raw_activities if isinstance(raw_activities, list) else [])
+        if activity is not None
+    ]
+    try:
+        return ItineraryDay(
+            day=_day_number(raw_day.get("day"), default),
+            title=_text(raw_day.get("title") or raw_day.get("theme"), 200),
+            summary=_text(raw_day.get("summary"), 2000),
+            activities=activities
+        )
+    except ValidationError:
+        return None
+
+def parse_itinerary(data: Any) -> List[ItineraryDay]:
+    """把模型输出的JSON校验为按天排列的结构化行程
+
+    逐项校验：无效的活动被丢弃而不是让整份行程失败；缺少天数时按出现顺序编号，
+    重复的天数只保留第一次出现的。
+    """
+    if isinstance(data, dict):
+        data = _first(data, DAY_LIST_KEYS)
+    if not isinstance(data, list):
+        return []
+
+    days: Dict[int, ItineraryDay] = {}
+    dropped = 0
+    for index, raw_day in enumerate(data, start=1):
+        day = parse_day(raw_day, index)
+        if day is None or day.day in days:
+            continue
+        raw_activities = _first(raw_day, ACTIVITY_LIST_KEYS)
+        dropped += (len(raw_activities) if isinstance(raw_activities, list) else 0) - len(day.activities)
+        days[day.day] = day
+
+    if dropped:
+        logger.info(f"结构化行程中丢弃了{dropped}项无效活动")
+    return [days[number] for number in sorted(days)]
+
+class DayStreamScanner:
+    """从流式生成的JSON行程中，逐个取出已经生成完整的一天
+
+    逐字符跟踪括号层级和字符串状态（只扫描新增的部分），顶层对象中days等数组里的对象闭合时
+    即得到一天的完整JSON，不需要等待整份行程生成结束。
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._position = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._array_key: Optional[str] = None
+        self._day_start: Optional[int] = None
+
+    @property
+    def in_day(self) -> bool:
+        """是否正在生成某一天"""
+        return self._day_start is not None
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """追加新生成的文本，返回其中完成的各天（原始JSON对象）"""
+        self.buffer += text
+        days = []
+        while self._position < len(self.buffer):
+            index = self._position
+            char = self.buffer[index]
+            self._position += 1
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if len(self._stack) == 1:
+                        self._last_string = self.buffer[self._string_start:index]
+            elif not self._stack and char != "{":
+                # 第一个{之前的说明文字、代码块标记
+                continue
+            elif char == '"':
+                self._in_string = True
+                self._string_start = index + 1
+            elif char in "{[":
+                if char == "[" and len(self._stack) == 1:
+                    self._array_key = self._last_string
+                elif char == "{" and self._stack == ["{", "["] and self._array_key in DAY_LIST_KEYS:
+                    self._day_start = index
+                self._stack.append(char)
+            elif char in "}]" and self._stack:
+                self._stack.pop()
+                if char == "}" and self._day_start is not None and len(self._stack) == 2:
+                    raw_day = extract_json_object(self.buffer[self._day_start:index + 1])
+                    self._day_start = None
+                    if isinstance(raw_day, dict):
+                        days.append(raw_day)
+        return days
+
+def render_itinerary_text(days: List[ItineraryDay], overview: Optional[str] = None, tips: Optional[List[str]] = None) -> str:
+    """把结构化行程渲染为按天分段的文本（兼容只展示plan文本的客户端）"""
+    lines: List[str] = []
+    if overview:
+        lines.extend([overview, ""])
+    for day in days:
+        lines.append(f"## 第{day.day}天" + (f"：{day.title}" if day.title else ""))
+        if day.summary:
+            lines.append(day.summary)
+        for activity in day.activities:
+            head = f"- {activity.time} {activity.name}" if activity.time else f"- {activity.name}"
+            if activity.cost == 0:
+                head += "（免费）"
+            elif activity.cost is not None:
+                head += f"（约{activity.cost:g}元）"
+            lines.append(head)
+            if activity.address:
+                lines.append(f"  地址：{activity.address}")
+            if activity.description:
+                lines.append(f"  {activity.description}")
+        lines.append("")
+    if tips:
+        lines.append("## 注意事项")
+        lines.extend(f"- {tip}" for tip in tips)
+    return "\n".join(lines).strip()
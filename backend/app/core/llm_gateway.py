@@ -0,0 +1,211 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, Dict, List, Optional
+from dashscope import Generation
+from app.core.config import settings
+from app.core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# 流式调用从发出请求到收到第一段文本的耗时（用户感知的等待时间）
+llm_first_chunk_seconds = metrics.histogram(
+    "llm_stream_first_chunk_seconds",
+    "流式调用首段文本耗时（秒）",
+    labelnames=("model",)
+)
+
+class LLMGatewayError(Exception):
+    """大模型网关异常基类"""
+
+class LLMRateLimitError(LLMGatewayError):
+    """单个用户同时进行的大模型请求超过上限"""
+
+class LLMTimeoutError(LLMGatewayError):
+    """大模型请求超过截止时间"""
+
+class LLMGateway:
+    """阿里云百炼异步调用网关
+
+    dashscope的Generation.call是同步阻塞调用，这里统一放到专用线程池中执行：
+    - 全局信号量限制同时调用模型的数量（与线程池大小一致）
+    - 按用户限制同时进行的请求数，超出时立即拒绝
+    - 每次调用有截止时间，超时或客户端断开时调用方的协程被取消
+
+    线程中的HTTP请求无法被中断，因此信号量在线程真正结束时才释放，
+    保证被取消的请求也计入全局并发。
+    """
+
+    def __init__(self, max_concurrency: int, max_per_user: int, default_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_per_user = max_per_user
+        self.default_timeout = default_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="dashscope")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._user_inflight: Dict[str, int] = defaultdict(int)
+
+    @asynccontextmanager
+    async def user_slot(self, user_key: Optional[str]):
+        """占用一个用户并发名额，user_key为空时不限制"""
+        if user_key is None:
+            yield
+            return
+
+        if self._user_inflight[user_key] >= self.max_per_user:
+            raise LLMRateLimitError("AI请求过于频繁，请等待当前请求完成后再试")
+
+        self._user_inflight[user_key] += 1
+        try:
+            yield
+        finally:
+            self._user_inflight[user_key] -= 1
+            if self._user_inflight[user_key] <= 0:
+                del self._user_inflight[user_key]
+
+    async def acquire(self, deadline: float):
+        """在截止时间前获取全局并发名额"""
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError("AI服务繁忙，等待超时")
+
+    def release(self):
+        self._semaphore.release()
+
+    async def call(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        api_key: str,
+        user_key: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> Any:
+        """异步调用Generation.call，返回dashscope原始响应"""
+        deadline = time.monotonic() + (timeout or self.default_timeout)
+
+        async with self.user_slot(user_key):
+            await self.acquire(deadline)
+
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self._executor,
+                functools.partial(
+                    Generation.call,
+                    api_key=api_key,
+                    model=model,
+                    messages=messages,
+                    result_format="message",
+                    **kwargs
+                )
+            )
+            # 线程结束时才归还全局名额
+            future.add_done_callback(lambda _: self.release())
+
+            try:
+                # shield：调用方被取消或超时时不影响上面的回调
+                with metrics.track_upstream("dashscope", model):
+                    response = await asyncio.wait_for(
+                        asyncio.shield(future),
+                        timeout=max(deadline - time.monotonic(), 0)
+                    )
+                if getattr(response, "status_code", 200) != 200:
+                    metrics.upstream_errors.inc(service="dashscope", operation=model)
+                return response
+            except asyncio.TimeoutError:
+                logger.warning(f"AI模型调用超时: model={model}")
+                raise LLMTimeoutError("AI服务响应超时，请稍后重试")
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        api_key: str,
+        user_key: Optional[str] = None,
+        timeout: Optional[float] = None,
+        **kwargs
+    ) -> AsyncGenerator[str, None]:
+        """流式调用Generation.call，逐段产出模型新生成的文本
+
+        使用incremental_output，每个响应只包含新增内容。工作线程把内容通过队列交给事件循环；
+        调用方停止迭代（客户端断开、超时）时设置停止标志，线程在下一个分片到达时退出。
+        """
+        deadline = time.monotonic() + (timeout or self.default_timeout)
+
+        async with self.user_slot(user_key):
+            await self.acquire(deadline)
+
+            loop = asyncio.get_running_loop()
+            queue: asyncio.Queue = asyncio.Queue()
+            stop_event = threading.Event()
+            done_marker = object()
+
+            def produce():
+                try:
+                    responses = Generation.call(
+                        api_key=api_key,
+                        model=model,
+                        messages=messages,
+                        result_format="message",
+                        stream=True,
+                        incremental_output=True,
+                        **kwargs
+                    )
+                    for response in responses:
+                        if stop_event.is_set():
+                            break
+                        if response.status_code != 200:
+                            error = LLMGatewayError(f"API调用失败: {response.message}")
+                            loop.call_soon_threadsafe(queue.put_nowait, error)
+                            break
+                        content = response.output.choices[0].message.content
+                        if content:
+                            loop.call_soon_threadsafe(queue.put_nowait, content)
+                except Exception as e:
+                    loop.call_soon_threadsafe(queue.put_nowait, e)
+                finally:
+                    loop.call_soon_threadsafe(queue.put_nowait, done_marker)
+
+            future = loop.run_in_executor(self._executor, produce)
+            future.add_done_callback(lambda _: self.release())
+
+            # 跨yield的生成器不适合使用span上下文，这里直接记录耗时和失败次数
+            operation = f"{model} stream"
+            start = time.perf_counter()
+            first_chunk = True
+            try:
+                while True:
+                    try:
+                        item = await asyncio.wait_for(queue.get(), timeout=max(deadline - time.monotonic(), 0))
+                    except asyncio.TimeoutError:
+                        logger.warning(f"AI模型流式调用超时: model={model}")
+                        metrics.upstream_errors.inc(service="dashscope", operation=operation)
+                        raise LLMTimeoutError("AI服务响应超时，请稍后重试")
+
+                    if item is done_marker:
+                        return
+                    if isinstance(item, Exception):
+                        metrics.upstream_errors.inc(service="dashscope", operation=operation)
+                        raise item
+                    if first_chunk:
+                        llm_first_chunk_seconds.observe(time.perf_counter() - start, model=model)
+                        first_chunk = False
+                    yield item
+            finally:
+                stop_event.set()
+                metrics.upstream_seconds.observe(time.perf_counter() - start, service="dashscope", operation=operation)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+# 创建全局大模型网关实例
+llm_gateway = LLMGateway(
+    max_concurrency=settings.AI_MAX_CONCURRENCY,
+    max_per_user=settings.AI_MAX_CONCURRENCY_PER_USER,
+    default_timeout=settings.AI_REQUEST_TIMEOUT
+)
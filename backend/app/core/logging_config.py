@@ -0,0 +1,114 @@
+import sys
+import json
+import queue
+import random
+import logging
+import logging.handlers
+from typing import Any, Dict, Optional
+from app.core.config import settings
+
+class TextFormatter(logging.Formatter):
+    """文本格式，带会话ID的记录在消息前加上[会话ID]"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        session = getattr(record, "session", None)
+        record.session_tag = f"[{session}] " if session else ""
+        return super().format(record)
+
+class JsonFormatter(logging.Formatter):
+    """每条记录一行JSON，便于日志平台检索"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        session = getattr(record, "session", None)
+        if session:
+            entry["session"] = session
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class SessionLogger(logging.LoggerAdapter):
+    """会话级日志：记录带上会话ID，DEBUG日志只在被抽样的会话中输出
+
+    实时语音等高频路径每秒产生几十条调试日志，全部输出会占用大量CPU和IO。
+    会话开始时按log_sampling.rate决定是否抽样，未抽样会话的DEBUG日志在调用处直接跳过（不格式化消息）。
+    """
+
+    def __init__(self, logger: logging.Logger, session: str, sampled: bool):
+        super().__init__(logger, {"session": session})
+        self.sampled = sampled
+
+    def isEnabledFor(self, level: int) -> bool:
+        if level < logging.INFO and not self.sampled:
+            return False
+        return self.logger.isEnabledFor(level)
+
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {**self.extra, **kwargs.get("extra", {})}
+        return msg, kwargs
+
+class LogSampling:
+    """会话调试日志抽样比例，可在运行时调整"""
+
+    def __init__(self, rate: float):
+        self.rate = rate
+
+    def session_logger(self, logger: logging.Logger, session: str) -> SessionLogger:
+        sampled = self.rate >= 1 or (self.rate > 0 and random.random() < self.rate)
+        return SessionLogger(logger, session, sampled)
+
+# 创建全局会话日志抽样配置
+log_sampling = LogSampling(settings.LOG_SESSION_SAMPLE_RATE)
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+def setup_logging():
+    """配置根日志：调用处只把记录放入队列，由后台线程写到stdout，写日志不阻塞事件循环
+
+    重复调用不会重复添加处理器（热重载时会再次导入main）。
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    handler = logging.StreamHandler(sys.stdout)
+    if settings.LOG_JSON:
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(TextFormatter("%(asctime)s %(levelname)s %(name)s: %(session_tag)s%(message)s"))
+
+    log_queue: queue.Queue = queue.Queue(-1)
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in settings.LOG_LEVELS.items():
+        logging.getLogger(name).setLevel(level.upper())
+
+    _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    _listener.start()
+
+def shutdown_logging():
+    """停止后台写日志线程，写完队列中剩余的记录（应用退出时调用）"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def set_log_level(name: Optional[str], level: str):
+    """运行时调整日志级别，name为空时调整根日志"""
+    logging.getLogger(name or None).setLevel(level.upper())
+
+def get_log_levels() -> Dict[str, Any]:
+    """当前根日志和显式设置过级别的日志的级别"""
+    levels = {"root": logging.getLevelName(logging.getLogger().level)}
+    for name, logger in logging.Logger.manager.loggerDict.items():
+        if isinstance(logger, logging.Logger) and logger.level != logging.NOTSET:
+            levels[name] = logging.getLevelName(logger.level)
+    return {"levels": levels, "session_sample_rate": log_sampling.rate}
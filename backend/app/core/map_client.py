@@ -1,14 +1,117 @@
+import re
 import httpx
 import json
-from typing import Dict, Any, Optional, List, Union
+import hashlib
+import random
+import asyncio
+import logging
+from typing import Dict, Any, Optional, List, Tuple, Union
+from urllib.parse import urlencode
 from app.core.config import settings
+from app.core.geocode_cache import geocode_cache
+from app.core.metrics import metrics
+from app.schemas.map import COORDINATE_PATTERN as COORDINATE_FORMAT
+
+logger = logging.getLogger(__name__)
+
+# 高德返回的限流错误码（请求过于频繁、并发超限），可以稍后重试
+RETRYABLE_INFOCODES = {"10019", "10020", "10021", "10022"}
+
+# "经度,纬度"格式的坐标
+COORDINATE_PATTERN = re.compile(COORDINATE_FORMAT)
 
 class MapClient:
-    """高德地图服务客户端"""
+    """高德地图服务客户端
+    
+    使用长连接的连接池客户端（应用启动时创建、退出时关闭），请求复用TCP/TLS连接，
+    安装h2时启用HTTP/2。网络错误、5xx和高德限流错误按指数退避加随机抖动重试。
+    """
     
     def __init__(self):
         self.api_key = settings.MAP_API_KEY
         self.base_url = "https://restapi.amap.com/v3"
+        self._client: Optional[httpx.AsyncClient] = None
+        # 各接口的读取超时（秒），未列出的接口使用MAP_TIMEOUT
+        self.endpoint_timeouts = {
+            "direction/driving": settings.MAP_ROUTE_TIMEOUT,
+            "distance": settings.MAP_ROUTE_TIMEOUT,
+            "staticmap": settings.MAP_ROUTE_TIMEOUT
+        }
+    
+    async def start(self):
+        """创建连接池客户端（应用启动时调用）"""
+        if self._client is not None:
+            return
+        
+        http2 = settings.MAP_HTTP2
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("未安装h2依赖，高德地图请求使用HTTP/1.1")
+                http2 = False
+        
+        self._client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=http2,
+            limits=httpx.Limits(
+                max_connections=settings.MAP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.MAP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.MAP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(settings.MAP_TIMEOUT, connect=settings.MAP_CONNECT_TIMEOUT)
+        )
+    
+    async def close(self):
+        """关闭连接池（应用退出时调用）"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def _get_client(self) -> httpx.AsyncClient:
+        # 脚本等未经过应用生命周期的场景下按需创建
+        if self._client is None:
+            await self.start()
+        return self._client
+    
+    async def _retry_delay(self, attempt: int):
+        """指数退避 + 全抖动，避免大量请求同时重试"""
+        await asyncio.sleep(random.uniform(0, settings.MAP_RETRY_BACKOFF * (2 ** attempt)))
+    
+    async def _get_with_retry(self, endpoint: str, params: Dict[str, Any], retry_json: bool = True) -> httpx.Response:
+        """发送GET请求，网络错误、5xx/429以及（retry_json时）高德限流错误按退避重试"""
+        client = await self._get_client()
+        timeout = httpx.Timeout(
+            self.endpoint_timeouts.get(endpoint, settings.MAP_TIMEOUT),
+            connect=settings.MAP_CONNECT_TIMEOUT
+        )
+        
+        for attempt in range(settings.MAP_RETRIES + 1):
+            is_last_attempt = attempt == settings.MAP_RETRIES
+            try:
+                # 每次尝试单独计时，重试的请求分别计入耗时和失败次数
+                with metrics.track_upstream("amap", endpoint):
+                    response = await client.get(f"/{endpoint}", params=params, timeout=timeout)
+                    if response.status_code >= 500 or response.status_code == 429:
+                        response.raise_for_status()
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                if is_last_attempt:
+                    raise
+                # HTTPStatusError的消息包含带key的URL，只记录状态码
+                detail = f"HTTP {e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else repr(e)
+                logger.warning(f"高德地图API请求失败，准备重试（第{attempt + 1}次）: {endpoint} {detail}")
+                await self._retry_delay(attempt)
+                continue
+            
+            response.raise_for_status()
+            
+            if retry_json and not is_last_attempt and "json" in response.headers.get("content-type", ""):
+                result = response.json()
+                if result.get("status") == "0" and result.get("infocode") in RETRYABLE_INFOCODES:
+                    logger.warning(f"高德地图API限流，准备重试（第{attempt + 1}次）: {endpoint} {result.get('info')}")
+                    await self._retry_delay(attempt)
+                    continue
+            return response
     
     async def _make_request(self, endpoint: str, params: Dict[str, Any]) -> Dict[str, Any]:
         """发送HTTP请求到高德地图API"""
@@ -16,43 +119,69 @@ class MapClient:
             params["key"] = self.api_key
             params["output"] = "json"
             
-            async with httpx.AsyncClient() as client:
-                response = await client.get(f"{self.base_url}/{endpoint}", params=params)
-                response.raise_for_status()
-                
-                # 对于静态地图，直接返回URL而不是解析JSON
-                if endpoint == "staticmap":
-                    return {
-                        "status": "success",
-                        "image_url": str(response.url)
-                    }
-                
-                return response.json()
+            response = await self._get_with_retry(endpoint, params)
+            result = response.json()
+            if result.get("status") == "0":
+                # 高德业务错误（如key无效、配额用尽）以HTTP 200返回，单独计入失败次数
+                metrics.upstream_errors.inc(service="amap", operation=endpoint)
+            return result
         except Exception as e:
-            print(f"高德地图API请求错误: {str(e)}")
-            return {"status": "0", "info": str(e)}
+            # HTTPStatusError的消息包含带key的URL，只保留状态码
+            detail = f"HTTP {e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else str(e)
+            logger.warning(f"高德地图API请求错误: {endpoint} {detail}")
+            return {"status": "0", "info": detail}
     
-    async def geocode(self, address: str, city: str = None) -> Dict[str, Any]:
-        """地理编码 - 地址转坐标"""
+    @staticmethod
+    def _geocode_cache_ttl(result: Dict[str, Any], data_field: str) -> Optional[float]:
+        """地理编码结果的缓存时间：有结果按正常TTL，查无结果按较短TTL，请求失败不缓存"""
+        if result.get("status") != "1":
+            return None
+        if result.get(data_field):
+            return settings.GEOCODE_CACHE_TTL
+        return settings.GEOCODE_CACHE_NEGATIVE_TTL
+    
+    async def _request_geocode(self, address: str, city: str = None) -> Dict[str, Any]:
+        """地理编码原始请求（经过缓存，并发的相同地址只请求一次）"""
         params = {"address": address}
         if city:
             params["city"] = city
         
-        result = await self._make_request("geocode/geo", params)
+        if geocode_cache is None:
+            return await self._make_request("geocode/geo", params)
+        return await geocode_cache.get_or_fetch(
+            geocode_cache.address_key(address, city),
+            lambda: self._make_request("geocode/geo", params),
+            lambda result: self._geocode_cache_ttl(result, "geocodes")
+        )
+    
+    async def geocode(self, address: str, city: str = None) -> Dict[str, Any]:
+        """地理编码 - 地址转坐标"""
+        result = await self._request_geocode(address, city)
         return self._parse_geocode_result(result)
     
     async def reverse_geocode(self, location: str) -> Dict[str, Any]:
         """逆地理编码 - 坐标转地址"""
         params = {"location": location}
-        result = await self._make_request("geocode/regeo", params)
+        key = geocode_cache.location_key(location) if geocode_cache is not None else None
+        
+        if key is None:
+            result = await self._make_request("geocode/regeo", params)
+        else:
+            result = await geocode_cache.get_or_fetch(
+                key,
+                lambda: self._make_request("geocode/regeo", params),
+                lambda result: self._geocode_cache_ttl(result, "regeocode")
+            )
         return self._parse_reverse_geocode_result(result)
     
     async def route_planning(self, origin: str, destination: str, strategy: int = 0) -> Dict[str, Any]:
         """路径规划 - 支持多种出行方式"""
         try:
-            # 首先将地址转换为坐标
-            origin_coords = await self._address_to_coords(origin)
-            destination_coords = await self._address_to_coords(destination)
+            # 首先将地址转换为坐标（起点和终点同时解析）
+            origin_coords, destination_coords = await asyncio.gather(
+                self._resolve_location(origin),
+                self._resolve_location(destination)
+            )
             
             if not origin_coords or not destination_coords:
                 return {"status": "error", "message": "地址解析失败"}
@@ -65,21 +194,92 @@ class MapClient:
             result = await self._make_request("direction/driving", params)
             return self._parse_route_result(result)
         except Exception as e:
-            print(f"路径规划错误: {str(e)}")
+            logger.warning(f"路径规划错误: {str(e)}")
             return {"status": "error", "message": f"路径规划失败: {str(e)}"}
     
-    async def _address_to_coords(self, address: str) -> str:
+    async def route_matrix(self, stops: List[Dict[str, Any]], distance_type: int = 1) -> Dict[str, Any]:
+        """路线矩阵 - 计算多个站点两两之间的距离和时间
+        
+        stops中每个站点提供location或address（可带city）。地址解析和距离查询都并发进行，
+        同时进行的高德请求数不超过MAP_MATRIX_CONCURRENCY。每个终点调用一次距离测量接口
+        （一次最多100个起点），N个站点共N次请求。
+        """
+        semaphore = asyncio.Semaphore(settings.MAP_MATRIX_CONCURRENCY)
+        locations = await self.resolve_locations(stops, semaphore)
+        size = len(stops)
+        distances: List[List[Optional[int]]] = [[None] * size for _ in range(size)]
+        durations: List[List[Optional[int]]] = [[None] * size for _ in range(size)]
+        resolved = [i for i, location in enumerate(locations) if location]
+        
+        if len(resolved) < 2:
+            return {"status": "error", "message": "地址解析失败，可计算的站点少于2个"}
+        
+        for i in resolved:
+            distances[i][i] = 0
+            durations[i][i] = 0
+        
+        async def fill_column(destination_index: int):
+            origin_indexes = [i for i in resolved if i != destination_index]
+            params = {
+                "origins": "|".join(locations[i] for i in origin_indexes),
+                "destination": locations[destination_index],
+                "type": distance_type
+            }
+            async with semaphore:
+                result = await self._make_request("distance", params)
+            
+            if result.get("status") != "1":
+                logger.warning(f"距离测量失败: {result.get('info')}")
+                return
+            for item in result.get("results", []):
+                # origin_id从1开始，对应origins中的顺序
+                origin_index = origin_indexes[int(item["origin_id"]) - 1]
+                distances[origin_index][destination_index] = int(item["distance"]) if item.get("distance") else None
+                durations[origin_index][destination_index] = int(item["duration"]) if item.get("duration") else None
+        
+        await asyncio.gather(*[fill_column(j) for j in resolved])
+        
+        return {
+            "status": "success",
+            "locations": locations,
+            "distances": distances,
+            "durations": durations,
+            "unresolved": [i for i, location in enumerate(locations) if not location]
+        }
+    
+    async def resolve_locations(
+        self,
+        stops: List[Dict[str, Any]],
+        semaphore: Optional[asyncio.Semaphore] = None
+    ) -> List[Optional[str]]:
+        """并发解析站点坐标：有location的直接使用，否则解析address（可带city），失败为None"""
+        semaphore = semaphore or asyncio.Semaphore(settings.MAP_MATRIX_CONCURRENCY)
+        
+        async def resolve(stop: Dict[str, Any]) -> Optional[str]:
+            if stop.get("location"):
+                return stop["location"].replace(" ", "")
+            async with semaphore:
+                return await self._resolve_location(stop["address"], stop.get("city"))
+        
+        return await asyncio.gather(*[resolve(stop) for stop in stops])
+    
+    async def _resolve_location(self, address: str, city: str = None) -> Optional[str]:
+        """坐标直接使用，地址通过地理编码转换为坐标"""
+        if COORDINATE_PATTERN.match(address):
+            return address.replace(" ", "")
+        return await self._address_to_coords(address, city)
+    
+    async def _address_to_coords(self, address: str, city: str = None) -> str:
         """将地址转换为经纬度坐标"""
         try:
-            params = {"address": address}
-            result = await self._make_request("geocode/geo", params)
+            result = await self._request_geocode(address, city)
             
             if result.get("status") == "1" and result.get("geocodes"):
                 geocode = result["geocodes"][0]
                 return geocode.get("location")  # 返回格式：经度,纬度
             return None
         except Exception as e:
-            print(f"地址转坐标错误: {str(e)}")
+            logger.warning(f"地址转坐标错误: {str(e)}")
             return None
     
     async def search_poi(self, keywords: str, city: str = None, types: str = None, 
@@ -97,26 +297,55 @@ class MapClient:
         result = await self._make_request("place/text", params)
         return self._parse_poi_result(result)
     
+    @staticmethod
+    def static_map_params(location: str, zoom: int = 15, size: str = "400*300",
+                          markers: str = None, labels: str = None) -> Dict[str, Any]:
+        """静态地图参数（不含key和签名）"""
+        params = {
+            "location": location,
+            "zoom": zoom,
+            "size": size
+        }
+        if markers:
+            params["markers"] = markers
+        if labels:
+            params["labels"] = labels
+        return params
+    
+    def _sign(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """加上key，配置了MAP_SECURITY_KEY时按高德数字签名规则追加sig：
+        参数按名称排序拼接为k1=v1&k2=v2，末尾接私钥后取MD5"""
+        params = {**params, "key": self.api_key}
+        if settings.MAP_SECURITY_KEY:
+            raw = "&".join(f"{name}={params[name]}" for name in sorted(params))
+            params["sig"] = hashlib.md5((raw + settings.MAP_SECURITY_KEY).encode("utf-8")).hexdigest()
+        return params
+    
     async def static_map(self, location: str, zoom: int = 15, size: str = "400*300", 
                         markers: str = None, labels: str = None) -> Dict[str, Any]:
-        """静态地图 - 生成地图图片"""
+        """静态地图 - 在本地拼接（签名）图片URL，不请求高德，由浏览器直接加载图片"""
         try:
-            params = {
-                "location": location,
-                "zoom": zoom,
-                "size": size
+            params = self._sign(self.static_map_params(location, zoom, size, markers, labels))
+            return {
+                "status": "success",
+                "image_url": f"{self.base_url}/staticmap?{urlencode(params)}"
             }
-            if markers:
-                params["markers"] = markers
-            if labels:
-                params["labels"] = labels
-            
-            result = await self._make_request("staticmap", params)
-            return result
         except Exception as e:
-            print(f"静态地图错误: {str(e)}")
+            logger.warning(f"静态地图错误: {str(e)}")
             return {"status": "error", "message": f"静态地图生成失败: {str(e)}"}
     
+    async def fetch_static_map_image(self, params: Dict[str, Any]) -> Tuple[bytes, str]:
+        """下载静态地图图片，返回(图片内容, Content-Type)；高德返回错误信息（JSON）时抛出ValueError"""
+        response = await self._get_with_retry("staticmap", self._sign(params), retry_json=False)
+        content_type = response.headers.get("content-type", "")
+        if not content_type.startswith("image/"):
+            try:
+                info = response.json().get("info", "未知错误")
+            except ValueError:
+                info = "未知错误"
+            raise ValueError(f"静态地图获取失败: {info}")
+        return response.content, content_type
+    
     def _parse_geocode_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """解析地理编码结果"""
         if result.get("status") == "1" and result.get("geocodes"):
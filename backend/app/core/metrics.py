@@ -0,0 +1,254 @@
+import math
+import time
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 默认耗时分桶（秒），覆盖毫秒级到十秒级
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+def _escape_label(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    """Prometheus文本格式的标签部分，如{method="GET",route="/health"}"""
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in labels.items()) + "}"
+
+class Counter:
+    """只增计数器，按标签分别计数"""
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._label_values(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}")
+        return lines
+
+class Gauge(Counter):
+    """可增可减的当前值（如在途请求数）"""
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, **labels: str) -> Iterator[None]:
+        """代码块执行期间计数加一"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+class Histogram:
+    """耗时直方图 - 按标签分别统计各分桶计数、总数和总和
+
+    observe可能在线程池中调用（如密码哈希），更新时加锁。
+    """
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # 标签值 -> [各分桶计数（最后一个为+Inf）, 总数, 总和]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def observe(self, value: float, **labels: str):
+        key = self._label_values(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0, 0.0]
+            series[0][index] += 1
+            series[1] += 1
+            series[2] += value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """统计代码块耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def quantile(self, q: float, **labels: str) -> Optional[float]:
+        """按分桶估算分位数（取所在分桶的上界），没有数据时返回None"""
+        with self._lock:
+            series = self._series.get(self._label_values(labels))
+            if series is None or series[1] == 0:
+                return None
+            counts, total = list(series[0]), series[1]
+
+        target = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> List[Dict]:
+        """各标签组合的统计快照"""
+        with self._lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+
+        result = []
+        for key, counts, count, total in items:
+            cumulative = 0
+            buckets = {}
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                buckets[bound] = cumulative
+            result.append({
+                "labels": dict(zip(self.labelnames, key)),
+                "buckets": buckets,
+                "count": count,
+                "sum": total
+            })
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for series in self.snapshot():
+            labels = series["labels"]
+            for bound, count in series["buckets"].items():
+                bucket_labels = _format_labels({**labels, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series['sum'])}")
+        return lines
+
+class MetricsRegistry:
+    """指标注册表，同名指标只创建一次
+
+    同时负责可选的OpenTelemetry链路追踪：启用且安装了opentelemetry-api时，
+    span()创建真实的span（导出器由opentelemetry-instrument或OTEL_*环境变量配置），否则为空操作。
+    """
+
+    def __init__(self, tracing_enabled: bool = False):
+        self._lock = threading.Lock()
+        self._metrics: Dict[str, Any] = {}
+        self._tracer = None
+
+        if tracing_enabled:
+            try:
+                from opentelemetry import trace
+                self._tracer = trace.get_tracer("ai-travel-planner")
+            except ImportError:
+                logger.warning("未安装opentelemetry-api依赖，链路追踪未启用")
+
+        self.upstream_seconds = self.histogram(
+            "upstream_request_duration_seconds",
+            "外部服务调用耗时（秒）",
+            labelnames=("service", "operation")
+        )
+        self.upstream_errors = self.counter(
+            "upstream_request_errors_total",
+            "外部服务调用失败次数",
+            labelnames=("service", "operation")
+        )
+
+    def _get_or_create(self, cls, name: str, *args):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args)
+            elif type(metric) is not cls:
+                raise ValueError(f"指标{name}已注册为{type(metric).__name__}")
+            return metric
+
+    def histogram(self, name: str, description: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, description, labelnames, buckets)
+
+    def counter(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, description, labelnames)
+
+    def gauge(self, name: str, description: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, description, labelnames)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Any]:
+        """OpenTelemetry span，未启用追踪时产出None"""
+        if self._tracer is None:
+            yield None
+            return
+        with self._tracer.start_as_current_span(name, attributes=attributes) as span:
+            yield span
+
+    @contextmanager
+    def track_upstream(self, service: str, operation: str) -> Iterator[None]:
+        """记录一次外部服务调用：耗时直方图、失败计数和（可选）span
+
+        service为supabase/dashscope/amap/iflytek，operation为表名、模型或接口名（取值有限，避免标签基数过大）。
+        """
+        start = time.perf_counter()
+        try:
+            with self.span(f"{service} {operation}", **{"peer.service": service, "operation": operation}):
+                yield
+        except Exception:
+            self.upstream_errors.inc(service=service, operation=operation)
+            raise
+        finally:
+            self.upstream_seconds.observe(time.perf_counter() - start, service=service, operation=operation)
+
+    def render(self) -> str:
+        """Prometheus文本格式（text/plain; version=0.0.4）"""
+        with self._lock:
+            items = list(self._metrics.values())
+        lines = []
+        for metric in items:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# 创建全局指标注册表
+metrics = MetricsRegistry(tracing_enabled=settings.OTEL_ENABLED)
@@ -0,0 +1,105 @@
+import re
+import json
+import math
+import asyncio
+import hashlib
+import logging
+import unicodedata
+from typing import Any, Dict, Optional
+from app.core.cache import SQLiteTTLCache
+from app.core.config import settings
+from app.schemas.ai import AIPlanRequest
+
+logger = logging.getLogger(__name__)
+
+# 偏好之间的分隔符：中英文逗号、顿号、分号、斜杠和空白
+PREFERENCE_SEPARATOR = re.compile(r"[,，、;；/\s]+")
+
+class PlanCache:
+    """AI旅行计划缓存
+
+    以规范化后的AIPlanRequest指纹为键：
+    - 目的地去除空白、统一全半角和大小写，去掉末尾的"市"
+    - 预算按几何区间分桶（默认相邻区间相差20%），预算接近的请求共用同一份计划
+    - 偏好拆分、去重并排序，顺序和分隔符不同的偏好视为相同
+    - 特殊需求压缩空白，"无"等同于未填写
+    指纹字段变化时提升VERSION，旧缓存条目自然失效。
+    """
+
+    VERSION = 2
+    EMPTY_REQUIREMENTS = {"", "无", "没有", "none"}
+
+    def __init__(self, path: str, maxsize: int, ttl: float, budget_step: float):
+        self.budget_step = budget_step
+        self.store = SQLiteTTLCache(path, maxsize, ttl, table="plan_cache")
+
+    @staticmethod
+    def _normalize_text(text: Optional[str]) -> str:
+        return unicodedata.normalize("NFKC", text or "").strip().lower()
+
+    def budget_bucket(self, budget) -> int:
+        """预算所在的几何区间编号，0元单独为一个区间"""
+        budget = float(budget)
+        if budget < 1:
+            return 0
+        return int(math.log(budget) / math.log(1 + self.budget_step)) + 1
+
+    def fingerprint(self, request: AIPlanRequest) -> Dict[str, Any]:
+        destination = re.sub(r"\s+", "", self._normalize_text(request.destination))
+        if len(destination) > 2 and destination.endswith("市"):
+            destination = destination[:-1]
+
+        preferences = sorted({
+            p for p in PREFERENCE_SEPARATOR.split(self._normalize_text(request.preferences)) if p
+        })
+
+        requirements = re.sub(r"\s+", " ", self._normalize_text(request.special_requirements))
+        if requirements in self.EMPTY_REQUIREMENTS:
+            requirements = ""
+
+        return {
+            "v": self.VERSION,
+            "destination": destination,
+            "duration": request.duration,
+            "budget_bucket": self.budget_bucket(request.budget),
+            "travelers": request.travelers,
+            "preferences": preferences,
+            "special_requirements": requirements
+        }
+
+    def key(self, request: AIPlanRequest) -> str:
+        raw = json.dumps(self.fingerprint(request), ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    async def get(self, request: AIPlanRequest) -> Optional[Dict[str, Any]]:
+        """读取缓存的计划，读取失败时视为未命中"""
+        try:
+            raw = await asyncio.to_thread(self.store.get, self.key(request))
+        except Exception as e:
+            logger.warning(f"读取计划缓存失败: {str(e)}")
+            return None
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, request: AIPlanRequest, plan: Dict[str, Any]):
+        """缓存生成成功的计划"""
+        if plan.get("status") != "success":
+            return
+        try:
+            raw = json.dumps(plan, ensure_ascii=False, default=str)
+            await asyncio.to_thread(self.store.set, self.key(request), raw)
+        except Exception as e:
+            logger.warning(f"写入计划缓存失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        return self.store.stats()
+
+    def close(self):
+        self.store.close()
+
+# 创建全局计划缓存实例（未启用时为None）
+plan_cache = PlanCache(
+    path=settings.PLAN_CACHE_PATH,
+    maxsize=settings.PLAN_CACHE_MAXSIZE,
+    ttl=settings.PLAN_CACHE_TTL,
+    budget_step=settings.PLAN_CACHE_BUDGET_STEP
+) if settings.PLAN_CACHE_ENABLED else None
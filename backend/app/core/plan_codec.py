@@ -0,0 +1,152 @@
+import os
+import base64
+import logging
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+class PlanCodecError(Exception):
+    """压缩的行程无法解码（未安装zstandard或缺少对应的字典）"""
+
+class PlanCodec:
+    """trips.plan的存储编码
+
+    行程是大段重复度很高的中文文本，用zstd压缩后以"zstd:" + base64存入原来的text列，
+    不需要修改表结构；不带前缀的值是原文（启用压缩前写入的行程、过短的文本）。
+    zstd帧头记录了压缩时使用的字典ID，解码时按ID加载字典，训练新字典后旧数据仍可解码。
+
+    字典文件保存在dict_dir下（<字典ID>.zdict），current文件记录新数据使用的字典ID。
+    """
+
+    PREFIX = "zstd:"
+    CURRENT_FILE = "current"
+
+    def __init__(self, dict_dir: str, level: int, min_bytes: int, enabled: bool = True):
+        self.dict_dir = dict_dir
+        self.level = level
+        self.min_bytes = min_bytes
+        self.enabled = enabled and zstandard is not None
+        if enabled and zstandard is None:
+            logger.warning("未安装zstandard，行程将以原文存储")
+        self._dicts: Dict[int, Any] = {}
+        self._decompressors: Dict[int, Any] = {}
+        self._compressor = None
+        self.dict_id = self._read_current() if zstandard is not None else None
+
+    def _dict_path(self, dict_id: int) -> str:
+        return os.path.join(self.dict_dir, f"{dict_id}.zdict")
+
+    def _read_current(self) -> Optional[int]:
+        try:
+            with open(os.path.join(self.dict_dir, self.CURRENT_FILE)) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    def _load_dict(self, dict_id: int):
+        if dict_id not in self._dicts:
+            try:
+                with open(self._dict_path(dict_id), "rb") as f:
+                    self._dicts[dict_id] = zstandard.ZstdCompressionDict(f.read())
+            except OSError:
+                raise PlanCodecError(f"缺少行程压缩字典{dict_id}")
+        return self._dicts[dict_id]
+
+    def _get_compressor(self):
+        if self._compressor is None:
+            dict_data = self._load_dict(self.dict_id) if self.dict_id else None
+            self._compressor = zstandard.ZstdCompressor(level=self.level, dict_data=dict_data)
+        return self._compressor
+
+    def _get_decompressor(self, dict_id: int):
+        if dict_id not in self._decompressors:
+            dict_data = self._load_dict(dict_id) if dict_id else None
+            self._decompressors[dict_id] = zstandard.ZstdDecompressor(dict_data=dict_data)
+        return self._decompressors[dict_id]
+
+    def check(self):
+        """启动时检查当前字典可以加载（current指向的字典文件没有随代码部署时，所有写入都会失败）"""
+        if self.enabled and self.dict_id:
+            self._load_dict(self.dict_id)
+
+    @classmethod
+    def is_encoded(cls, value: Optional[str]) -> bool:
+        return bool(value) and value.startswith(cls.PREFIX)
+
+    def encode(self, text: Optional[str]) -> Optional[str]:
+        """压缩行程文本；未启用、文本过短或压缩后没有变小时返回原文
+
+        原文恰好以"zstd:"开头时总是压缩，否则读取时会被当作压缩数据。
+        """
+        if not text:
+            return text
+        raw = text.encode("utf-8")
+        literal_prefix = self.is_encoded(text)
+        if not literal_prefix and (not self.enabled or len(raw) < self.min_bytes):
+            return text
+        if zstandard is None:
+            raise PlanCodecError("行程以zstd:开头，需要安装zstandard才能存储")
+        encoded = self.PREFIX + base64.b64encode(self._get_compressor().compress(raw)).decode("ascii")
+        return encoded if literal_prefix or len(encoded) < len(raw) else text
+
+    def decode(self, value: Optional[str]) -> Optional[str]:
+        """还原行程文本，原文直接返回"""
+        if not self.is_encoded(value):
+            return value
+        if zstandard is None:
+            raise PlanCodecError("读取压缩的行程需要安装zstandard")
+        try:
+            frame = base64.b64decode(value[len(self.PREFIX):])
+            dict_id = zstandard.get_frame_parameters(frame).dict_id
+            return self._get_decompressor(dict_id).decompress(frame).decode("utf-8")
+        except (ValueError, zstandard.ZstdError) as e:
+            raise PlanCodecError(f"行程解码失败: {str(e)}")
+
+    def decode_row(self, row: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """解码一行旅行计划中的plan（只在查询结果包含plan时解压）"""
+        if row and row.get("plan"):
+            row["plan"] = self.decode(row["plan"])
+        return row
+
+    def train(self, samples: List[str], dict_size: int = 64 * 1024) -> int:
+        """用行程样本训练字典并设为当前字典，返回字典ID
+
+        训练后的字典需要随代码一起部署，否则其他实例无法解码用它压缩的行程。
+        """
+        if zstandard is None:
+            raise PlanCodecError("训练字典需要安装zstandard")
+        dictionary = zstandard.train_dictionary(dict_size, [sample.encode("utf-8") for sample in samples])
+        dict_id = dictionary.dict_id()
+
+        os.makedirs(self.dict_dir, exist_ok=True)
+        with open(self._dict_path(dict_id), "wb") as f:
+            f.write(dictionary.as_bytes())
+        with open(os.path.join(self.dict_dir, self.CURRENT_FILE), "w") as f:
+            f.write(str(dict_id))
+
+        self._dicts[dict_id] = dictionary
+        self.dict_id = dict_id
+        self._compressor = None
+        return dict_id
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "dict_id": self.dict_id,
+            "level": self.level,
+            "min_bytes": self.min_bytes
+        }
+
+# 创建全局行程编码实例
+plan_codec = PlanCodec(
+    settings.PLAN_ZSTD_DICT_DIR,
+    level=settings.PLAN_ZSTD_LEVEL,
+    min_bytes=settings.PLAN_COMPRESS_MIN_BYTES,
+    enabled=settings.PLAN_COMPRESSION_ENABLED
+)
@@ -0,0 +1,222 @@
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+
+class BaseRepository:
+    """仓储基类 - 构造查询并交给异步客户端执行"""
+
+    table_name: str = ""
+
+    def __init__(self, db):
+        self.db = db
+
+    def query(self):
+        """返回当前表的查询构造器"""
+        return self.db.table(self.table_name)
+
+    async def fetch_all(self, query) -> List[Dict[str, Any]]:
+        """执行查询并返回所有行"""
+        response = await self.db.execute(query)
+        return response.data or []
+
+    async def fetch_one(self, query) -> Optional[Dict[str, Any]]:
+        """执行查询并返回第一行（不存在时返回None）"""
+        rows = await self.fetch_all(query)
+        return rows[0] if rows else None
+
+    async def insert(self, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """插入一行并返回插入结果"""
+        return await self.fetch_one(self.query().insert(data))
+
+    @staticmethod
+    def or_filter(query, conditions: str):
+        """添加PostgREST的or过滤条件（postgrest-py 0.x 未提供or_方法）"""
+        query.params = query.params.add("or", f"({conditions})")
+        return query
+
+    @staticmethod
+    def order_by(query, *columns: str):
+        """按多列排序，如 order_by(query, "created_at.desc", "id.desc")
+
+        postgrest-py 0.x 多次调用order会生成重复的order参数，这里合并为一个。
+        """
+        query.params = query.params.add("order", ",".join(columns))
+        return query
+
+class TripRepository(BaseRepository):
+    """旅行计划表（trips）"""
+
+    table_name = "trips"
+
+    # 列表页只需要的简要字段，避免拉取完整的plan文本；updated_at用于生成ETag
+    BRIEF_COLUMNS = "id, title, destination, budget, travelers_count, days, preference_id, created_at, updated_at"
+
+    async def list_brief(
+        self,
+        user_id: str,
+        limit: int = 100,
+        after: Optional[Tuple[str, str]] = None,
+        columns: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """按(created_at, id)倒序的键集分页，after为上一页最后一行的(created_at, id)
+
+        columns默认为BRIEF_COLUMNS，指定时需包含分页用到的created_at和id（以及生成ETag用到的updated_at）。
+        """
+        query = self.query().select(columns or self.BRIEF_COLUMNS).eq("user_id", user_id)
+
+        if after:
+            created_at, trip_id = after
+            query = self.or_filter(
+                query,
+                f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{trip_id})'
+            )
+
+        query = self.order_by(query, "created_at.desc", "id.desc").limit(limit)
+        return await self.fetch_all(query)
+
+    async def get(self, trip_id: str, user_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        query = self.query().select(columns).eq("id", trip_id).eq("user_id", user_id)
+        return await self.fetch_one(query)
+
+    async def update(self, trip_id: str, user_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """更新时附带user_id条件，不属于该用户时返回None"""
+        query = self.query().update(data).eq("id", trip_id).eq("user_id", user_id)
+        return await self.fetch_one(query)
+
+    async def delete(self, trip_id: str, user_id: str) -> List[Dict[str, Any]]:
+        """删除时附带user_id条件，返回被删除的行"""
+        return await self.fetch_all(self.query().delete().eq("id", trip_id).eq("user_id", user_id))
+
+    async def budget_summary(self, user_id: str) -> Dict[str, Any]:
+        """预算统计（数据库函数trip_budget_summary，见init_database.py）"""
+        response = await self.db.rpc("trip_budget_summary", {"p_user_id": user_id})
+        return response.data or {}
+
+class TripItineraryRepository(BaseRepository):
+    """结构化行程（trip_days，每天的活动在trip_activities）"""
+
+    table_name = "trip_days"
+
+    DAY_COLUMNS = "day,title,summary,trip_activities(time,name,description,address,location,cost,category)"
+
+    async def list_days(
+        self,
+        trip_id: str,
+        first: Optional[int] = None,
+        last: Optional[int] = None
+    ) -> List[Dict[str, Any]]:
+        """按天排列的行程（可只取第first到第last天），每天的activities按position排序（一次查询嵌入活动）"""
+        query = self.query().select(self.DAY_COLUMNS).eq("trip_id", trip_id)
+        if first is not None:
+            query = query.gte("day", first)
+        if last is not None:
+            query = query.lte("day", last)
+        query = query.order("day")
+        query.params = query.params.add("trip_activities.order", "position")
+        return [self._with_activities(row) for row in await self.fetch_all(query)]
+
+    async def get_day(self, trip_id: str, day: int) -> Optional[Dict[str, Any]]:
+        """某一天的行程，走(trip_id, day)唯一索引"""
+        days = await self.list_days(trip_id, day, day)
+        return days[0] if days else None
+
+    @staticmethod
+    def _with_activities(row: Dict[str, Any]) -> Dict[str, Any]:
+        """把嵌入的trip_activities改名为activities"""
+        day = {key: value for key, value in row.items() if key != "trip_activities"}
+        day["activities"] = row.get("trip_activities") or []
+        return day
+
+    async def save(self, trip_id: str, days: List[Dict[str, Any]]) -> int:
+        """整体替换旅行计划的行程（数据库函数save_trip_itinerary，在一个事务中删除旧行程并写入），返回写入的天数"""
+        response = await self.db.rpc("save_trip_itinerary", {"p_trip_id": trip_id, "p_days": days})
+        return response.data
+
+class ExpenseRepository(BaseRepository):
+    """费用记录表（expenses）"""
+
+    table_name = "expenses"
+
+    async def list_by_trip(
+        self,
+        trip_id: str,
+        skip: int = 0,
+        limit: int = 100,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        columns: str = "*"
+    ) -> List[Dict[str, Any]]:
+        query = self.query().select(columns).eq("trip_id", trip_id)
+
+        # 添加日期范围过滤
+        if start_date:
+            query = query.gte("expense_date", start_date.isoformat())
+        if end_date:
+            query = query.lte("expense_date", end_date.isoformat())
+
+        # 添加分页和排序
+        query = query.order("expense_date", desc=True).range(skip, skip + limit - 1)
+        return await self.fetch_all(query)
+
+    async def get(self, expense_id: str, trip_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        query = self.query().select(columns).eq("id", expense_id).eq("trip_id", trip_id)
+        return await self.fetch_one(query)
+
+    async def update(self, expense_id: str, trip_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """更新时附带trip_id条件，费用记录不属于该旅行计划时返回None"""
+        query = self.query().update(data).eq("id", expense_id).eq("trip_id", trip_id)
+        return await self.fetch_one(query)
+
+    async def delete(self, expense_id: str, trip_id: str) -> List[Dict[str, Any]]:
+        """删除时附带trip_id条件，返回被删除的行"""
+        return await self.fetch_all(self.query().delete().eq("id", expense_id).eq("trip_id", trip_id))
+
+    async def trip_summary(self, trip_id: str) -> Dict[str, Any]:
+        """单个旅行计划的费用统计（数据库函数trip_expense_summary）"""
+        response = await self.db.rpc("trip_expense_summary", {"p_trip_id": trip_id})
+        return response.data or {}
+
+    async def user_summary(self, user_id: str) -> Dict[str, Any]:
+        """用户所有旅行计划的费用统计（数据库函数user_expense_summary）"""
+        response = await self.db.rpc("user_expense_summary", {"p_user_id": user_id})
+        return response.data or {}
+
+class UserRepository(BaseRepository):
+    """用户表（users）"""
+
+    table_name = "users"
+
+    # 不含password_hash的字段，用于身份校验和缓存
+    PUBLIC_COLUMNS = "id,username,created_at,updated_at,is_active"
+
+    async def get_by_username(self, username: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        return await self.fetch_one(self.query().select(columns).eq("username", username))
+
+    async def update(self, user_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await self.fetch_one(self.query().update(data).eq("id", user_id))
+
+class UserPreferenceRepository(BaseRepository):
+    """用户偏好表（user_preferences）"""
+
+    table_name = "user_preferences"
+
+    async def list_by_user(self, user_id: str) -> List[Dict[str, Any]]:
+        query = self.query().select("*").eq("user_id", user_id).order("created_at", desc=True)
+        return await self.fetch_all(query)
+
+    async def get(self, preference_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        query = self.query().select("*").eq("id", preference_id).eq("user_id", user_id)
+        return await self.fetch_one(query)
+
+    async def update(self, preference_id: str, data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        return await self.fetch_one(self.query().update(data).eq("id", preference_id))
+
+    async def delete(self, preference_id: str) -> Optional[List[Dict[str, Any]]]:
+        response = await self.db.execute(self.query().delete().eq("id", preference_id))
+        return response.data
+
+    async def get_names(self, preference_ids: List[str]) -> Dict[str, str]:
+        """一次查询批量获取偏好名称，返回 {preference_id: name}"""
+        if not preference_ids:
+            return {}
+        rows = await self.fetch_all(self.query().select("id,name").in_("id", preference_ids))
+        return {str(row["id"]): row["name"] for row in rows}
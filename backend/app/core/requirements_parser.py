@@ -0,0 +1,360 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# 中文数字
+CHINESE_DIGITS = {'零': 0, '〇': 0, '一': 1, '二': 2, '两': 2, '三': 3, '四': 4, '五': 5, '六': 6, '七': 7, '八': 8, '九': 9}
+CHINESE_UNITS = {'十': 10, '百': 100, '千': 1000}
+CHINESE_SECTION_UNITS = {'万': 10000, '亿': 100000000}
+# 数字后的量级后缀
+MAGNITUDE_SUFFIXES = {'十': 10, '百': 100, '千': 1000, '万': 10000, 'k': 1000, 'w': 10000}
+
+# 数字（阿拉伯数字或中文数字）
+NUMBER = r"(\d+(?:\.\d+)?|[零〇一二两三四五六七八九十百千万]+)"
+
+# 目的地词表：国家或国内省区 -> 常见旅游城市；直辖市等没有列出省区的国内城市归入"中国"，输出时不加前缀
+DESTINATION_GAZETTEER: Dict[str, List[str]] = {
+    "中国": ["北京", "上海", "天津", "重庆", "香港", "澳门"],
+    "云南": ["昆明", "大理", "丽江", "西双版纳", "香格里拉"],
+    "四川": ["成都", "九寨沟", "稻城", "乐山", "峨眉山"],
+    "西藏": ["拉萨", "林芝", "日喀则"],
+    "新疆": ["乌鲁木齐", "喀什", "伊犁", "喀纳斯"],
+    "海南": ["三亚", "海口", "万宁"],
+    "广西": ["桂林", "阳朔", "南宁", "北海"],
+    "广东": ["广州", "深圳", "珠海", "潮州"],
+    "浙江": ["杭州", "乌镇", "宁波", "舟山"],
+    "江苏": ["南京", "苏州", "无锡", "扬州"],
+    "福建": ["厦门", "福州", "泉州", "武夷山"],
+    "山东": ["青岛", "济南", "威海", "烟台", "泰山"],
+    "陕西": ["西安", "延安", "华山"],
+    "甘肃": ["敦煌", "兰州", "张掖"],
+    "湖南": ["长沙", "张家界", "凤凰古城"],
+    "湖北": ["武汉", "宜昌", "恩施"],
+    "河南": ["郑州", "洛阳", "开封"],
+    "安徽": ["黄山", "合肥", "宏村"],
+    "江西": ["南昌", "婺源", "景德镇"],
+    "贵州": ["贵阳", "荔波", "黄果树"],
+    "辽宁": ["大连", "沈阳"],
+    "吉林": ["长春", "长白山"],
+    "黑龙江": ["哈尔滨", "漠河"],
+    "内蒙古": ["呼和浩特", "呼伦贝尔"],
+    "青海": ["西宁", "青海湖"],
+    "宁夏": ["银川"],
+    "河北": ["石家庄", "秦皇岛", "承德"],
+    "山西": ["太原", "平遥", "大同"],
+    "台湾": ["台北", "高雄", "台中", "花莲"],
+    "日本": ["东京", "大阪", "京都", "奈良", "北海道", "札幌", "冲绳", "名古屋", "福冈", "横滨", "神户", "箱根", "富士山"],
+    "韩国": ["首尔", "釜山", "济州岛", "济州"],
+    "泰国": ["曼谷", "清迈", "普吉岛", "芭提雅", "苏梅岛", "甲米"],
+    "新加坡": [],
+    "马来西亚": ["吉隆坡", "槟城", "沙巴", "兰卡威"],
+    "越南": ["河内", "胡志明市", "岘港", "芽庄"],
+    "印度尼西亚": ["巴厘岛", "雅加达"],
+    "印尼": ["巴厘岛"],
+    "菲律宾": ["马尼拉", "长滩岛", "宿务"],
+    "马尔代夫": [],
+    "柬埔寨": ["暹粒", "吴哥窟", "金边"],
+    "法国": ["巴黎", "尼斯", "里昂", "普罗旺斯"],
+    "意大利": ["罗马", "米兰", "威尼斯", "佛罗伦萨"],
+    "英国": ["伦敦", "爱丁堡", "曼彻斯特"],
+    "德国": ["柏林", "慕尼黑", "法兰克福"],
+    "西班牙": ["巴塞罗那", "马德里"],
+    "瑞士": ["苏黎世", "日内瓦", "因特拉肯"],
+    "希腊": ["雅典", "圣托里尼"],
+    "土耳其": ["伊斯坦布尔", "卡帕多奇亚"],
+    "埃及": ["开罗"],
+    "阿联酋": ["迪拜", "阿布扎比"],
+    "美国": ["纽约", "洛杉矶", "旧金山", "拉斯维加斯", "夏威夷", "西雅图", "芝加哥"],
+    "加拿大": ["温哥华", "多伦多"],
+    "澳大利亚": ["悉尼", "墨尔本", "黄金海岸"],
+    "新西兰": ["奥克兰", "皇后镇"],
+    "俄罗斯": ["莫斯科", "圣彼得堡"],
+    "冰岛": [],
+}
+DOMESTIC = "中国"
+
+# 地名 -> 所属国家/省区（国家、省区名本身映射到自己）
+PLACE_REGION: Dict[str, str] = {}
+for _region, _cities in DESTINATION_GAZETTEER.items():
+    if _region != DOMESTIC:
+        PLACE_REGION[_region] = _region
+    for _city in _cities:
+        PLACE_REGION.setdefault(_city, _region)
+
+# 较长的地名优先匹配（"济州岛"优先于"济州"）
+PLACE_PATTERN = re.compile("|".join(sorted(map(re.escape, PLACE_REGION), key=len, reverse=True)))
+
+# 出发地标记：从X出发 / X出发
+ORIGIN_PREFIXES = ("从", "由")
+ORIGIN_SUFFIXES = ("出发", "飞", "坐")
+
+DURATION_PATTERNS = [
+    (re.compile(NUMBER + r"\s*个?\s*(?:天|日)(?!元)"), 1),
+    (re.compile(NUMBER + r"\s*个?\s*(?:周|星期|礼拜)(?!末)"), 7),
+]
+NIGHTS_PATTERN = re.compile(NUMBER + r"\s*(?:晚|夜)")
+WEEKEND_PATTERN = re.compile(r"周末")
+
+# 金额后的"/人"、"每人"表示人均
+PER_PERSON_SUFFIX = r"(?:\s*(?:/|每)\s*(?:个)?(?:人|位))?"
+BUDGET_KEYWORD_PATTERN = re.compile(
+    r"(?:人均|每人|每个人)?\s*(?:预算|经费|花费|费用|budget)[^\d零〇一二两三四五六七八九十百千万]{0,6}"
+    + NUMBER + r"\s*([十百千万kKwW])?\s*(?:元|块钱|块|人民币|rmb|RMB)?" + PER_PERSON_SUFFIX
+)
+BUDGET_AMOUNT_PATTERN = re.compile(
+    r"(?:人均|每人|每个人)?\s*" + NUMBER + r"\s*([十百千万kKwW])?\s*(?:元|块钱|块|人民币|rmb|RMB)" + PER_PERSON_SUFFIX
+)
+PER_PERSON_PATTERN = re.compile(r"人均|每人|每个人|/\s*(?:个)?(?:人|位)|每位")
+# 预算区间（"1万到2万"）交给大模型判断
+RANGE_PATTERN = re.compile(r"\s*(?:到|至|-|~|～|—)")
+# 人民币以外的币种：金额需要换算，交给大模型
+FOREIGN_CURRENCY_PATTERN = re.compile(
+    r"日元|日币|円|美元|美金|刀(?!削)|港币|港元|澳门元|台币|欧元|英镑|韩元|韩币|泰铢|新币|新加坡元|澳元|加元|卢布|越南盾|卢比|林吉特|"
+    r"\$|usd|jpy|hkd|eur|gbp|krw|thb|sgd|aud|cad",
+    re.IGNORECASE
+)
+# "两三天"、"三四个人"、"3到5天"这类约数或区间，交给大模型判断
+NUMBER_RANGE_PATTERN = re.compile(
+    r"[一二两三四五六七八九]{2}|" + NUMBER + r"\s*(?:到|至|-|~|～|—)\s*" + NUMBER
+)
+
+TRAVELERS_PATTERN = re.compile(NUMBER + r"\s*(?:个|位)?\s*(?:人|大人|成人)(?!均|民币)")
+CHILDREN_PATTERN = re.compile(NUMBER + r"\s*(?:个|位)?\s*(?:小孩|孩子|儿童|老人)")
+COMPANIONS_PATTERN = re.compile(r"(?:和|跟|带|与|陪)\s*" + NUMBER + r"\s*(?:个|位)\s*(?:朋友|同学|同事|闺蜜|兄弟|家人)")
+FAMILY_PATTERN = re.compile(r"一家" + NUMBER + r"口")
+COUPLE_PATTERN = re.compile(r"情侣|夫妻|两口子|蜜月|和(?:老婆|老公|女朋友|男朋友|女友|男友|对象|爱人)")
+SOLO_PATTERN = re.compile(r"独自|一个人|自己去|自己一个|solo|单人")
+# 提到同行者但没有给出人数，需要交给大模型判断
+COMPANION_HINT_PATTERN = re.compile(r"和|跟|带|与|陪|爸妈|父母|家人|朋友|孩子")
+
+# 已被上面各字段规则识别的数字；剩下的阿拉伯数字或"人均3000"这类没有单位的金额含义不明，交给大模型
+CLAIMED_NUMBER_PATTERNS = [pattern for pattern, _ in DURATION_PATTERNS] + [
+    NIGHTS_PATTERN, BUDGET_KEYWORD_PATTERN, BUDGET_AMOUNT_PATTERN,
+    TRAVELERS_PATTERN, CHILDREN_PATTERN, COMPANIONS_PATTERN, FAMILY_PATTERN
+]
+UNCLAIMED_NUMBER_PATTERN = re.compile(r"\d|(?:人均|每人|每个人)\s*" + NUMBER)
+
+# 超过该长度的输入通常包含较多上下文，直接交给大模型
+MAX_RULE_INPUT_LENGTH = 120
+
+# 与大模型解析提示词一致的默认值
+DEFAULT_DURATION = 7
+DEFAULT_BUDGET = 10000.0
+DEFAULT_TRAVELERS = 2
+
+def parse_chinese_integer(text: str) -> Optional[int]:
+    """解析中文数字，支持"十二"、"一百零五"、"两万五千"以及"三百五"、"一万五"这类口语省略写法"""
+    total = 0
+    section = 0
+    number = 0
+    last_unit = None
+
+    for char in text:
+        if char in CHINESE_DIGITS:
+            number = CHINESE_DIGITS[char]
+            if number == 0:
+                # "一百零五"中零之后的数字是个位
+                last_unit = None
+        elif char in CHINESE_UNITS:
+            unit = CHINESE_UNITS[char]
+            if number == 0 and unit == 10:
+                number = 1  # "十二"
+            section += number * unit
+            number = 0
+            last_unit = unit
+        elif char in CHINESE_SECTION_UNITS:
+            unit = CHINESE_SECTION_UNITS[char]
+            total += (section + number) * unit
+            section = 0
+            number = 0
+            last_unit = unit
+        else:
+            return None
+
+    # 口语省略末位单位："三百五" = 350，"一万五" = 15000
+    if number and last_unit and last_unit >= 100:
+        number *= last_unit // 10
+
+    return total + section + number
+
+def parse_number(text: str, suffix: Optional[str] = None) -> Optional[float]:
+    """解析阿拉伯数字或中文数字，可带"万"/"千"/"k"/"w"量级后缀"""
+    text = text.strip()
+    if re.fullmatch(r"\d+(?:\.\d+)?", text):
+        value = float(text)
+    else:
+        value = parse_chinese_integer(text)
+        if value is None:
+            return None
+
+    if suffix:
+        value *= MAGNITUDE_SUFFIXES[suffix.lower()]
+    return value
+
+def _single_value(values: List[float]) -> Tuple[Optional[float], bool]:
+    """从候选值中取唯一值，返回(值, 是否冲突)"""
+    distinct = sorted(set(values))
+    if not distinct:
+        return None, False
+    if len(distinct) > 1:
+        return None, True
+    return distinct[0], False
+
+def extract_destination(text: str) -> Tuple[Optional[str], bool]:
+    """根据地名词表提取目的地，返回(目的地, 是否有歧义)
+
+    同时出现国家/省区和其下的城市时输出"国家+城市"（如"日本东京"、"云南大理"），
+    排除"从X出发"的出发地；出现多个目的地城市（多城市行程）视为有歧义。
+    """
+    regions = []
+    cities = []
+    for match in PLACE_PATTERN.finditer(text):
+        name = match.group(0)
+        before = text[max(match.start() - 1, 0):match.start()]
+        after = text[match.end():match.end() + 2]
+        if before in ORIGIN_PREFIXES or after.startswith(ORIGIN_SUFFIXES):
+            continue
+
+        if PLACE_REGION[name] == name:
+            regions.append(name)
+        else:
+            cities.append(name)
+
+    cities = list(dict.fromkeys(cities))
+    regions = list(dict.fromkeys(regions))
+
+    if len(cities) > 1:
+        return None, True
+    if cities:
+        city = cities[0]
+        region = PLACE_REGION[city]
+        if region in regions:
+            return region + city, len(regions) > 1
+        return city, bool(regions)
+    if len(regions) == 1:
+        return regions[0], False
+    return None, len(regions) > 1
+
+def extract_duration(text: str) -> Tuple[Optional[int], bool]:
+    """提取旅行天数："7天"、"三日游"、"一周"、"5晚"（按晚数+1天）、"周末"（2天）"""
+    values = []
+    for pattern, multiplier in DURATION_PATTERNS:
+        for match in pattern.finditer(text):
+            value = parse_number(match.group(1))
+            if value:
+                values.append(value * multiplier)
+
+    if not values:
+        values = [value + 1 for value in (parse_number(m.group(1)) for m in NIGHTS_PATTERN.finditer(text)) if value]
+    if not values and WEEKEND_PATTERN.search(text):
+        values = [2]
+
+    value, conflict = _single_value(values)
+    return (int(value) if value is not None else None), conflict
+
+def extract_travelers(text: str) -> Tuple[Optional[int], bool]:
+    """提取同行人数："3人同行"、"两个大人一个小孩"、"和2个朋友"、"一家三口"、"情侣"、"独自"等"""
+    family = FAMILY_PATTERN.search(text)
+    if family:
+        return int(parse_number(family.group(1)) or 0) or None, False
+
+    companions = COMPANIONS_PATTERN.search(text)
+    if companions:
+        value = parse_number(companions.group(1))
+        return (int(value) + 1 if value else None), False
+
+    adults = [parse_number(m.group(1)) for m in TRAVELERS_PATTERN.finditer(text)]
+    children = [parse_number(m.group(1)) for m in CHILDREN_PATTERN.finditer(text)]
+    adults = [v for v in adults if v]
+    children = [v for v in children if v]
+
+    if children:
+        # 大人和小孩分别计数时相加
+        adult_count, conflict = _single_value(adults)
+        if conflict:
+            return None, True
+        return int((adult_count or 0) + sum(children)), False
+
+    value, conflict = _single_value(adults)
+    if value is not None or conflict:
+        return (int(value) if value is not None else None), conflict
+
+    if COUPLE_PATTERN.search(text):
+        return 2, False
+    if SOLO_PATTERN.search(text):
+        return 1, False
+    return None, False
+
+def extract_budget(text: str, travelers: int) -> Tuple[Optional[float], bool]:
+    """提取总预算："预算15000元"、"预算1.5万"、"两万块"、"人均5000"、"3000元/人"（人均的乘以人数）
+
+    出现人民币以外的币种时视为有歧义。
+    """
+    if FOREIGN_CURRENCY_PATTERN.search(text):
+        return None, True
+    values = []
+    for pattern in (BUDGET_KEYWORD_PATTERN, BUDGET_AMOUNT_PATTERN):
+        for match in pattern.finditer(text):
+            if RANGE_PATTERN.match(text, match.end()):
+                return None, True
+
+            number, suffix = match.groups()
+            value = parse_number(number, suffix)
+            if not value:
+                continue
+            if PER_PERSON_PATTERN.search(match.group(0)):
+                value *= travelers
+            values.append(value)
+        # 带"预算"等关键词的金额优先
+        if values:
+            break
+
+    return _single_value(values)
+
+def has_unclaimed_number(text: str) -> bool:
+    """去掉各字段规则识别出的片段后，是否还有数字（如"人均3000"没有写元/块，不会被预算规则识别）"""
+    for pattern in CLAIMED_NUMBER_PATTERNS:
+        text = pattern.sub(" ", text)
+    return UNCLAIMED_NUMBER_PATTERN.search(text) is not None
+
+def parse_travel_requirements(text: str) -> Optional[Dict[str, Any]]:
+    """基于规则解析旅行需求，返回与大模型解析相同格式的结果
+
+    输入含有无法确定的信息（目的地不在词表中、同一字段出现多个不同的值、约数或区间、
+    外币金额、提到同行者但没有人数、有没被识别的数字等）时返回None，由调用方交给大模型解析。
+    未提到的天数、预算、人数使用与大模型提示词相同的默认值。
+    """
+    text = text.strip()
+    if not text or len(text) > MAX_RULE_INPUT_LENGTH:
+        return None
+
+    if NUMBER_RANGE_PATTERN.search(text):
+        return None
+
+    destination, ambiguous = extract_destination(text)
+    if destination is None or ambiguous:
+        return None
+
+    duration, ambiguous = extract_duration(text)
+    if ambiguous or (duration is not None and not 1 <= duration <= 365):
+        return None
+
+    travelers, ambiguous = extract_travelers(text)
+    if ambiguous or (travelers is not None and not 1 <= travelers <= 50):
+        return None
+    if travelers is None and COMPANION_HINT_PATTERN.search(text):
+        return None
+
+    budget, ambiguous = extract_budget(text, travelers or DEFAULT_TRAVELERS)
+    if ambiguous:
+        return None
+    # 还有没被识别的数字时，不能确定预算等字段是否真的没有提到，不使用默认值
+    if has_unclaimed_number(text):
+        return None
+
+    return {
+        "destination": destination,
+        "duration": duration or DEFAULT_DURATION,
+        "budget": float(budget if budget is not None else DEFAULT_BUDGET),
+        "travelers": travelers or DEFAULT_TRAVELERS,
+        "status": "success"
+    }
@@ -2,12 +2,19 @@ import asyncio
 import base64
 import hashlib
 import hmac
-import json
 import time
+import uuid
+import logging
 import websockets
-from typing import Dict, Any, AsyncGenerator
+from typing import Dict, Any, AsyncGenerator, AsyncIterable, Optional
 from urllib.parse import quote
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.logging_config import log_sampling, SessionLogger
+from app.core.speech_session import coalesce_frames
+from app.core.transcript import TranscriptAssembler, parse_iflytek_result, loads
+
+logger = logging.getLogger(__name__)
 
 class IFlyTekSpeechClient:
     """科大讯飞语音识别客户端 - 修正认证和音频处理"""
@@ -42,59 +49,32 @@ class IFlyTekSpeechClient:
         auth_url = f"{self.realtime_api_url}?appid={self.app_id}&ts={timestamp}&signa={quote(signa)}"
         return auth_url
     
-    def _extract_text_from_iflytek_result(self, data: str) -> str:
-        """从科大讯飞API结果中提取纯文本内容"""
-        try:
-            # 解析JSON数据
-            result_data = json.loads(data)
-            print(f"原始API响应: {data}")  # 添加调试日志
-            
-            # 提取文本内容
-            text_parts = []
-            
-            # 检查是否有中文结果
-            if "cn" in result_data and "st" in result_data["cn"]:
-                st_data = result_data["cn"]["st"]
-                
-                # 处理rt数组中的每个结果段
-                if "rt" in st_data:
-                    for rt_item in st_data["rt"]:
-                        if "ws" in rt_item:
-                            for ws_item in rt_item["ws"]:
-                                if "cw" in ws_item:
-                                    for cw_item in ws_item["cw"]:
-                                        if "w" in cw_item:
-                                            text_parts.append(cw_item["w"])
-            
-            # 如果没有提取到文本，尝试其他格式
-            if not text_parts:
-                # 尝试直接提取文本字段
-                if "text" in result_data:
-                    text_parts.append(result_data["text"])
-                elif "transcript" in result_data:
-                    text_parts.append(result_data["transcript"])
-            
-            # 合并文本并返回
-            if text_parts:
-                extracted_text = "".join(text_parts)
-                print(f"提取的文本: '{extracted_text}'")  # 添加调试日志
-                return extracted_text
-            else:
-                # 如果没有提取到文本，返回原始数据用于调试
-                print("未提取到文本，返回原始数据")  # 添加调试日志
-                return data
-                
-        except Exception as e:
-            print(f"解析科大讯飞结果错误: {e}")
-            # 解析失败时返回原始数据
-            return data
+    async def transcribe_realtime(
+        self,
+        audio_stream: AsyncIterable[bytes],
+        log: Optional[SessionLogger] = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """实时语音转写 - 优化连接管理和错误处理
 
-    async def transcribe_realtime(self, audio_stream: AsyncGenerator[bytes, None]) -> AsyncGenerator[Dict[str, Any], None]:
-        """实时语音转写 - 优化连接管理和错误处理"""
+        产出的结果：
+        - 识别更新：{"success": True, "seg_id", "is_final"（该片段是否为确定结果）, "text"（片段文本）, "transcript"（完整文本）}
+        - 转写结束：{"success": True, "done": True, "is_final": True, "transcript"}
+        - 错误：{"success": False, "error"}
+        log为会话日志（由调用方创建，与接口日志共用会话ID）；逐块、逐条响应的日志为DEBUG级别，
+        只在开启DEBUG且会话被抽样时输出，会话结束时输出一条INFO汇总。
+        """
+        if log is None:
+            log = log_sampling.session_logger(logger, uuid.uuid4().hex[:8])
+        audio_chunk_count = 0
+        audio_bytes = 0
+        result_count = 0
+        assembler = TranscriptAssembler()
         try:
-            # 生成鉴权URL
+            # 生成鉴权URL（签名参数不写入日志）
             auth_url = self._generate_auth_url()
-            print(f"连接科大讯飞API: {auth_url}")
+            log.debug("连接科大讯飞API: %s", self.realtime_api_url)
+            connect_start = time.perf_counter()
+            first_result = True
             
             # 设置更长的超时时间和ping间隔
             async with websockets.connect(
@@ -103,16 +83,19 @@ class IFlyTekSpeechClient:
                 close_timeout=20,
                 ping_interval=10  # 添加ping间隔保持连接活跃
             ) as websocket:
-                print("科大讯飞API连接成功")
+                log.debug("科大讯飞API连接成功")
+                metrics.upstream_seconds.observe(time.perf_counter() - connect_start, service="iflytek", operation="connect")
                 
                 # 等待握手响应
                 try:
                     handshake_response = await asyncio.wait_for(websocket.recv(), timeout=5.0)
-                    print(f"握手响应: {handshake_response}")
+                    log.debug("握手响应: %s", handshake_response)
                     
-                    handshake_result = json.loads(handshake_response)
+                    handshake_result = loads(handshake_response)
                     if handshake_result.get("action") == "error":
                         error_msg = f"握手失败: {handshake_result.get('code', '未知')} - {handshake_result.get('desc', '未知错误')}"
+                        log.warning(error_msg)
+                        metrics.upstream_errors.inc(service="iflytek", operation="connect")
                         yield {
                             "success": False,
                             "error": error_msg
@@ -120,103 +103,101 @@ class IFlyTekSpeechClient:
                         return
                         
                 except asyncio.TimeoutError:
-                    print("握手响应超时，继续处理音频")
+                    log.info("握手响应超时，继续处理音频")
                 
                 # 创建发送音频的异步任务
                 async def send_audio():
-                    """发送音频数据"""
-                    audio_chunk_count = 0
+                    """发送音频数据：按SPEECH_FRAME_BYTES整理为固定大小的帧
+
+                    websocket.send在发送缓冲区满时等待，上游变慢时不再从audio_stream读取，压力逐级传回浏览器。
+                    """
+                    nonlocal audio_chunk_count, audio_bytes
                     try:
-                        async for audio_chunk in audio_stream:
+                        async for audio_chunk in coalesce_frames(audio_stream, settings.SPEECH_FRAME_BYTES):
                             if len(audio_chunk) > 0:
                                 audio_chunk_count += 1
-                                print(f"发送第{audio_chunk_count}个音频块，大小: {len(audio_chunk)} bytes")
+                                audio_bytes += len(audio_chunk)
+                                if log.isEnabledFor(logging.DEBUG):
+                                    log.debug("发送第%d个音频帧，大小: %d bytes", audio_chunk_count, len(audio_chunk))
                                 
-                                # 直接发送原始音频数据
                                 try:
                                     await websocket.send(audio_chunk)
-                                    print(f"音频数据发送成功 (块{audio_chunk_count})")
                                 except websockets.exceptions.ConnectionClosed:
-                                    print("发送音频时连接已关闭")
+                                    log.info("发送音频时连接已关闭")
                                     break
                         
                         # 发送结束标记
                         end_tag = '{"end": true}'
                         try:
                             await websocket.send(end_tag)
-                            print("结束标记发送成功")
+                            log.debug("结束标记发送成功")
                         except websockets.exceptions.ConnectionClosed:
-                            print("发送结束标记时连接已关闭")
+                            log.info("发送结束标记时连接已关闭")
                     except Exception as e:
-                        print(f"发送音频数据异常: {e}")
+                        log.warning(f"发送音频数据异常: {e}")
                 
                 # 启动音频发送任务
                 send_task = asyncio.create_task(send_audio())
                 
-                # 直接处理接收结果，而不是创建任务
-                while True:
-                    try:
-                        # 设置较短的超时时间，实现真正的实时响应
-                        response = await asyncio.wait_for(websocket.recv(), timeout=1.0)
-                        print(f"收到API响应: {response}")
+                # 事件驱动接收结果：有消息到达时才唤醒，连接关闭时迭代结束
+                try:
+                    async for response in websocket:
+                        if log.isEnabledFor(logging.DEBUG):
+                            log.debug("收到API响应: %s", response)
                         
-                        result = json.loads(response)
+                        result = loads(response)
+                        action = result.get("action")
                         
                         # 解析结果
-                        if result.get("action") == "started":
-                            print("握手成功")
+                        if action == "started":
+                            log.debug("握手成功")
                             continue
                         
-                        if result.get("action") == "result":
-                            # 解析识别结果
+                        if action == "result":
                             data = result.get("data", "")
                             if data:
-                                # 提取纯文本内容
-                                transcript_text = self._extract_text_from_iflytek_result(data)
-                                print(f"识别结果: '{transcript_text}'")
+                                try:
+                                    segment = parse_iflytek_result(data)
+                                except Exception as e:
+                                    log.warning(f"解析科大讯飞结果错误: {e}")
+                                    continue
+                                result_count += 1
+                                if first_result:
+                                    # 从建立连接到收到第一条识别结果的耗时
+                                    metrics.upstream_seconds.observe(time.perf_counter() - connect_start, service="iflytek", operation="first_result")
+                                    first_result = False
                                 
-                                # 修复：检查是否为纯标点符号或空内容
-                                cleaned_text = transcript_text.strip()
-                                if cleaned_text and cleaned_text not in ['.', '。', '!', '！', '?', '？']:
-                                    yield {
-                                        "success": True,
-                                        "transcript": transcript_text,
-                                        "is_final": False,
-                                        "confidence": 0.9
-                                    }
+                                # 中间结果替换上一条中间结果，确定结果追加；完整文本没有变化时不推送
+                                update = assembler.apply(segment)
+                                if update is not None:
+                                    yield {"success": True, "confidence": 0.9, **update}
                                 else:
-                                    print(f"跳过无效转录内容: '{transcript_text}'")
+                                    log.debug("跳过无变化的转录内容: '%s'", segment["text"])
                         
-                        if result.get("action") == "end":
-                            print("收到结束响应")
-                            # 修复：完全跳过结束响应，不发送任何转录结果
-                            print("语音转录结束，跳过结束响应")
+                        if action == "end":
+                            log.debug("收到结束响应，语音转录结束")
+                            yield {
+                                "success": True,
+                                "done": True,
+                                "is_final": True,
+                                "transcript": assembler.text,
+                                "confidence": 0.9
+                            }
                             break
                         
-                        if result.get("action") == "error":
+                        if action == "error":
                             error_msg = f"API错误: {result.get('code', '未知')} - {result.get('desc', '未知错误')}"
-                            print(f"API错误: {error_msg}")
+                            log.warning(error_msg)
+                            metrics.upstream_errors.inc(service="iflytek", operation="recognize")
                             yield {
                                 "success": False,
                                 "error": error_msg
                             }
                             break
-                        
-                        if result.get("action") == "end":
-                            print("收到结束响应")
-                            # 修复：完全跳过结束响应，不发送任何转录结果
-                            print("语音转录结束，跳过结束响应")
-                            break
-                            
-                    except asyncio.TimeoutError:
-                        # 没有新结果，继续等待
-                        continue
-                    except websockets.exceptions.ConnectionClosed:
-                        print("科大讯飞WebSocket连接关闭")
-                        break
-                    except Exception as e:
-                        print(f"接收结果异常: {e}")
-                        break
+                except websockets.exceptions.ConnectionClosed:
+                    log.info("科大讯飞WebSocket连接关闭")
+                except Exception as e:
+                    log.warning(f"接收结果异常: {e}")
                 
                 # 等待发送任务完成或取消
                 if send_task and not send_task.done():
@@ -224,24 +205,31 @@ class IFlyTekSpeechClient:
                     try:
                         await send_task
                     except asyncio.CancelledError:
-                        print("音频发送任务已取消")
+                        log.debug("音频发送任务已取消")
             
         except websockets.exceptions.InvalidURI as e:
+            log.warning(f"认证URL无效: {e}")
+            metrics.upstream_errors.inc(service="iflytek", operation="connect")
             yield {
                 "success": False,
                 "error": f"认证URL无效: {str(e)}"
             }
         except websockets.exceptions.InvalidHandshake as e:
+            log.warning(f"握手失败: {e}")
+            metrics.upstream_errors.inc(service="iflytek", operation="connect")
             yield {
                 "success": False,
                 "error": f"握手失败，请检查API Key和App ID: {str(e)}"
             }
         except Exception as e:
-            print(f"实时转录异常: {e}")
+            log.exception(f"实时转录异常: {e}")
+            metrics.upstream_errors.inc(service="iflytek", operation="session")
             yield {
                 "success": False,
                 "error": f"实时转录失败: {str(e)}"
             }
+        finally:
+            log.info(f"转录会话结束: 发送{audio_chunk_count}个音频帧（{audio_bytes} bytes），{result_count}条识别结果")
 
 # 创建全局语音客户端实例
 speech_client = IFlyTekSpeechClient()
\ No newline at end of file
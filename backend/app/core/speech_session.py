@@ -0,0 +1,130 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterable, AsyncIterator, Dict, List, Optional
+from app.core.config import settings
+from app.core.metrics import metrics
+
+speech_sessions_active = metrics.gauge(
+    "speech_sessions_active",
+    "进行中的实时语音转写会话数"
+)
+speech_sessions_rejected = metrics.counter(
+    "speech_sessions_rejected_total",
+    "因超出会话上限被拒绝的实时语音转写会话数"
+)
+
+class SpeechSessionLimitError(Exception):
+    """当前进程的实时语音会话数已达上限"""
+
+class FrameCoalescer:
+    """把浏览器发来的任意大小音频块合并/切分为固定大小的帧
+
+    科大讯飞建议每40ms发送1280字节（16kHz、16bit单声道），过小的块会增加帧数和发送次数，
+    过大的块会被服务端判定为发送过快。
+    """
+
+    def __init__(self, frame_size: int):
+        self.frame_size = frame_size
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[bytes]:
+        """追加数据，返回已凑满的帧"""
+        self._buffer.extend(data)
+        if len(self._buffer) < self.frame_size:
+            return []
+        end = len(self._buffer) - len(self._buffer) % self.frame_size
+        frames = [bytes(self._buffer[i:i + self.frame_size]) for i in range(0, end, self.frame_size)]
+        del self._buffer[:end]
+        return frames
+
+    def flush(self) -> Optional[bytes]:
+        """取出剩余不足一帧的数据（音频结束时调用）"""
+        if not self._buffer:
+            return None
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        return data
+
+async def coalesce_frames(audio_stream: AsyncIterable[bytes], frame_size: int) -> AsyncGenerator[bytes, None]:
+    """把音频流整理为固定大小的帧，结束时产出剩余数据"""
+    coalescer = FrameCoalescer(frame_size)
+    async for chunk in audio_stream:
+        for frame in coalescer.feed(chunk):
+            yield frame
+    tail = coalescer.flush()
+    if tail:
+        yield tail
+
+class AudioQueue:
+    """浏览器与科大讯飞之间的有界音频队列
+
+    接收端在队列满时等待（不再读取浏览器WebSocket），由TCP流控把压力传回浏览器，
+    而不是在内存中无限堆积音频；发送端按到达顺序取出，close()后取完剩余数据即结束。
+    """
+
+    _END = object()
+
+    def __init__(self, maxsize: int):
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.blocked = 0  # 因队列已满而等待的次数（说明上游发送跟不上）
+
+    async def put(self, chunk: bytes):
+        if self._queue.full():
+            self.blocked += 1
+        await self._queue.put(chunk)
+
+    async def close(self):
+        await self._queue.put(self._END)
+
+    def close_nowait(self):
+        """接收端异常退出时结束队列；队列已满时丢弃最早的数据为结束标记腾出位置"""
+        if self._queue.full():
+            self._queue.get_nowait()
+        self._queue.put_nowait(self._END)
+
+    async def __aiter__(self) -> AsyncGenerator[bytes, None]:
+        while True:
+            chunk = await self._queue.get()
+            if chunk is self._END:
+                return
+            yield chunk
+
+class SpeechSessionManager:
+    """实时语音会话管理 - 限制单个进程同时进行的会话数
+
+    每个会话占用一条到科大讯飞的长连接和若干任务，超出上限时直接拒绝（客户端稍后重试），
+    避免所有会话一起变慢。
+    """
+
+    def __init__(self, max_sessions: int):
+        self.max_sessions = max_sessions
+        self.active = 0
+        self.peak = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator[None]:
+        if self.active >= self.max_sessions:
+            self.rejected += 1
+            speech_sessions_rejected.inc()
+            raise SpeechSessionLimitError("语音识别会话数已达上限，请稍后重试")
+
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        speech_sessions_active.inc()
+        try:
+            yield
+        finally:
+            self.active -= 1
+            speech_sessions_active.dec()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "peak": self.peak,
+            "max_sessions": self.max_sessions,
+            "rejected": self.rejected
+        }
+
+# 创建全局语音会话管理实例
+speech_sessions = SpeechSessionManager(max_sessions=settings.SPEECH_MAX_SESSIONS)
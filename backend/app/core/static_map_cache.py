@@ -0,0 +1,132 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from typing import Any, Dict, Optional, Tuple
+from app.core.cache import SQLiteTTLCache
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class StaticMapCache:
+    """静态地图图片缓存（按内容寻址）
+
+    图片以内容的SHA-256命名保存在磁盘上，相同图片只存一份，文件名同时作为ETag；
+    请求参数到内容哈希的映射保存在SQLite中并按TTL过期，过期后重新下载以获取地图更新。
+    索引条目过期或被淘汰后图片文件不会随之删除，由sweep定期清理没有索引引用的文件。
+    """
+
+    # 刚写入、还没有写入索引的图片（可能来自其他worker）不清理
+    ORPHAN_GRACE_SECONDS = 3600
+
+    def __init__(self, directory: str, ttl: float, maxsize: int, sweep_interval: float):
+        self.directory = directory
+        self.sweep_interval = sweep_interval
+        os.makedirs(directory, exist_ok=True)
+        self.index = SQLiteTTLCache(os.path.join(directory, "index.sqlite3"), maxsize, ttl, table="static_map_index")
+        self._last_sweep = time.monotonic()
+
+    @staticmethod
+    def request_key(params: Dict[str, Any]) -> str:
+        """请求参数（不含key和签名）的规范化哈希"""
+        raw = json.dumps({name: str(value) for name, value in params.items()}, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def _read(self, request_key: str) -> Optional[Tuple[str, str, bytes]]:
+        raw = self.index.get(request_key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        try:
+            with open(self._blob_path(entry["etag"]), "rb") as f:
+                return entry["etag"], entry["content_type"], f.read()
+        except FileNotFoundError:
+            self.index.delete(request_key)
+            return None
+
+    def _write(self, request_key: str, content: bytes, content_type: str) -> str:
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._blob_path(digest)
+        if os.path.exists(path):
+            # 刷新修改时间，sweep不会在写入索引前删除这个文件
+            os.utime(path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # 先写临时文件再原子替换，避免并发读取到不完整的图片
+            temp_path = f"{path}.{os.getpid()}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        self.index.set(request_key, json.dumps({"etag": digest, "content_type": content_type}))
+
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.warning(f"清理静态地图缓存失败: {str(e)}")
+        return digest
+
+    def sweep(self) -> int:
+        """删除过期的索引条目，以及没有索引条目引用的图片文件（包括残留的临时文件），返回删除的文件数"""
+        self._last_sweep = time.monotonic()
+        self.index.purge_expired()
+        referenced = {json.loads(value)["etag"] for value in self.index.values()}
+        cutoff = time.time() - self.ORPHAN_GRACE_SECONDS
+
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            for blob in os.scandir(entry.path):
+                if blob.name in referenced:
+                    continue
+                try:
+                    if blob.stat().st_mtime < cutoff:
+                        os.remove(blob.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        if removed:
+            logger.info(f"清理静态地图缓存文件{removed}个")
+        return removed
+
+    async def sweep_async(self) -> int:
+        try:
+            return await asyncio.to_thread(self.sweep)
+        except Exception as e:
+            logger.warning(f"清理静态地图缓存失败: {str(e)}")
+            return 0
+
+    async def get(self, request_key: str) -> Optional[Tuple[str, str, bytes]]:
+        """返回(ETag, Content-Type, 图片内容)，未缓存时返回None"""
+        try:
+            return await asyncio.to_thread(self._read, request_key)
+        except Exception as e:
+            logger.warning(f"读取静态地图缓存失败: {str(e)}")
+            return None
+
+    async def set(self, request_key: str, content: bytes, content_type: str) -> str:
+        """保存图片，返回ETag（内容哈希）"""
+        try:
+            return await asyncio.to_thread(self._write, request_key, content, content_type)
+        except Exception as e:
+            logger.warning(f"写入静态地图缓存失败: {str(e)}")
+            return hashlib.sha256(content).hexdigest()
+
+    def close(self):
+        self.index.close()
+
+# 创建全局静态地图缓存实例：只在STATIC_MAP_PROXY_ENABLED为True时创建，否则为None（图片代理接口返回404）
+static_map_cache = None
+if settings.STATIC_MAP_PROXY_ENABLED:
+    static_map_cache = StaticMapCache(
+        directory=settings.STATIC_MAP_CACHE_DIR,
+        ttl=settings.STATIC_MAP_CACHE_TTL,
+        maxsize=settings.STATIC_MAP_CACHE_MAXSIZE,
+        sweep_interval=settings.STATIC_MAP_CACHE_SWEEP_INTERVAL
+    )
@@ -1,9 +1,73 @@
-from supabase import create_client
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+from supabase import Client, create_client
 from app.core.config import settings
+from app.core.metrics import metrics
+from app.core.repositories import (
+    TripRepository,
+    TripItineraryRepository,
+    ExpenseRepository,
+    UserRepository,
+    UserPreferenceRepository
+)
+
+class AsyncSupabaseClient:
+    """Supabase异步访问层
+
+    supabase-py 1.x 只提供同步客户端，execute() 会阻塞事件循环。
+    这里把所有查询的执行放到有界线程池中，并用信号量限制同时在途的请求数，
+    查询构造（select/eq/order等）仍然在事件循环中完成，开销可以忽略。
+    """
+
+    def __init__(self, client: Client, max_workers: int):
+        self.client = client
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="supabase"
+        )
+        # 超出线程池容量的请求在事件循环中排队，而不是堆积在线程池队列里
+        self._semaphore = asyncio.Semaphore(max_workers)
+        # 已执行的查询次数（用于观察每个接口的数据库往返次数）
+        self.query_count = 0
+
+        # 按表划分的仓储
+        self.trips = TripRepository(self)
+        self.trip_itineraries = TripItineraryRepository(self)
+        self.expenses = ExpenseRepository(self)
+        self.users = UserRepository(self)
+        self.user_preferences = UserPreferenceRepository(self)
+
+    def table(self, table_name: str):
+        """返回表查询构造器（仅构造查询，需通过execute执行）"""
+        return self.client.table(table_name)
+
+    async def execute(self, query) -> Any:
+        """在线程池中执行查询，返回原始响应"""
+        self.query_count += 1
+        # 如"GET trips"、"POST rpc/xxx"
+        operation = f"{getattr(query, 'http_method', '')} {getattr(query, 'path', '').lstrip('/')}".strip()
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            # 只统计实际执行时间，不含在信号量上的排队时间
+            with metrics.track_upstream("supabase", operation):
+                return await loop.run_in_executor(self._executor, query.execute)
+
+    async def rpc(self, fn: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        """调用数据库函数"""
+        return await self.execute(self.client.rpc(fn, params or {}))
+
+    def shutdown(self):
+        """关闭线程池（应用退出时调用）"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
 
 # 创建Supabase客户端
-supabase = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+supabase = AsyncSupabaseClient(
+    create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY),
+    max_workers=settings.SUPABASE_MAX_WORKERS
+)
 
-def get_supabase_client():
-    """获取Supabase客户端实例"""
-    return supabase
\ No newline at end of file
+def get_supabase_client() -> AsyncSupabaseClient:
+    """获取Supabase异步客户端实例"""
+    return supabase
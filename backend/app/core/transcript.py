@@ -0,0 +1,86 @@
+import json
+from typing import Any, Dict, Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 只包含标点的片段不单独推送（识别过程中经常出现）
+PUNCTUATION_ONLY = set(".。!！?？,，、;；:：")
+
+def loads(data: Union[str, bytes]) -> Any:
+    """解析JSON，安装了orjson时使用orjson（科大讯飞每条响应要解析两层JSON）"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(value: Any) -> str:
+    """序列化为紧凑的JSON字符串（中文不转义，减小推送给浏览器的消息）"""
+    if orjson is not None:
+        return orjson.dumps(value).decode()
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+def parse_iflytek_result(data: Union[str, bytes, Dict[str, Any]]) -> Dict[str, Any]:
+    """解析科大讯飞实时转写result消息的data字段
+
+    返回{"seg_id": 片段序号, "is_final": 是否为确定结果, "text": 片段文本}。
+    st.type为"0"表示确定结果（句子结束），"1"表示中间结果（会被后续结果替换）。
+    """
+    result = loads(data) if isinstance(data, (str, bytes)) else data
+    st = result.get("cn", {}).get("st", {})
+
+    words = []
+    for rt in st.get("rt", ()):
+        for ws in rt.get("ws", ()):
+            for cw in ws.get("cw", ()):
+                word = cw.get("w")
+                if word:
+                    words.append(word)
+    text = "".join(words)
+    if not text:
+        # 其他格式的结果直接提供文本字段
+        text = result.get("text") or result.get("transcript") or ""
+
+    return {
+        "seg_id": result.get("seg_id"),
+        "is_final": str(st.get("type", "0")) == "0",
+        "text": text
+    }
+
+class TranscriptAssembler:
+    """增量拼接实时转写结果
+
+    科大讯飞对正在说的句子不断返回中间结果（每次是整句的最新识别），句子结束时返回确定结果。
+    这里保存已确定的句子和当前句子的中间结果：中间结果替换上一条中间结果，确定结果追加到已确定部分。
+    """
+
+    def __init__(self):
+        self.final_text = ""
+        self.interim = ""
+
+    @property
+    def text(self) -> str:
+        """当前完整转写文本（已确定部分 + 当前句子的中间结果）"""
+        return self.final_text + self.interim
+
+    def apply(self, segment: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """应用一条片段，返回需要推送的更新；完整文本没有变化或只是中间的标点时返回None"""
+        text = segment["text"]
+        if segment["is_final"]:
+            if not text and not self.interim:
+                return None
+            self.final_text += text
+            self.interim = ""
+        else:
+            stripped = text.strip()
+            if not stripped or set(stripped) <= PUNCTUATION_ONLY or text == self.interim:
+                return None
+            self.interim = text
+
+        return {
+            "seg_id": segment.get("seg_id"),
+            "is_final": segment["is_final"],
+            "text": text,
+            "transcript": self.text
+        }
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, DECIMAL
+from sqlalchemy import Column, Integer, String, DateTime, Date, Text, Boolean, DECIMAL, ForeignKey, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
 from sqlalchemy.ext.declarative import declarative_base
@@ -34,6 +34,33 @@ class Trip(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+# 结构化行程：每天一行，活动按position排列（见init_database.py中的ITINERARY_SQL）
+class TripDay(Base):
+    __tablename__ = "trip_days"
+    __table_args__ = (UniqueConstraint("trip_id", "day"),)
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    trip_id = Column(UUID(as_uuid=True), ForeignKey("trips.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Integer, nullable=False)
+    title = Column(Text)
+    summary = Column(Text)
+
+class TripActivity(Base):
+    __tablename__ = "trip_activities"
+    __table_args__ = (UniqueConstraint("trip_day_id", "position"),)
+    
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    trip_day_id = Column(UUID(as_uuid=True), ForeignKey("trip_days.id", ondelete="CASCADE"), nullable=False)
+    trip_id = Column(UUID(as_uuid=True), ForeignKey("trips.id", ondelete="CASCADE"), nullable=False, index=True)
+    position = Column(Integer, nullable=False)
+    time = Column(Text)
+    name = Column(Text, nullable=False)
+    description = Column(Text)
+    address = Column(Text)
+    location = Column(Text)  # 经度,纬度
+    cost = Column(DECIMAL(10, 2))
+    category = Column(Text)
+
 # 按照需求文档5.1.4规范更新费用记录表
 class Expense(Base):
     __tablename__ = "expenses"
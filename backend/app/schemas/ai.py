@@ -1,7 +1,9 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from typing import Optional, List, Dict, Any
 from datetime import date
 from decimal import Decimal
+from app.schemas.map import RouteMatrixStop, COORDINATE_PATTERN
+from app.schemas.trip import ItineraryDay
 
 class AIPlanRequest(BaseModel):
     """AI规划请求模型"""
@@ -14,7 +16,8 @@ class AIPlanRequest(BaseModel):
 
 class AIPlanResponse(BaseModel):
     """AI规划响应模型"""
-    itinerary: str = Field(..., description="行程安排")
+    itinerary: str = Field(..., description="行程安排（文本，由结构化行程生成或为模型原始输出）")
+    itinerary_days: List[ItineraryDay] = Field(default_factory=list, description="结构化行程，模型输出无法解析时为空")
     budget_usage: Dict[str, Any] = Field(default_factory=dict, description="预算使用情况")
     recommendations: List[Dict[str, Any]] = Field(default_factory=list, description="推荐信息")
     weather_info: Dict[str, Any] = Field(default_factory=dict, description="天气信息")
@@ -43,4 +46,60 @@ class TravelRequirementsParseResponse(BaseModel):
     budget: Decimal = Field(..., description="解析出的预算")
     travelers: int = Field(..., description="解析出的同行人数")
     status: str = Field(..., description="状态：success/error")
-    error: Optional[str] = Field(None, description="错误信息")
\ No newline at end of file
+    error: Optional[str] = Field(None, description="错误信息")
+
+# 营业时间格式HH:MM
+CLOCK_PATTERN = r"^([01]?\d|2[0-3]):[0-5]\d$"
+# 行程顺序优化：单个请求所有天的站点总数上限
+OPTIMIZE_MAX_TOTAL_STOPS = 300
+
+class OptimizeStop(RouteMatrixStop):
+    """待排序的游览站点，坐标和地址至少提供一个"""
+    stay_minutes: int = Field(60, ge=0, le=24 * 60, description="游玩时长（分钟）")
+    open_time: Optional[str] = Field(None, pattern=CLOCK_PATTERN, description="开门时间，格式HH:MM")
+    close_time: Optional[str] = Field(None, pattern=CLOCK_PATTERN, description="关门时间，格式HH:MM")
+
+class OptimizeDay(BaseModel):
+    """一天的行程"""
+    day: int = Field(..., ge=1, description="第几天")
+    start_location: Optional[str] = Field(None, pattern=COORDINATE_PATTERN, description="出发点坐标（如酒店），格式：经度,纬度；不提供时起点不固定")
+    start_time: str = Field("09:00", pattern=CLOCK_PATTERN, description="出发时间，格式HH:MM")
+    stops: List[OptimizeStop] = Field(..., min_length=1, max_length=100, description="当天的游览站点")
+
+class OptimizePlanRequest(BaseModel):
+    """行程顺序优化请求模型"""
+    days: List[OptimizeDay] = Field(..., min_length=1, max_length=30, description="各天行程")
+    speed_kmh: float = Field(30.0, gt=0, le=200, description="平均交通速度（公里/小时），用于估算交通时间")
+    return_to_start: bool = Field(False, description="是否需要返回出发点")
+
+    @model_validator(mode="after")
+    def check_total_stops(self):
+        # 排序在线程池中同步执行，限制单个请求的总计算量
+        if sum(len(day.stops) for day in self.days) > OPTIMIZE_MAX_TOTAL_STOPS:
+            raise ValueError(f"所有天的站点总数不能超过{OPTIMIZE_MAX_TOTAL_STOPS}")
+        return self
+
+class OptimizedStop(OptimizeStop):
+    """排序后的站点及时间安排"""
+    original_index: int = Field(..., description="在请求中的序号")
+    arrival_time: str = Field(..., description="预计到达（开始游玩）时间")
+    departure_time: str = Field(..., description="预计离开时间")
+    distance_km: float = Field(..., description="与上一站的直线距离（公里）")
+    travel_minutes: float = Field(..., description="与上一站的预计交通时间（分钟）")
+    wait_minutes: float = Field(..., description="等待开门的时间（分钟）")
+    late: bool = Field(..., description="是否晚于关门时间")
+
+class OptimizedDay(BaseModel):
+    """优化后的一天行程"""
+    day: int = Field(..., description="第几天")
+    stops: List[OptimizedStop] = Field(default_factory=list, description="排序后的站点")
+    total_distance_km: float = Field(..., description="优化后的总直线距离（公里）")
+    original_distance_km: float = Field(..., description="原顺序的总直线距离（公里）")
+    late_count: int = Field(..., description="无法满足营业时间的站点数")
+    unresolved: List[OptimizeStop] = Field(default_factory=list, description="无法解析坐标、未参与排序的站点")
+
+class OptimizePlanResponse(BaseModel):
+    """行程顺序优化响应模型"""
+    days: List[OptimizedDay] = Field(..., description="优化后的各天行程")
+    elapsed_ms: float = Field(..., description="排序计算耗时（毫秒，不含地址解析）")
+    status: str = Field(..., description="状态：success/error")
@@ -2,6 +2,7 @@ from pydantic import BaseModel
 from typing import Optional, List
 from uuid import UUID
 from datetime import datetime
+from app.core.responses import row_adapter
 
 class UserCreate(BaseModel):
     username: str
@@ -63,4 +64,7 @@ class UserPreferenceListResponse(BaseModel):
     preferences: List[UserPreferenceResponse]
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# 偏好列表响应的TypeAdapter - 模块加载时构建一次，直接序列化为JSON字节
+preference_list_adapter = row_adapter(UserPreferenceListResponse)
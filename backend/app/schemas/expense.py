@@ -1,8 +1,9 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import Optional, List
 from uuid import UUID
 from datetime import datetime, date
 from decimal import Decimal
+from app.core.responses import row_adapter
 
 # 费用记录创建请求 - 按照需求文档5.1.4规范
 class ExpenseCreate(BaseModel):
@@ -34,10 +35,29 @@ class ExpenseResponse(BaseModel):
             Decimal: lambda v: float(v) if v else None
         }
 
+# 列表响应的TypeAdapter - 模块加载时构建一次，列表接口直接序列化为JSON字节
+expense_list_adapter = row_adapter(List[ExpenseResponse])
+
+# 按天费用统计
+class DailyExpenseSummary(BaseModel):
+    expense_date: date = Field(..., description="消费日期")
+    total_amount: float = Field(..., description="当天总金额")
+    expense_count: int = Field(..., description="当天费用记录数量")
+
+# 按旅行计划费用统计
+class TripExpenseSummary(BaseModel):
+    trip_id: UUID = Field(..., description="旅行计划ID")
+    total_amount: float = Field(..., description="该旅行计划总金额")
+    expense_count: int = Field(..., description="该旅行计划费用记录数量")
+
 # 费用统计响应模型
 class ExpenseSummaryResponse(BaseModel):
     total_amount: float = Field(..., description="总金额")
     expense_count: int = Field(..., description="费用记录数量")
+    min_amount: Optional[float] = Field(None, description="单笔最小金额")
+    max_amount: Optional[float] = Field(None, description="单笔最大金额")
+    by_day: List[DailyExpenseSummary] = Field(default_factory=list, description="按天统计")
+    by_trip: List[TripExpenseSummary] = Field(default_factory=list, description="按旅行计划统计（仅用户统计）")
 
     class Config:
         from_attributes = True
\ No newline at end of file
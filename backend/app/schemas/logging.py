@@ -0,0 +1,8 @@
+from pydantic import BaseModel, Field
+from typing import Literal, Optional
+
+class LogLevelUpdate(BaseModel):
+    """运行时调整日志级别请求模型"""
+    logger: Optional[str] = Field(None, description="日志名称，如app.core.speech_client，为空时调整根日志")
+    level: Optional[Literal["DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL"]] = Field(None, description="日志级别")
+    session_sample_rate: Optional[float] = Field(None, ge=0, le=1, description="输出调试日志的会话比例（对新会话生效）")
@@ -0,0 +1,30 @@
+from pydantic import BaseModel, Field, model_validator
+from typing import List, Literal, Optional
+
+# "经度,纬度"格式的坐标
+COORDINATE_PATTERN = r"^\s*-?\d{1,3}(?:\.\d+)?\s*,\s*-?\d{1,2}(?:\.\d+)?\s*$"
+
+class RouteMatrixStop(BaseModel):
+    """路线矩阵中的一个行程站点，坐标和地址至少提供一个"""
+    name: Optional[str] = Field(None, description="站点名称（仅用于前端展示）")
+    location: Optional[str] = Field(None, pattern=COORDINATE_PATTERN, description="坐标，格式：经度,纬度")
+    address: Optional[str] = Field(None, description="地址，未提供坐标时解析为坐标")
+    city: Optional[str] = Field(None, description="地址所在城市（可选）")
+
+    @model_validator(mode="after")
+    def check_location_or_address(self):
+        if not self.location and not self.address:
+            raise ValueError("站点必须提供location或address")
+        return self
+
+class RouteMatrixRequest(BaseModel):
+    """路线矩阵请求模型"""
+    stops: List[RouteMatrixStop] = Field(..., min_length=2, max_length=50, description="行程站点")
+    type: Literal[0, 1, 3] = Field(1, description="距离类型：0-直线距离,1-驾车,3-步行（步行仅支持5公里以内）")
+
+class RouteMatrixResponse(BaseModel):
+    """路线矩阵响应模型，矩阵第i行第j列为站点i到站点j的距离/时间，无法计算时为null"""
+    locations: List[Optional[str]] = Field(..., description="各站点坐标，无法解析时为null")
+    distances: List[List[Optional[int]]] = Field(..., description="距离矩阵（米）")
+    durations: List[List[Optional[int]]] = Field(..., description="时间矩阵（秒）")
+    unresolved: List[int] = Field(default_factory=list, description="无法解析坐标的站点序号")
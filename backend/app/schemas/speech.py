@@ -7,6 +7,7 @@ class SpeechRecognitionResponse(BaseModel):
     transcript: str
     confidence: float
     language: str
+    duration: Optional[float] = None  # 音频时长（秒）
     error: Optional[str] = None
 
 class RealTimeTranscriptionResponse(BaseModel):
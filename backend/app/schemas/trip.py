@@ -1,8 +1,35 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from uuid import UUID
 from datetime import datetime, date  # 添加date导入
 from decimal import Decimal
+from app.core.responses import row_adapter
+
+# 活动费用上限，与trip_activities.cost的numeric(10, 2)一致
+MAX_ACTIVITY_COST = Decimal("99999999.99")
+
+# 结构化行程：按天组织的活动安排（与trip_days/trip_activities表对应）
+class ItineraryActivity(BaseModel):
+    """一项活动：景点、餐饮、交通或住宿"""
+    time: Optional[str] = Field(None, max_length=20, description="开始时间，如09:00")
+    name: str = Field(..., min_length=1, max_length=200, description="活动或地点名称")
+    description: Optional[str] = Field(None, max_length=2000, description="活动说明")
+    address: Optional[str] = Field(None, max_length=300, description="地址")
+    location: Optional[str] = Field(None, description="坐标，格式：经度,纬度")
+    cost: Optional[Decimal] = Field(None, ge=0, le=MAX_ACTIVITY_COST, description="预计花费（元）")
+    category: Optional[str] = Field(None, max_length=20, description="类型：景点/餐饮/交通/住宿/其他")
+
+    class Config:
+        json_encoders = {
+            Decimal: lambda v: float(v) if v is not None else None
+        }
+
+class ItineraryDay(BaseModel):
+    """一天的行程"""
+    day: int = Field(..., ge=1, description="第几天")
+    title: Optional[str] = Field(None, max_length=200, description="当天主题")
+    summary: Optional[str] = Field(None, max_length=2000, description="当天概述")
+    activities: List[ItineraryActivity] = Field(default_factory=list, description="按时间顺序排列的活动")
 
 # 旅行计划创建请求 - 简化版
 class TripCreate(BaseModel):
@@ -13,6 +40,7 @@ class TripCreate(BaseModel):
     days: int = Field(..., ge=1, description="旅行天数")
     preference_id: Optional[UUID] = None
     plan: Optional[str] = None
+    itinerary_days: Optional[List[ItineraryDay]] = Field(None, description="结构化行程，保存到trip_days/trip_activities")
 
 # 旅行计划更新请求 - 简化版
 class TripUpdate(BaseModel):
@@ -23,6 +51,7 @@ class TripUpdate(BaseModel):
     days: Optional[int] = Field(None, ge=1, description="旅行天数")
     preference_id: Optional[UUID] = None
     plan: Optional[str] = None
+    itinerary_days: Optional[List[ItineraryDay]] = Field(None, description="结构化行程，提供时整体替换已保存的行程")
 
 # 旅行计划简要信息响应 - 用于列表显示
 class TripBriefResponse(BaseModel):
@@ -63,6 +92,10 @@ class TripResponse(BaseModel):
             Decimal: lambda v: float(v) if v else None
         }
 
+# 列表响应的TypeAdapter - 模块加载时构建一次，列表接口直接序列化为JSON字节
+trip_brief_list_adapter = row_adapter(List[TripBriefResponse])
+itinerary_days_adapter = row_adapter(List[ItineraryDay])
+
 # 费用记录
 # 删除费用记录相关模型，因为它们已经在独立的expense.py文件中定义
 # class ExpenseCreate(BaseModel):
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+行程压缩基准
+用合成的行程文本（结构、用词与模型生成的行程相近）比较存储大小和编解码吞吐：
+- 原文、zlib、不带字典的zstd、带训练字典的zstd（压缩结果都按base64文本计算大小，与存入plan列时一致）
+- 编码/解码吞吐（原文MB/s）和单条行程的平均耗时
+
+字典在训练集上训练，在另外的测试集上评估。需要安装zstandard。
+
+运行方式（在backend目录下）：python -m benchmarks.plan_codec [--plans 1000] [--levels 3 9 19]
+"""
+
+import os
+import zlib
+import base64
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from decimal import Decimal
+
+# 基准不连接真实服务，为必填配置提供占位值
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark.benchmark.benchmark")  # 需符合JWT格式
+os.environ.setdefault("FRONTEND_URL", "http://localhost")
+for _name in ["ALIYUN_AI_KEY", "MAP_API_KEY", "SPEECH_APP_ID", "SPEECH_API_KEY", "SECRET_KEY", "JWT_SECRET"]:
+    os.environ.setdefault(_name, "benchmark")
+
+from app.core.plan_codec import PlanCodec, zstandard
+from app.core.itinerary_parser import render_itinerary_text
+from app.schemas.trip import ItineraryActivity, ItineraryDay
+
+DESTINATIONS = {
+    "杭州": ["西湖", "灵隐寺", "雷峰塔", "河坊街", "西溪湿地", "千岛湖", "宋城", "龙井村"],
+    "成都": ["宽窄巷子", "锦里", "武侯祠", "大熊猫繁育研究基地", "春熙路", "都江堰", "青城山", "杜甫草堂"],
+    "西安": ["兵马俑", "大雁塔", "回民街", "古城墙", "华清宫", "陕西历史博物馆", "钟楼", "大唐不夜城"],
+    "东京": ["浅草寺", "东京塔", "涩谷", "新宿御苑", "上野公园", "筑地市场", "银座", "秋叶原"],
+    "三亚": ["亚龙湾", "天涯海角", "南山寺", "蜈支洲岛", "大东海", "鹿回头", "第一市场", "椰梦长廊"]
+}
+FOODS = ["当地特色小吃", "老字号餐厅", "海鲜大排档", "网红咖啡馆", "夜市美食", "酒店自助早餐", "火锅", "面馆"]
+CATEGORIES = ["景点", "餐饮", "交通", "住宿"]
+DESCRIPTIONS = [
+    "建议提前在官方渠道预约门票，避开节假日高峰，游览时间约2-3小时。",
+    "乘坐地铁或打车前往，车程约30分钟，沿途可欣赏城市风光。",
+    "推荐品尝招牌菜，人均消费适中，用餐高峰期可能需要排队。",
+    "适合拍照打卡，傍晚时分景色最佳，注意随身携带防晒用品。",
+    "入住市中心酒店，交通便利，周边有便利店和餐厅。",
+    "自由活动时间，可根据体力和兴趣灵活安排。"
+]
+
+def make_plan(rng: random.Random) -> str:
+    """生成一份合成行程文本"""
+    destination = rng.choice(list(DESTINATIONS))
+    spots = DESTINATIONS[destination]
+    day_count = rng.randint(3, 8)
+    days = []
+    for day in range(1, day_count + 1):
+        activities = []
+        for hour in range(8, 21, rng.choice([2, 3])):
+            category = rng.choice(CATEGORIES)
+            name = rng.choice(FOODS) if category == "餐饮" else rng.choice(spots)
+            activities.append(ItineraryActivity(
+                time=f"{hour:02d}:{rng.choice(['00', '30'])}",
+                name=name,
+                description=rng.choice(DESCRIPTIONS),
+                address=f"{destination}市{rng.choice(['东城区', '西湖区', '中心区', '南山区'])}{rng.randint(1, 300)}号",
+                cost=Decimal(rng.choice([0, 30, 50, 80, 120, 200, 350])),
+                category=category
+            ))
+        days.append(ItineraryDay(day=day, title=f"{destination}{rng.choice(spots)}一日游", summary=rng.choice(DESCRIPTIONS), activities=activities))
+    overview = f"{destination}{day_count}日游行程，兼顾经典景点与当地美食，预算分配合理。"
+    tips = ["注意天气变化，随身携带雨具", "热门景点提前预约门票", "保管好个人财物"]
+    return render_itinerary_text(days, overview, tips)
+
+def measure(name: str, encode, decode, plans):
+    raw_bytes = sum(len(plan.encode("utf-8")) for plan in plans)
+
+    start = time.perf_counter()
+    encoded = [encode(plan) for plan in plans]
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = [decode(value) for value in encoded]
+    decode_seconds = time.perf_counter() - start
+
+    assert decoded == plans, f"{name}解码结果与原文不一致"
+    stored_bytes = sum(len(value.encode("utf-8")) for value in encoded)
+    print(
+        f"{name:<22} {stored_bytes / len(plans) / 1024:>9.1f}KB {stored_bytes / raw_bytes:>7.1%} "
+        f"{raw_bytes / encode_seconds / 1e6:>9.1f} {raw_bytes / decode_seconds / 1e6:>9.1f} "
+        f"{encode_seconds / len(plans) * 1e6:>9.0f} {decode_seconds / len(plans) * 1e6:>9.0f}"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="行程压缩基准")
+    parser.add_argument("--plans", type=int, default=1000, help="合成行程数量（一半训练字典，一半评估）")
+    parser.add_argument("--levels", type=int, nargs="+", default=[3, 9, 19], help="评估的zstd压缩级别")
+    parser.add_argument("--dict-size", type=int, default=64 * 1024, help="字典大小（字节）")
+    args = parser.parse_args()
+
+    if zstandard is None:
+        print("❌ 需要安装zstandard")
+        return
+
+    rng = random.Random(42)
+    plans = [make_plan(rng) for _ in range(args.plans)]
+    training, testing = plans[:len(plans) // 2], plans[len(plans) // 2:]
+    sizes = [len(plan.encode("utf-8")) for plan in testing]
+    print(f"测试集{len(testing)}条行程，原文平均{statistics.mean(sizes) / 1024:.1f}KB（UTF-8）\n")
+
+    print(f"{'编码方式':<22} {'平均大小':>11} {'比例':>7} {'编码MB/s':>9} {'解码MB/s':>9} {'编码μs':>9} {'解码μs':>9}")
+    measure("原文", lambda plan: plan, lambda value: value, testing)
+    measure(
+        "zlib-6",
+        lambda plan: base64.b64encode(zlib.compress(plan.encode("utf-8"), 6)).decode("ascii"),
+        lambda value: zlib.decompress(base64.b64decode(value)).decode("utf-8"),
+        testing
+    )
+
+    with tempfile.TemporaryDirectory() as dict_dir:
+        for level in args.levels:
+            codec = PlanCodec(dict_dir, level=level, min_bytes=0)
+            measure(f"zstd-{level}", codec.encode, codec.decode, testing)
+
+        trainer = PlanCodec(dict_dir, level=args.levels[0], min_bytes=0)
+        start = time.perf_counter()
+        dict_id = trainer.train(training, args.dict_size)
+        print(f"\n字典{dict_id}（{args.dict_size // 1024}KB）训练耗时{time.perf_counter() - start:.2f}s，训练集{len(training)}条\n")
+
+        for level in args.levels:
+            codec = PlanCodec(dict_dir, level=level, min_bytes=0)
+            measure(f"zstd-{level}+字典", codec.encode, codec.decode, testing)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+旅行需求解析基准
+在标注语料上比较本地规则解析和大模型解析的准确率与延迟：
+- 规则路径：覆盖率（无需调用模型的比例）、字段准确率、单次耗时
+- 模型路径（--llm，需要.env.dev或环境变量中的真实配置）：字段准确率、单次耗时
+
+运行方式（在backend目录下）：python -m benchmarks.requirements_parser [--llm]
+"""
+
+import time
+import asyncio
+import argparse
+import statistics
+
+from app.core.requirements_parser import parse_travel_requirements
+
+# (输入, 期望的目的地, 天数, 预算, 人数)
+CORPUS = [
+    ("我想去日本东京玩7天，预算15000元，3人同行", "日本东京", 7, 15000, 3),
+    ("去成都玩5天，预算8000，两个人", "成都", 5, 8000, 2),
+    ("计划去泰国曼谷旅游一周，预算2万元，4人", "泰国曼谷", 7, 20000, 4),
+    ("三亚5天4晚，预算1.5万，情侣出行", "三亚", 5, 15000, 2),
+    ("一家三口去北京玩六天，预算两万块", "北京", 6, 20000, 3),
+    ("独自去西藏拉萨10天，预算一万", "西藏拉萨", 10, 10000, 1),
+    ("周末去杭州，预算3000元，2人", "杭州", 2, 3000, 2),
+    ("去韩国首尔4天，人均5000元，3人", "韩国首尔", 4, 15000, 3),
+    ("想去云南大理玩8天，预算12000元，2个人", "云南大理", 8, 12000, 2),
+    ("我和2个朋友去重庆玩3天，预算6000", "重庆", 3, 6000, 3),
+    ("两个大人一个小孩去上海迪士尼3天，预算1万", "上海", 3, 10000, 3),
+    ("去法国巴黎度蜜月10天，预算五万", "法国巴黎", 10, 50000, 2),
+    ("新加坡4日游，预算12k，2人", "新加坡", 4, 12000, 2),
+    ("西安三日游，预算2000元，1人", "西安", 3, 2000, 1),
+    ("从上海出发去厦门玩4天，预算5000元，2人", "厦门", 4, 5000, 2),
+    ("冲绳5天，预算一万五，2人", "冲绳", 5, 15000, 2),
+    ("去桂林阳朔玩5天", "桂林", 5, 10000, 2),
+    ("去新疆玩两周，预算3万，4个人", "新疆", 14, 30000, 4),
+    ("带爸妈去青岛玩4天，预算8000", "青岛", 4, 8000, 3),
+    ("去哈尔滨看冰雕，5天，预算6000元，3人同行", "哈尔滨", 5, 6000, 3),
+    ("我想去巴厘岛，6天，预算1万到2万，2人", "巴厘岛", 6, 15000, 2),
+    ("想带孩子出去玩几天，海边就行", "", 7, 10000, 3),
+    ("去欧洲玩半个月，预算五万，2人", "欧洲", 15, 50000, 2),
+    ("去意大利罗马和威尼斯10天，预算4万，2人", "意大利罗马、威尼斯", 10, 40000, 2),
+    ("我要去美国纽约玩12天，预算八万元，两个人", "美国纽约", 12, 80000, 2),
+    ("去张家界3天2晚，预算2500元，1个人", "张家界", 3, 2500, 1),
+    ("去丽江5晚，预算6000元，2人", "丽江", 6, 6000, 2),
+    ("下个月去迪拜玩6天，预算3万，2人", "迪拜", 6, 30000, 2),
+    ("去敦煌玩4天，预算4000元，4人", "敦煌", 4, 4000, 4),
+    ("去土耳其伊斯坦布尔玩9天，人均预算1万，2人", "土耳其伊斯坦布尔", 9, 20000, 2),
+    # 金额没有写元/块，规则不能识别，不应使用默认预算
+    ("去西安玩10天 2人 人均3000", "西安", 10, 6000, 2),
+    ("去东京玩5天，预算3000元/人，2人", "东京", 5, 6000, 2),
+    ("去成都玩4天，预算2000元每人，3人", "成都", 4, 6000, 3),
+    # 外币金额需要换算（期望预算按大致汇率折算为人民币），约数天数交给大模型
+    ("去日本大阪玩4天，预算1万日元，1人", "日本大阪", 4, 500, 1),
+    ("去香港玩3天，预算5000港币，2人", "香港", 3, 4600, 2),
+    ("去美国纽约玩7天，预算3000美元，1人", "美国纽约", 7, 21000, 1),
+    ("去杭州玩两三天，预算2000元，2人", "杭州", 3, 2000, 2),
+]
+
+FIELDS = ["destination", "duration", "budget", "travelers"]
+
+def _expected(item):
+    text, destination, duration, budget, travelers = item
+    return {"destination": destination, "duration": duration, "budget": float(budget), "travelers": travelers}
+
+def _correct_fields(result, expected) -> int:
+    return sum(1 for field in FIELDS if result.get(field) == expected[field])
+
+def run_rules(repeat: int):
+    handled = 0
+    correct = 0
+    timings = []
+    print("规则解析：")
+    for item in CORPUS:
+        text = item[0]
+        start = time.perf_counter()
+        for _ in range(repeat):
+            result = parse_travel_requirements(text)
+        timings.append((time.perf_counter() - start) / repeat * 1e6)
+
+        if result is None:
+            print(f"  → 模型  {text}")
+            continue
+        handled += 1
+        fields = _correct_fields(result, _expected(item))
+        correct += fields
+        mark = "✓" if fields == len(FIELDS) else "✗"
+        print(f"  {mark} 规则  {text}  =>  {result['destination']}/{result['duration']}天/{result['budget']:.0f}元/{result['travelers']}人")
+
+    print(f"\n  覆盖率：{handled}/{len(CORPUS)} ({handled / len(CORPUS):.0%}) 无需调用模型")
+    if handled:
+        print(f"  规则路径字段准确率：{correct / (handled * len(FIELDS)):.1%}")
+    print(f"  单次耗时：中位数 {statistics.median(timings):.1f}μs，最大 {max(timings):.1f}μs")
+
+async def run_llm():
+    from app.core.ai_client import ai_client
+
+    correct = 0
+    total = 0
+    timings = []
+    print("\n模型解析：")
+    for item in CORPUS:
+        text = item[0]
+        start = time.perf_counter()
+        result = await ai_client.parse_travel_requirements_with_llm(text)
+        timings.append((time.perf_counter() - start) * 1000)
+        if result["status"] != "success":
+            print(f"  ✗ 失败  {text}  ({result.get('error')})")
+            total += len(FIELDS)
+            continue
+        fields = _correct_fields(result, _expected(item))
+        correct += fields
+        total += len(FIELDS)
+        mark = "✓" if fields == len(FIELDS) else "✗"
+        print(f"  {mark} {timings[-1]:.0f}ms  {text}  =>  {result['destination']}/{result['duration']}天/{result['budget']:.0f}元/{result['travelers']}人")
+
+    print(f"\n  模型路径字段准确率：{correct / total:.1%}")
+    print(f"  单次耗时：中位数 {statistics.median(timings):.0f}ms，最大 {max(timings):.0f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="旅行需求解析基准")
+    parser.add_argument("--llm", action="store_true", help="同时测试大模型解析（会产生API调用费用）")
+    parser.add_argument("--repeat", type=int, default=1000, help="规则解析每条输入的重复次数")
+    args = parser.parse_args()
+
+    run_rules(args.repeat)
+
+    if args.llm:
+        # 模型路径读取.env.dev或环境变量中的真实配置
+        asyncio.run(run_llm())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+GET /trips 查询次数基准
+使用内存中的假PostgREST客户端，统计不同旅行计划数量下每页请求的数据库往返次数，
+验证偏好名称批量查询后查询次数不随旅行计划数量增长。
+
+运行方式（在backend目录下）：python -m benchmarks.trips_query_count
+"""
+
+import os
+import asyncio
+import uuid
+from datetime import datetime, timedelta
+
+# 基准不连接真实服务，为必填配置提供占位值
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("SUPABASE_KEY", "benchmark.benchmark.benchmark")  # 需符合JWT格式
+os.environ.setdefault("FRONTEND_URL", "http://localhost")
+for _name in ["ALIYUN_AI_KEY", "MAP_API_KEY", "SPEECH_APP_ID", "SPEECH_API_KEY", "SECRET_KEY", "JWT_SECRET"]:
+    os.environ.setdefault(_name, "benchmark")
+
+import httpx
+from fastapi import Request
+from app.core.supabase_client import AsyncSupabaseClient
+from app.api.api_v1.endpoints.trips import get_trips
+
+class _FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+class _FakeQuery:
+    """只实现基准用到的过滤条件；or游标条件被忽略，因此只统计往返次数，不校验分页内容"""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.columns = None
+        self.filters = []
+        self.row_limit = None
+        self.params = httpx.QueryParams()
+
+    def select(self, columns):
+        self.columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: str(row.get(column)) == str(value))
+        return self
+
+    def in_(self, column, values):
+        values = {str(v) for v in values}
+        self.filters.append(lambda row: str(row.get(column)) in values)
+        return self
+
+    def order(self, column, desc=False):
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if all(f(row) for f in self.filters)]
+        if self.row_limit is not None:
+            rows = rows[:self.row_limit]
+        return _FakeResponse([{c: row.get(c) for c in self.columns} for row in rows])
+
+class _FakeClient:
+    def __init__(self):
+        self.tables = {"trips": [], "user_preferences": []}
+
+    def table(self, name):
+        return _FakeQuery(self.tables[name])
+
+def _seed(client: _FakeClient, user_id: str, trip_count: int):
+    preference_ids = [str(uuid.uuid4()) for _ in range(5)]
+    for index, preference_id in enumerate(preference_ids):
+        client.tables["user_preferences"].append({"id": preference_id, "user_id": user_id, "name": f"偏好{index}"})
+
+    start = datetime(2025, 1, 1)
+    for index in range(trip_count):
+        client.tables["trips"].append({
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "title": f"旅行{index}",
+            "destination": "东京",
+            "budget": 10000,
+            "travelers_count": 2,
+            "days": 5,
+            "preference_id": preference_ids[index % len(preference_ids)],
+            "created_at": (start + timedelta(minutes=index)).isoformat()
+        })
+
+def _request() -> Request:
+    """不带If-None-Match的GET /trips请求"""
+    return Request({"type": "http", "method": "GET", "path": "/api/v1/trips", "headers": [], "query_string": b""})
+
+async def _measure(trip_count: int, page_size: int) -> int:
+    client = _FakeClient()
+    user_id = str(uuid.uuid4())
+    _seed(client, user_id, trip_count)
+
+    db = AsyncSupabaseClient(client, max_workers=4)
+    try:
+        await get_trips(
+            request=_request(),
+            limit=page_size,
+            cursor=None,
+            fields=None,  # 直接调用接口函数时不会解析Query默认值，需要显式传入
+            supabase=db,
+            current_user={"id": user_id}
+        )
+        return db.query_count
+    finally:
+        db.shutdown()
+
+async def main():
+    page_size = 100
+    print(f"{'旅行计划数':>10} {'每页查询次数':>12}")
+    counts = []
+    for trip_count in [1, 10, 100, 1000, 10000]:
+        count = await _measure(trip_count, page_size)
+        counts.append(count)
+        print(f"{trip_count:>10} {count:>12}")
+
+    assert len(set(counts)) == 1, "查询次数随旅行计划数量变化"
+    print(f"\n✓ 查询次数恒定为{counts[0]}次/页")
+
+if __name__ == "__main__":
+    asyncio.run(main())
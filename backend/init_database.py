@@ -7,8 +7,197 @@
 import os
 import sys
 import asyncio
+import hashlib
+import argparse
 from app.core.supabase_client import get_supabase_client
 from app.core.config import settings
+from app.core.plan_codec import plan_codec
+
+# 统计聚合函数 - 在数据库端完成求和/计数/最值和按天、按行程分组，供统计接口一次往返获取
+SUMMARY_FUNCTIONS_SQL = """
+create or replace function trip_budget_summary(p_user_id uuid)
+returns json
+language sql stable
+as $$
+    select json_build_object(
+        'total_budget', coalesce(sum(budget), 0),
+        'trip_count', count(*),
+        'budget_trip_count', count(budget),
+        'min_budget', min(budget),
+        'max_budget', max(budget)
+    )
+    from trips
+    where user_id = p_user_id;
+$$;
+
+create or replace function trip_expense_summary(p_trip_id uuid)
+returns json
+language sql stable
+as $$
+    select json_build_object(
+        'total_amount', coalesce(sum(amount), 0),
+        'expense_count', count(*),
+        'min_amount', min(amount),
+        'max_amount', max(amount),
+        'by_day', coalesce((
+            select json_agg(d order by d.expense_date)
+            from (
+                select expense_date, sum(amount) as total_amount, count(*) as expense_count
+                from expenses
+                where trip_id = p_trip_id
+                group by expense_date
+            ) d
+        ), '[]'::json)
+    )
+    from expenses
+    where trip_id = p_trip_id;
+$$;
+
+create or replace function user_expense_summary(p_user_id uuid)
+returns json
+language sql stable
+as $$
+    with user_expenses as (
+        select e.trip_id, e.amount, e.expense_date
+        from expenses e
+        join trips t on t.id = e.trip_id
+        where t.user_id = p_user_id
+    )
+    select json_build_object(
+        'total_amount', coalesce(sum(amount), 0),
+        'expense_count', count(*),
+        'min_amount', min(amount),
+        'max_amount', max(amount),
+        'by_day', coalesce((
+            select json_agg(d order by d.expense_date)
+            from (
+                select expense_date, sum(amount) as total_amount, count(*) as expense_count
+                from user_expenses
+                group by expense_date
+            ) d
+        ), '[]'::json),
+        'by_trip', coalesce((
+            select json_agg(t)
+            from (
+                select trip_id, sum(amount) as total_amount, count(*) as expense_count
+                from user_expenses
+                group by trip_id
+            ) t
+        ), '[]'::json)
+    )
+    from user_expenses;
+$$;
+
+create index if not exists idx_trips_user_id on trips (user_id);
+create index if not exists idx_expenses_trip_id_date on expenses (trip_id, expense_date);
+"""
+
+# 结构化行程 - 按天存储，客户端可以只获取某一天；删除旅行计划时级联删除
+ITINERARY_SQL = """
+create table if not exists trip_days (
+    id uuid primary key default gen_random_uuid(),
+    trip_id uuid not null references trips(id) on delete cascade,
+    day integer not null check (day >= 1),
+    title text,
+    summary text,
+    unique (trip_id, day)
+);
+
+create table if not exists trip_activities (
+    id uuid primary key default gen_random_uuid(),
+    trip_day_id uuid not null references trip_days(id) on delete cascade,
+    trip_id uuid not null references trips(id) on delete cascade,
+    position integer not null,
+    time text,
+    name text not null,
+    description text,
+    address text,
+    location text,
+    cost numeric(10, 2),
+    category text,
+    unique (trip_day_id, position)
+);
+
+create index if not exists idx_trip_activities_trip_id on trip_activities (trip_id);
+
+-- 在一个事务中整体替换行程：删除旧的天（活动级联删除），再按数组顺序写入天和活动，返回写入的天数
+-- 函数需要有返回值：PostgREST对void函数返回空响应体，supabase-py会当作错误抛出
+-- 修改返回类型不能用create or replace，先删除旧版本（returns void）
+drop function if exists save_trip_itinerary(uuid, json);
+create function save_trip_itinerary(p_trip_id uuid, p_days json)
+returns integer
+language plpgsql
+as $$
+begin
+    delete from trip_days where trip_id = p_trip_id;
+
+    with inserted_days as (
+        insert into trip_days (trip_id, day, title, summary)
+        select p_trip_id, (d->>'day')::integer, d->>'title', d->>'summary'
+        from json_array_elements(coalesce(p_days, '[]'::json)) d
+        returning id, day
+    )
+    insert into trip_activities (trip_day_id, trip_id, position, time, name, description, address, location, cost, category)
+    select inserted_days.id, p_trip_id, a.position - 1,
+           a.value->>'time', a.value->>'name', a.value->>'description', a.value->>'address',
+           a.value->>'location', (a.value->>'cost')::numeric, a.value->>'category'
+    from json_array_elements(coalesce(p_days, '[]'::json)) d
+    join inserted_days on inserted_days.day = (d->>'day')::integer
+    cross join lateral json_array_elements(coalesce(d->'activities', '[]'::json)) with ordinality as a(value, position);
+
+    return json_array_length(coalesce(p_days, '[]'::json));
+end;
+$$;
+"""
+
+# 行版本 - 每次更新时由数据库设置updated_at，接口据此生成ETag/Last-Modified（不依赖调用方是否传入updated_at）
+ROW_VERSION_SQL = """
+-- 事务内设置了app.preserve_updated_at时保留原值（重新压缩行程等不改变内容的维护操作）
+create or replace function set_updated_at()
+returns trigger
+language plpgsql
+as $$
+begin
+    if current_setting('app.preserve_updated_at', true) = 'on' then
+        new.updated_at = old.updated_at;
+    else
+        new.updated_at = now();
+    end if;
+    return new;
+end;
+$$;
+
+-- 重新压缩行程（python init_database.py recompress-plans）：只改变plan的存储编码，解码后的内容不变，
+-- 因此保留updated_at，客户端缓存的ETag/Last-Modified仍然有效；
+-- p_plans为[{"id", "plan", "previous_md5"}]，读取之后被用户修改过的行（md5不一致）不会被覆盖，返回更新的行数
+create or replace function recompress_trip_plans(p_plans json)
+returns integer
+language plpgsql
+as $$
+declare
+    updated_count integer;
+begin
+    perform set_config('app.preserve_updated_at', 'on', true);
+    update trips set plan = p.plan
+    from json_to_recordset(p_plans) as p(id uuid, plan text, previous_md5 text)
+    where trips.id = p.id and md5(trips.plan) = p.previous_md5;
+    get diagnostics updated_count = row_count;
+    return updated_count;
+end;
+$$;
+
+drop trigger if exists trips_set_updated_at on trips;
+create trigger trips_set_updated_at before update on trips
+    for each row execute function set_updated_at();
+
+drop trigger if exists expenses_set_updated_at on expenses;
+create trigger expenses_set_updated_at before update on expenses
+    for each row execute function set_updated_at();
+
+drop trigger if exists user_preferences_set_updated_at on user_preferences;
+create trigger user_preferences_set_updated_at before update on user_preferences
+    for each row execute function set_updated_at();
+"""
 
 async def test_supabase_connection():
     """测试Supabase连接"""
@@ -19,7 +208,7 @@ async def test_supabase_connection():
         
         # 测试简单的查询
         try:
-            response = supabase.table('trips').select('*').limit(1).execute()
+            response = await supabase.execute(supabase.table('trips').select('*').limit(1))
             print("✓ Supabase连接成功，表结构已就绪")
             return True
         except Exception as e:
@@ -31,6 +220,43 @@ async def test_supabase_connection():
         print(f"❌ Supabase连接失败: {e}")
         return False
 
+async def check_summary_functions():
+    """检查统计聚合函数是否已创建"""
+    print("\n开始检查统计聚合函数...")
+    
+    supabase = get_supabase_client()
+    zero_uuid = "00000000-0000-0000-0000-000000000000"
+    try:
+        await supabase.rpc("trip_budget_summary", {"p_user_id": zero_uuid})
+        await supabase.rpc("trip_expense_summary", {"p_trip_id": zero_uuid})
+        await supabase.rpc("user_expense_summary", {"p_user_id": zero_uuid})
+        print("✓ 统计聚合函数已就绪")
+        return True
+    except Exception as e:
+        print(f"⚠️  统计聚合函数不可用: {e}")
+        print("   请在Supabase控制台的SQL编辑器中执行以下脚本：")
+        print(SUMMARY_FUNCTIONS_SQL)
+        return False
+
+async def check_itinerary_storage():
+    """检查结构化行程表和写入函数是否已创建"""
+    print("\n开始检查结构化行程存储...")
+    
+    supabase = get_supabase_client()
+    zero_uuid = "00000000-0000-0000-0000-000000000000"
+    try:
+        await supabase.trip_itineraries.list_days(zero_uuid)
+        saved_days = await supabase.trip_itineraries.save(zero_uuid, [])
+        if saved_days != 0:
+            raise ValueError(f"save_trip_itinerary返回值异常: {saved_days!r}，请重新执行脚本（需返回integer）")
+        print("✓ 结构化行程存储已就绪")
+        return True
+    except Exception as e:
+        print(f"⚠️  结构化行程存储不可用: {e}")
+        print("   请在Supabase控制台的SQL编辑器中执行以下脚本：")
+        print(ITINERARY_SQL)
+        return False
+
 async def test_ai_services():
     """测试AI服务连接"""
     print("\n开始测试AI服务连接...")
@@ -41,8 +267,8 @@ async def test_ai_services():
         from app.core.speech_client import speech_client
         
         # 测试AI客户端
-        result = await ai_client.generate_travel_plan("北京", {})
-        if result["success"]:
+        result = await ai_client.generate_travel_plan("北京")
+        if result.get("status") == "success":
             print("✓ AI服务客户端测试成功")
         else:
             print("⚠️  AI服务客户端测试有警告")
@@ -103,6 +329,13 @@ async def main():
     
     # 测试Supabase连接
     db_success = await test_supabase_connection()
+    if db_success:
+        db_success = await check_summary_functions()
+    if db_success:
+        db_success = await check_itinerary_storage()
+    if db_success:
+        # 触发器无法通过PostgREST检查，只做提示
+        print("\n提示：ETag依赖updated_at触发器，如未创建请执行 python init_database.py print-sql 输出的脚本")
     
     # 测试AI服务
     ai_success = await test_ai_services()
@@ -118,5 +351,130 @@ async def main():
         print("\n❌ 服务测试过程中遇到问题，请检查上述错误信息")
         return False
 
+async def iter_trip_plans(batch_size: int):
+    """按id顺序分批读取所有旅行计划的(id, plan)"""
+    supabase = get_supabase_client()
+    last_id = None
+    while True:
+        query = supabase.table('trips').select('id,plan').order('id').limit(batch_size)
+        if last_id:
+            query = query.gt('id', last_id)
+        rows = (await supabase.execute(query)).data or []
+        for row in rows:
+            yield row
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1]['id']
+
+async def train_plan_dictionary(sample_limit: int, dict_size: int):
+    """用已有的行程训练zstd字典，保存到PLAN_ZSTD_DICT_DIR并设为当前字典"""
+    print(f"开始读取行程样本（最多{sample_limit}条）...")
+    samples = []
+    async for row in iter_trip_plans(500):
+        plan = plan_codec.decode(row.get('plan'))
+        if plan:
+            samples.append(plan)
+        if len(samples) >= sample_limit:
+            break
+    
+    if len(samples) < 20:
+        print(f"❌ 行程样本太少（{len(samples)}条），至少需要20条才能训练字典")
+        return False
+    
+    dict_id = plan_codec.train(samples, dict_size)
+    print(f"✓ 已用{len(samples)}条行程训练字典{dict_id}，保存在{settings.PLAN_ZSTD_DICT_DIR}")
+    print("   请将字典文件随代码一起部署，然后执行 python init_database.py recompress-plans")
+    return True
+
+async def recompress_plans(batch_size: int, dry_run: bool):
+    """用当前字典重新压缩所有旅行计划的plan（原文和用旧字典压缩的行程都会被重写）
+
+    通过数据库函数recompress_trip_plans分批写回，不触发updated_at更新（见ROW_VERSION_SQL）。
+    """
+    if not plan_codec.enabled:
+        print("❌ 行程压缩未启用（PLAN_COMPRESSION_ENABLED或未安装zstandard）")
+        return False
+    
+    supabase = get_supabase_client()
+    print(f"开始重新压缩行程（字典{plan_codec.dict_id or '无'}，压缩级别{plan_codec.level}）...")
+    scanned = updated = failed = skipped = 0
+    before_bytes = after_bytes = 0
+    pending = []
+    
+    async def flush():
+        nonlocal updated, skipped
+        if not pending:
+            return
+        response = await supabase.rpc("recompress_trip_plans", {"p_plans": pending})
+        count = response.data if isinstance(response.data, int) else 0
+        updated += count
+        skipped += len(pending) - count
+        pending.clear()
+    
+    try:
+        async for row in iter_trip_plans(batch_size):
+            scanned += 1
+            stored = row.get('plan')
+            if not stored:
+                continue
+            try:
+                encoded = plan_codec.encode(plan_codec.decode(stored))
+            except Exception as e:
+                failed += 1
+                print(f"⚠️  旅行计划{row['id']}的行程无法解码，已跳过: {e}")
+                continue
+            before_bytes += len(stored.encode('utf-8'))
+            after_bytes += len(encoded.encode('utf-8'))
+            if encoded == stored:
+                continue
+            if dry_run:
+                updated += 1
+                continue
+            pending.append({
+                "id": row['id'],
+                "plan": encoded,
+                "previous_md5": hashlib.md5(stored.encode('utf-8')).hexdigest()
+            })
+            if len(pending) >= batch_size:
+                await flush()
+        await flush()
+    except Exception as e:
+        print(f"❌ 写回行程失败: {e}")
+        print("   请确认已在Supabase SQL编辑器中执行以下脚本（recompress_trip_plans）：")
+        print(ROW_VERSION_SQL)
+        return False
+    
+    ratio = after_bytes / before_bytes if before_bytes else 1
+    action = "需要重写" if dry_run else "已重写"
+    print(f"✓ 扫描{scanned}条，{action}{updated}条，失败{failed}条；plan列 {before_bytes} -> {after_bytes} 字节（{ratio:.1%}）")
+    if skipped:
+        print(f"   {skipped}条在读取后已被修改，未覆盖，可再次执行本命令")
+    return failed == 0
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="服务连接测试与数据库维护")
+    commands = parser.add_subparsers(dest="command")
+    
+    train = commands.add_parser("train-plan-dict", help="用已有行程训练zstd压缩字典")
+    train.add_argument("--samples", type=int, default=2000, help="最多使用的行程样本数")
+    train.add_argument("--dict-size", type=int, default=64 * 1024, help="字典大小（字节）")
+    
+    commands.add_parser("print-sql", help="输出需要在Supabase SQL编辑器中执行的全部脚本")
+    
+    recompress = commands.add_parser("recompress-plans", help="用当前字典重新压缩所有行程")
+    recompress.add_argument("--batch-size", type=int, default=200, help="每批读取的行数")
+    recompress.add_argument("--dry-run", action="store_true", help="只统计压缩效果，不写回数据库")
+    return parser.parse_args()
+
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    args = parse_args()
+    if args.command == "train-plan-dict":
+        sys.exit(0 if asyncio.run(train_plan_dictionary(args.samples, args.dict_size)) else 1)
+    elif args.command == "print-sql":
+        print(SUMMARY_FUNCTIONS_SQL)
+        print(ITINERARY_SQL)
+        print(ROW_VERSION_SQL)
+    elif args.command == "recompress-plans":
+        sys.exit(0 if asyncio.run(recompress_plans(args.batch_size, args.dry_run)) else 1)
+    else:
+        asyncio.run(main())
\ No newline at end of file
@@ -1,21 +1,64 @@
+import hmac
+import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from typing import List
+from fastapi.responses import PlainTextResponse
+from typing import List, Optional
 
 from app.core.config import settings
+from app.core.logging_config import setup_logging, shutdown_logging, set_log_level, get_log_levels, log_sampling
 from app.api.api_v1.api import api_router
 from app.core.supabase_client import get_supabase_client
+from app.core.llm_gateway import llm_gateway
+from app.core.plan_cache import plan_cache
+from app.core.map_client import map_client
+from app.core.geocode_cache import geocode_cache
+from app.core.static_map_cache import static_map_cache
+from app.core.auth import password_executor
+from app.core.metrics import metrics
+from app.core.instrumentation import MetricsMiddleware
+from app.core.responses import FastJSONResponse
+from app.core.plan_codec import plan_codec, PlanCodecError
+from app.schemas.logging import LogLevelUpdate
+
+# 尽早配置日志，导入其他模块时产生的日志也经过队列输出
+setup_logging()
+
+logger = logging.getLogger(__name__)
 
 # 注释掉直接数据库连接，改用Supabase客户端
 # from app.core.database import engine, SessionLocal
 # from app import models
 # models.Base.metadata.create_all(bind=engine)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：启动时检查行程压缩字典、创建地图连接池、清理静态地图缓存；退出时释放数据库、AI调用和密码哈希线程池，关闭本地缓存和连接池"""
+    # 当前字典缺失时拒绝启动（PLAN_ZSTD_DICT_DIR中的字典需要随代码一起部署）
+    plan_codec.check()
+    await map_client.start()
+    if static_map_cache is not None:
+        await static_map_cache.sweep_async()
+    yield
+    await map_client.close()
+    get_supabase_client().shutdown()
+    llm_gateway.shutdown()
+    password_executor.shutdown(wait=False, cancel_futures=True)
+    if plan_cache is not None:
+        plan_cache.close()
+    if geocode_cache is not None:
+        geocode_cache.close()
+    if static_map_cache is not None:
+        static_map_cache.close()
+    shutdown_logging()
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
-    openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    default_response_class=FastJSONResponse,
+    lifespan=lifespan
 )
 
 # 设置CORS
@@ -26,11 +69,25 @@ if settings.BACKEND_CORS_ORIGINS:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "X-Plan-Cache", "ETag", "Last-Modified"],
     )
 
+# 请求级指标（路由耗时、在途请求数、状态码），通过/metrics暴露
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
 # 包含API路由
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+@app.exception_handler(PlanCodecError)
+async def plan_codec_error_handler(request: Request, exc: PlanCodecError):
+    """压缩的行程无法解码（通常是压缩字典没有随代码部署），返回明确的错误而不是未处理的500"""
+    logger.error(f"行程解码失败: {request.method} {request.url.path}: {exc}")
+    return FastJSONResponse(
+        status_code=500,
+        content={"detail": f"行程数据无法解码，请检查PLAN_ZSTD_DICT_DIR中的压缩字典是否已部署（{exc}）"}
+    )
+
 # 暂时注释掉静态文件挂载，因为static目录不存在
 # app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -42,6 +99,35 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Prometheus格式的指标（当前进程）：请求耗时、外部服务调用耗时和失败次数等"""
+    if not settings.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def verify_admin_token(x_admin_token: Optional[str] = Header(None)):
+    """运维接口校验：未配置LOG_ADMIN_TOKEN时接口不可用"""
+    if not settings.LOG_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    # 常量时间比较，避免通过响应时间逐字节猜测令牌（按字节比较：请求头可能含非ASCII字符）
+    if not hmac.compare_digest((x_admin_token or "").encode("utf-8"), settings.LOG_ADMIN_TOKEN.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="无权访问")
+
+@app.get("/logging", include_in_schema=False, dependencies=[Depends(verify_admin_token)])
+async def get_logging():
+    """当前日志级别和会话抽样比例"""
+    return get_log_levels()
+
+@app.put("/logging", include_in_schema=False, dependencies=[Depends(verify_admin_token)])
+async def update_logging(update: LogLevelUpdate):
+    """运行时调整日志级别和会话抽样比例（只对当前进程生效，重启后恢复配置值）"""
+    if update.level:
+        set_log_level(update.logger, update.level)
+    if update.session_sample_rate is not None:
+        log_sampling.rate = update.session_sample_rate
+    return get_log_levels()
+
 # 改进的Supabase连接测试
 @app.get("/test-supabase")
 async def test_supabase():
@@ -52,7 +138,7 @@ async def test_supabase():
         # 使用Supabase的RPC功能或简单的系统表查询
         try:
             # 尝试查询一个系统表（如果存在）
-            response = supabase.table('_tables').select('*').limit(1).execute()
+            response = await supabase.execute(supabase.table('_tables').select('*').limit(1))
             return {"status": "Supabase连接成功", "message": "系统表查询成功", "data": response.data}
         except Exception as table_error:
             # 如果系统表不存在，测试基本的客户端连接